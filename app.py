@@ -2,9 +2,17 @@ import streamlit as st
 import os
 import json
 import tempfile
-from utils import extract_text_from_pdf, extract_text_from_url, prepare_documents
-from generator import generate_research_paper, save_to_markdown, embedding
-from langchain_community.vectorstores import FAISS
+from concurrent.futures import ThreadPoolExecutor
+from catalog import SourceCatalog, catalog_path
+from crawler import crawl_options
+from export import FORMATS, export_paper
+from feeds import feed_options
+from instrumentation import Tracer, start_metrics_server
+from pdf_backends import BACKEND_CHOICES
+from pipeline import CACHE_DIR, MODES, Pipeline
+from profiling import RunProfiler, profile_dir
+from semantic_cache import SemanticCache, cache_path as semantic_cache_path
+from uploads import display_name, save_upload
 import base64
 
 # Page configuration
@@ -57,7 +65,7 @@ def load_sources_from_config(config_file="sources.json"):
                 return json.load(f)
         except Exception as e:
             st.error(f"Error loading sources from {config_file}: {e}")
-    return {"pdfs": [], "urls": [], "topic": "Impact of Climate Change on Agriculture"}
+    return {"pdfs": [], "urls": [], "crawl": [], "feeds": [], "topic": "Impact of Climate Change on Agriculture"}
 
 def save_sources_to_config(sources, config_file="sources.json"):
     """Save sources to a JSON configuration file."""
@@ -69,114 +77,157 @@ def save_sources_to_config(sources, config_file="sources.json"):
         st.error(f"Error saving sources: {e}")
         return False
 
-def process_uploaded_file(uploaded_file):
-    """Process uploaded PDF file and save to documents folder."""
+@st.cache_resource
+def extraction_executor():
+    """Background workers that extract uploaded PDFs as soon as they are saved."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-extract")
+
+def process_uploaded_file(uploaded_file, pdf_backend="auto"):
+    """Stream an uploaded PDF to disk under its content hash and start extracting it in the background."""
     if uploaded_file is not None:
-        # Create documents directory if it doesn't exist
-        os.makedirs("documents", exist_ok=True)
-        
-        # Save uploaded file
-        file_path = os.path.join("documents", uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Streamlit hands back the same uploads on every rerun; only the first sighting is saved
+        saved = st.session_state.setdefault("saved_uploads", {})
+        upload_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+        if upload_key in saved:
+            return saved[upload_key]
         
+        file_path, is_new = save_upload(uploaded_file, uploaded_file.name)
+        if is_new:
+            # Fill the extraction cache now so generation can reuse it
+            pipeline = Pipeline(pdf_backend=pdf_backend, log=lambda level, message: None)
+            extraction_executor().submit(pipeline.ingest, "pdf", file_path)
+        saved[upload_key] = file_path
         return file_path
     return None
 
-def run_research_generation(sources):
+@st.cache_resource
+def start_metrics_endpoint():
+    """Expose Prometheus metrics once per server process when RESEARCH_METRICS_PORT is set."""
+    port = os.getenv("RESEARCH_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_metrics_server(int(port), host=os.getenv("RESEARCH_METRICS_HOST", "127.0.0.1"))
+    except Exception as e:
+        st.warning(f"Could not start metrics endpoint on port {port}: {e}")
+        return None
+
+def show_timing_breakdown(tracer):
+    """Render the per-stage timing breakdown of a run."""
+    rows = tracer.breakdown()
+    if not rows:
+        return
+    st.subheader("⏱️ Timing Breakdown")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+    for cache, ratio in tracer.cache_hit_ratios().items():
+        st.caption(f"Cache {cache}: {ratio * 100:.0f}% hit rate")
+
+def show_profile(profiler, output_file):
+    """Write the run's profile next to the paper and render the hottest functions per stage."""
+    directory = profile_dir(output_file)
+    try:
+        profiler.write(directory)
+    except Exception as e:
+        st.error(f"❌ Error writing profile to {directory}: {e}")
+        return
+    with st.expander("🔬 Profile"):
+        st.dataframe(profiler.summary(), use_container_width=True, hide_index=True)
+        st.caption(f"Written to {directory}/: all.pstats and one .pstats per stage, stacks.collapsed, allocations.txt")
+        with open(os.path.join(directory, "allocations.txt"), "r", encoding="utf-8") as f:
+            st.code(f.read())
+
+def show_source_catalog():
+    """Render what has been ingested from the source catalog, without reading the sources themselves."""
+    rows = SourceCatalog(catalog_path(CACHE_DIR)).all()
+    if not rows:
+        st.info("Nothing ingested yet.")
+        return
+    st.dataframe([
+        {
+            "Source": display_name(row["location"]) if row["kind"] == "pdf" else row["location"],
+            "Status": row["status"],
+            "Size (KB)": round(row["size_bytes"] / 1024, 1) if row["size_bytes"] else None,
+            "Backend": row["backend"],
+            "Extract (s)": row["extract_seconds"],
+            "Characters": row["chars"],
+            "Chunks": row["chunks"],
+            "Last Ingested": row["last_ingested"],
+            "Last Changed": row["last_changed"],
+        }
+        for row in rows
+    ], use_container_width=True, hide_index=True)
+
+def run_research_generation(sources, mode="standard", force=False, pdf_backend="auto", summarize=False,
+                            semantic_cache=True, deadline=None, profile=False):
     """Run the research generation process."""
     st.info("🚀 Starting Research Assistant AI...")
     st.write(f"📝 Topic: {sources['topic']}")
     
-    all_text = ""
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    # Process PDFs
-    total_sources = len(sources['pdfs']) + len(sources['urls'])
-    current_progress = 0
+    def log(level, message):
+        if level == "success":
+            st.success(message)
+        elif level == "error":
+            st.error(message)
+        elif level == "warning":
+            st.warning(message)
+        else:
+            status_text.text(message)
     
-    for pdf_path in sources['pdfs']:
-        status_text.text(f"📄 Processing PDF: {pdf_path}")
-        try:
-            if os.path.exists(pdf_path):
-                pdf_text = extract_text_from_pdf(pdf_path)
-                if pdf_text:
-                    all_text += pdf_text + "\n\n"
-                    st.success(f"✅ PDF processed successfully. Extracted {len(pdf_text)} characters.")
-                else:
-                    st.error(f"❌ No text extracted from PDF: {pdf_path}")
-            else:
-                st.error(f"❌ PDF file not found: {pdf_path}")
-        except Exception as e:
-            st.error(f"❌ Error processing PDF {pdf_path}: {e}")
-        
-        current_progress += 1
-        progress_bar.progress(current_progress / total_sources)
-
-    # Process URLs
-    for url in sources['urls']:
-        status_text.text(f"🌐 Processing website: {url}")
-        try:
-            website_text = extract_text_from_url(url)
-            if website_text:
-                all_text += website_text + "\n\n"
-                st.success(f"✅ Website processed successfully. Extracted {len(website_text)} characters.")
-            else:
-                st.error(f"❌ No text extracted from URL: {url}")
-        except Exception as e:
-            st.error(f"❌ Error processing website {url}: {e}")
-        
-        current_progress += 1
-        progress_bar.progress(current_progress / total_sources)
-
-    if not all_text.strip():
-        st.error("❌ No text extracted from sources. Please check your inputs.")
-        return None
-
-    st.info(f"📊 Total text extracted: {len(all_text)} characters")
+    def progress(fraction, message):
+        progress_bar.progress(fraction)
     
-    status_text.text("🔧 Preparing documents...")
-    try:
-        docs = prepare_documents(all_text)
-        st.success(f"✅ Documents prepared. Created {len(docs)} document chunks.")
-    except Exception as e:
-        st.error(f"❌ Error preparing documents: {e}")
+    tracer = Tracer(profiler=RunProfiler() if profile else None)
+    with tracer.activate():
+        pipeline = Pipeline(mode=mode, force=force, log=log, progress=progress, pdf_backend=pdf_backend,
+                            summarize=summarize, semantic_cache=semantic_cache, deadline=deadline)
+        result = pipeline.run(sources)
+    tracer.write_jsonl()
+    show_timing_breakdown(tracer)
+    if profile:
+        show_profile(tracer.profiler, pipeline.output_file)
+    
+    if result.degraded:
+        with st.expander(f"⏱️ Dropped to meet the time budget ({len(result.degraded)})"):
+            st.dataframe([
+                {"Action": entry["action"], "Item": entry["item"], "Reason": entry["reason"], "At (s)": entry["at"]}
+                for entry in result.degraded
+            ], use_container_width=True, hide_index=True)
+    
+    paper = result.paper
+    if not paper:
         return None
+    
+    # Display paper preview
+    st.subheader("📄 Research Paper Preview")
+    st.text_area("Paper Content (first 1000 characters):", paper[:1000] + "..." if len(paper) > 1000 else paper, height=300)
+    
+    # Kept in the session so the download options survive reruns
+    st.session_state.paper = paper
+    return paper
 
-    status_text.text("🗄️ Creating vector database...")
+def show_downloads(paper):
+    """Offer the paper for download in the chosen format, rendering it only when that format is picked."""
+    st.subheader("📥 Download")
+    fmt = st.radio("Format", options=list(FORMATS), format_func=lambda f: FORMATS[f]["label"], horizontal=True)
     try:
-        db = FAISS.from_documents(docs, embedding)
-        st.success("✅ Vector database created successfully.")
+        path = export_paper(paper, fmt)
     except Exception as e:
-        st.error(f"❌ Error creating vector database: {e}")
-        return None
-
-    status_text.text("📝 Generating research paper...")
-    try:
-        joined_text = " ".join([doc.page_content for doc in docs])
-        paper = generate_research_paper(joined_text, sources['topic'])
-        save_to_markdown(paper)
-        st.success("✅ Research paper saved as research_paper.md")
-        
-        # Display paper preview
-        st.subheader("📄 Research Paper Preview")
-        st.text_area("Paper Content (first 1000 characters):", paper[:1000] + "..." if len(paper) > 1000 else paper, height=300)
-        
-        # Download button for the full paper
+        st.error(f"❌ Error exporting {FORMATS[fmt]['label']}: {e}")
+        return
+    with open(path, "rb") as f:
         st.download_button(
-            label="📥 Download Research Paper (MD)",
-            data=paper,
-            file_name="research_paper.md",
-            mime="text/markdown"
+            label=f"📥 Download Research Paper ({FORMATS[fmt]['label']})",
+            data=f.read(),
+            file_name="research_paper" + FORMATS[fmt]["extension"],
+            mime=FORMATS[fmt]["mime"]
         )
-        
-        return paper
-    except Exception as e:
-        st.error(f"❌ Error generating research paper: {e}")
-        return None
 
 def main():
+    start_metrics_endpoint()
+
     # Header
     st.markdown('<h1 class="main-header">🔬 Research Assistant AI</h1>', unsafe_allow_html=True)
     
@@ -194,6 +245,44 @@ def main():
             help="Enter the main topic for your research paper"
         )
         
+        # Generation mode
+        mode = st.selectbox(
+            "Generation Mode",
+            options=list(MODES),
+            format_func=lambda m: MODES[m]["label"] or "Standard",
+            help="Standard uses vector retrieval; Simple skips embeddings; Enhanced writes a longer, more rigorous paper"
+        )
+        force = st.checkbox(
+            "Recompute all stages",
+            help="Ignore cached extraction, embeddings and papers from earlier runs"
+        )
+        pdf_backend = st.selectbox(
+            "PDF Extraction",
+            options=BACKEND_CHOICES,
+            help="Auto uses a fast extractor for each PDF whose text matches pdfplumber's on a sample of pages"
+        )
+        semantic_cache = st.checkbox(
+            "Reuse results for similar topics",
+            value=True,
+            help="Reuse the retrieval or paper of an earlier topic that is a close rephrasing of this one"
+        )
+        summarize = st.checkbox(
+            "Summarize whole corpus",
+            help="Condense every source into a digest with parallel, cached LLM calls instead of retrieving a few chunks"
+        )
+        time_budget = st.number_input(
+            "Time budget (seconds)",
+            min_value=0,
+            value=0,
+            step=15,
+            help="Answer within this many seconds by skipping slow sources and cutting retrieval or generation down; 0 means no limit"
+        )
+        profile = st.checkbox(
+            "Profile this run",
+            help="Profile each stage's CPU time and Python allocations and save .pstats and collapsed-stack files "
+                 "next to research_paper.md; the run is slower while profiled"
+        )
+        
         st.divider()
         
         # File upload section
@@ -208,7 +297,7 @@ def main():
         # Process uploaded files
         if uploaded_files:
             for uploaded_file in uploaded_files:
-                file_path = process_uploaded_file(uploaded_file)
+                file_path = process_uploaded_file(uploaded_file, pdf_backend)
                 if file_path and file_path not in sources['pdfs']:
                     sources['pdfs'].append(file_path)
         
@@ -230,6 +319,49 @@ def main():
                 else:
                     st.warning("URL already exists in sources.")
         
+        # Crawl section
+        st.subheader("🕸️ Crawl a Website")
+        crawl_url = st.text_input(
+            "Start URL",
+            placeholder="https://example.com/docs/",
+            help="Follow links on the same site starting from this page"
+        )
+        crawl_depth = st.number_input("Link depth", min_value=0, max_value=10, value=2)
+        crawl_pages = st.number_input("Maximum pages", min_value=1, max_value=1000, value=50)
+        
+        if crawl_url and crawl_url.startswith(("http://", "https://")):
+            if st.button("Add Crawl"):
+                crawls = sources.setdefault('crawl', [])
+                if all(crawl_options(spec)["start_url"] != crawl_url for spec in crawls):
+                    crawls.append({"url": crawl_url, "max_depth": int(crawl_depth), "max_pages": int(crawl_pages)})
+                    st.success(f"✅ Added crawl: {crawl_url}")
+                else:
+                    st.warning("This site is already being crawled.")
+        
+        # Sitemap and feed section
+        st.subheader("📰 Add Sitemap or Feed")
+        feed_url = st.text_input(
+            "Sitemap, RSS or Atom URL",
+            placeholder="https://example.com/sitemap.xml",
+            help="Every page listed is added; only pages updated since the last run are fetched again"
+        )
+        feed_include = st.text_input("Only URLs matching (regex)", placeholder="/reports/")
+        feed_since = st.date_input("Only pages modified since", value=None)
+        
+        if feed_url and feed_url.startswith(("http://", "https://")):
+            if st.button("Add Feed"):
+                feeds = sources.setdefault('feeds', [])
+                if all(feed_options(spec)["url"] != feed_url for spec in feeds):
+                    feed = {"url": feed_url}
+                    if feed_include:
+                        feed["include"] = feed_include
+                    if feed_since:
+                        feed["since"] = feed_since.isoformat()
+                    feeds.append(feed)
+                    st.success(f"✅ Added feed: {feed_url}")
+                else:
+                    st.warning("Feed already exists in sources.")
+        
         # Display current sources
         st.divider()
         st.subheader("📋 Current Sources")
@@ -237,16 +369,30 @@ def main():
         if sources['pdfs']:
             st.write("**PDF Documents:**")
             for pdf in sources['pdfs']:
-                st.write(f"• {pdf}")
+                st.write(f"• {display_name(pdf)}")
         
         if sources['urls']:
             st.write("**Website URLs:**")
             for url in sources['urls']:
                 st.write(f"• {url}")
         
-        if not sources['pdfs'] and not sources['urls']:
+        if sources.get('crawl'):
+            st.write("**Crawled Sites:**")
+            for spec in sources['crawl']:
+                options = crawl_options(spec)
+                st.write(f"• {options['start_url']} (depth {options['max_depth']}, up to {options['max_pages']} pages)")
+        
+        if sources.get('feeds'):
+            st.write("**Sitemaps and Feeds:**")
+            for spec in sources['feeds']:
+                st.write(f"• {feed_options(spec)['url']}")
+        
+        if not sources['pdfs'] and not sources['urls'] and not sources.get('crawl') and not sources.get('feeds'):
             st.info("No sources added yet.")
         
+        with st.expander("📚 Source Catalog"):
+            show_source_catalog()
+        
         # Save configuration
         if st.button("💾 Save Configuration"):
             sources['topic'] = topic
@@ -259,30 +405,53 @@ def main():
     with col1:
         st.header("📝 Research Paper Generator")
         
-        if sources['pdfs'] or sources['urls']:
+        if sources['pdfs'] or sources['urls'] or sources.get('crawl') or sources.get('feeds'):
             st.info(f"Ready to generate research paper on: **{topic}**")
-            st.write(f"Sources: {len(sources['pdfs'])} PDF(s), {len(sources['urls'])} URL(s)")
+            st.write(f"Sources: {len(sources['pdfs'])} PDF(s), {len(sources['urls'])} URL(s), "
+                     f"{len(sources.get('crawl', []))} crawled site(s), {len(sources.get('feeds', []))} feed(s)")
             
             if st.button("🚀 Generate Research Paper", type="primary"):
                 sources['topic'] = topic
-                paper = run_research_generation(sources)
+                paper = run_research_generation(sources, mode=mode, force=force, pdf_backend=pdf_backend,
+                                                summarize=summarize, semantic_cache=semantic_cache,
+                                                deadline=time_budget or None, profile=profile)
                 
                 if paper:
                     st.balloons()
                     st.success("🎉 Research paper generated successfully!")
         else:
             st.warning("⚠️ Please add at least one source (PDF or URL) to generate a research paper.")
+        
+        if st.session_state.get("paper"):
+            show_downloads(st.session_state.paper)
     
     with col2:
         st.header("📊 Statistics")
         
-        if sources['pdfs'] or sources['urls']:
+        if sources['pdfs'] or sources['urls'] or sources.get('crawl') or sources.get('feeds'):
             st.metric("PDF Documents", len(sources['pdfs']))
             st.metric("Website URLs", len(sources['urls']))
-            st.metric("Total Sources", len(sources['pdfs']) + len(sources['urls']))
+            st.metric("Crawled Sites", len(sources.get('crawl', [])))
+            st.metric("Feeds", len(sources.get('feeds', [])))
+            st.metric("Total Sources", len(sources['pdfs']) + len(sources['urls']) + len(sources.get('crawl', []))
+                      + len(sources.get('feeds', [])))
         else:
             st.info("No sources added yet.")
         
+        totals = SourceCatalog(catalog_path(CACHE_DIR)).totals()
+        if totals["sources"]:
+            st.metric("Ingested Pages and Files", totals["sources"])
+            st.metric("Indexed Chunks", f"{totals['chunks']:,}")
+            st.metric("Extracted Characters", f"{totals['chars']:,}")
+        
+        semantic = SemanticCache(semantic_cache_path(CACHE_DIR)).stats()
+        if semantic:
+            lookups = sum(kind["lookups"] for kind in semantic.values())
+            hits = sum(kind["hits"] for kind in semantic.values())
+            st.metric("Similar-Topic Cache Hit Rate", f"{hits / lookups:.0%}" if lookups else "–",
+                      help=", ".join(f"{name}: {kind['hits']}/{kind['lookups']} hits, {kind['entries']} entries"
+                                     for name, kind in semantic.items()))
+        
         st.divider()
         
         # Quick actions
@@ -291,6 +460,8 @@ def main():
         if st.button("🗑️ Clear All Sources"):
             sources['pdfs'] = []
             sources['urls'] = []
+            sources['crawl'] = []
+            sources['feeds'] = []
             save_sources_to_config(sources)
             st.success("✅ All sources cleared!")
             st.rerun()
@@ -0,0 +1,817 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Research Assistant AI
+Times each pipeline stage on a synthetic corpus, records throughput and peak
+memory to a JSON history and flags regressions against a stored baseline.
+
+Usage:
+    python benchmark.py pipeline --mode simple --pdfs 4 --pages 20
+    python benchmark.py pipeline --mode simple --save-baseline
+    python benchmark.py pdf-backends --pdfs 4 --pages 20
+    python benchmark.py crawl --site-pages 40 --latency 0.02
+    python benchmark.py splitter --chars 5000000
+    python benchmark.py startup --budget-ms 300
+    python benchmark.py load --sessions 1,2,4,8,16 --llm-latency 0.5
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from instrumentation import peak_rss_bytes
+
+HISTORY_FILE = "benchmark_history.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+def load_generator(mode):
+    """Import the generator module for a mode without requiring a real API key."""
+    from pipeline import load_generator as import_generator
+    # Benchmarks never call the LLM, so a placeholder key is enough to import the module
+    os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark-placeholder")
+    try:
+        return import_generator(mode)
+    except SystemExit:
+        raise RuntimeError(f"Generator for mode '{mode}' failed to initialise")
+
+def time_stage(results, name, func, items=None, size_bytes=None, repeat=1):
+    """Run func repeat times, keep the fastest run and record it under name."""
+    best = None
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    count = items(value) if callable(items) else items
+    size = size_bytes(value) if callable(size_bytes) else size_bytes
+    stage = {"seconds": round(best, 6), "peak_rss_bytes": peak_rss_bytes()}
+    if count is not None:
+        stage["items"] = count
+        stage["items_per_second"] = round(count / best, 3) if best > 0 else None
+    if size is not None:
+        stage["bytes"] = size
+        stage["mb_per_second"] = round(size / best / 1e6, 3) if best > 0 else None
+    results[name] = stage
+
+    rate = f", {stage['items_per_second']} items/s" if count is not None else ""
+    print(f"⏱️  {name:<16} {best:9.4f}s{rate}")
+    return value
+
+def run_pipeline_benchmark(args):
+    """Benchmark extraction, splitting, embedding, index build, retrieval and prompt assembly."""
+    from fixtures import build_corpus, start_fixture_server
+    from utils import extract_text_from_pdf, extract_text_from_url, prepare_documents
+    from langchain_community.vectorstores import FAISS
+
+    generator = load_generator(args.mode)
+    workdir = tempfile.mkdtemp(prefix="ra-bench-")
+    server = None
+    stages = {}
+    try:
+        print(f"🧪 Building synthetic corpus in {workdir}...")
+        corpus = build_corpus(
+            workdir,
+            num_pdfs=args.pdfs,
+            pages_per_pdf=args.pages,
+            chars_per_page=args.chars_per_page,
+            num_html=args.html,
+            html_chars=args.html_chars,
+            seed=args.seed,
+        )
+        server, base_url = start_fixture_server(workdir)
+        urls = [base_url + page for page in corpus["pages"]]
+        pdf_bytes = sum(os.path.getsize(path) for path in corpus["pdfs"])
+        html_bytes = sum(os.path.getsize(os.path.join(workdir, page)) for page in corpus["pages"])
+
+        pdf_texts = time_stage(
+            stages, "extract_pdf",
+            lambda: [extract_text_from_pdf(path) for path in corpus["pdfs"]],
+            items=args.pdfs * args.pages, size_bytes=pdf_bytes, repeat=args.repeat,
+        )
+        url_texts = time_stage(
+            stages, "extract_html",
+            lambda: [extract_text_from_url(url) for url in urls],
+            items=len(urls), size_bytes=html_bytes, repeat=args.repeat,
+        )
+        all_text = "".join(text + "\n\n" for text in pdf_texts + url_texts if text)
+
+        docs = time_stage(
+            stages, "split",
+            lambda: prepare_documents(all_text),
+            items=len, size_bytes=len(all_text.encode("utf-8")), repeat=args.repeat,
+        )
+        texts = [doc.page_content for doc in docs]
+
+        vectors = time_stage(
+            stages, "embed",
+            lambda: generator.embedding.embed_documents(texts),
+            items=len(texts), repeat=args.repeat,
+        )
+        db = time_stage(
+            stages, "index_build",
+            lambda: FAISS.from_embeddings(list(zip(texts, vectors)), generator.embedding),
+            items=len(texts), repeat=args.repeat,
+        )
+
+        queries = [args.topic] * args.queries
+        retrieved = time_stage(
+            stages, "retrieve",
+            lambda: [db.similarity_search(query, k=args.k) for query in queries],
+            items=len(queries), repeat=args.repeat,
+        )
+        context = " ".join(doc.page_content for doc in retrieved[0]) if retrieved else ""
+        time_stage(
+            stages, "prompt_assembly",
+            lambda: [generator.build_prompt(context, args.topic) for _ in range(args.queries)],
+            items=args.queries, repeat=args.repeat,
+        )
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return stages
+
+# Options that control recording and comparison rather than the workload itself
+_REPORTING_OPTIONS = {
+    "func", "repeat", "history", "baseline", "save_baseline", "tolerance", "min_delta", "memory_tolerance",
+}
+
+def _memory_probe(urls, mode, bounded, batch_size, max_rss_mb):
+    """Run the pipeline up to retrieval in a fresh process and report its peak RSS."""
+    os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark-placeholder")
+    from pipeline import Pipeline
+    import_peak = peak_rss_bytes()
+    cache_dir = tempfile.mkdtemp(prefix="ra-bench-cache-")
+    try:
+        pipeline = Pipeline(mode=mode, cache_dir=cache_dir, bounded=bounded, max_rss_mb=max_rss_mb,
+                            batch_size=batch_size, log=lambda level, message: None)
+        start = time.perf_counter()
+        result = pipeline.run({"topic": "Impact of Climate Change on Agriculture", "pdfs": [], "urls": urls},
+                              generate=False)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {
+        "seconds": round(seconds, 6),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "import_peak_rss_bytes": import_peak,
+        "items": len(result.sources_ok),
+    }
+
+def run_memory_benchmark(args):
+    """Check that bounded mode keeps peak RSS flat as the corpus grows."""
+    import multiprocessing
+    from fixtures import synthetic_html, start_fixture_server
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    workdir = tempfile.mkdtemp(prefix="ra-bench-")
+    server = None
+    stages = {}
+    try:
+        print(f"🧪 Writing {sizes[-1]} synthetic pages of {args.page_chars} characters to {workdir}...")
+        pages = []
+        for i in range(sizes[-1]):
+            name = f"page-{i}.html"
+            with open(os.path.join(workdir, name), "w", encoding="utf-8") as f:
+                f.write(synthetic_html(args.page_chars, seed=args.seed + i, title=f"Synthetic page {i}"))
+            pages.append(name)
+        server, base_url = start_fixture_server(workdir)
+
+        # Every measurement runs in a fresh process so each peak RSS belongs to one corpus size
+        context = multiprocessing.get_context("spawn")
+        variants = [True, False] if args.compare_unbounded else [True]
+        for bounded in variants:
+            for size in sizes:
+                urls = [base_url + page for page in pages[:size]]
+                with context.Pool(1) as pool:
+                    stage = pool.apply(_memory_probe, (urls, args.mode, bounded, args.batch_size, args.max_rss_mb))
+                stage["bytes"] = size * args.page_chars
+                name = f"{'bounded' if bounded else 'unbounded'}_{size}_pages"
+                stages[name] = stage
+                print(f"📦 {name:<22} {stage['bytes'] / 1e6:7.1f} MB text  "
+                      f"peak RSS {stage['peak_rss_bytes'] / 1e6:7.1f} MB  {stage['seconds']:.2f}s")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    smallest = stages[f"bounded_{sizes[0]}_pages"]["peak_rss_bytes"]
+    largest = stages[f"bounded_{sizes[-1]}_pages"]["peak_rss_bytes"]
+    growth = largest / smallest - 1
+    corpus_growth = sizes[-1] / sizes[0]
+    print(f"📈 Bounded peak RSS grew {growth * 100:.1f}% while the corpus grew {corpus_growth:.0f}x")
+    if growth > args.flat_tolerance:
+        args.check_failures = [
+            f"bounded peak RSS grew {growth * 100:.1f}%, above the {args.flat_tolerance * 100:.0f}% flatness tolerance"
+        ]
+    return stages
+
+def run_pdf_backend_benchmark(args):
+    """Compare pages per second and text fidelity (against pdfplumber) of every installed PDF backend."""
+    from fixtures import write_synthetic_pdf
+    from pdf_backends import BACKENDS, SAMPLE_PAGES, choose_backend, fast_backend, text_similarity
+
+    workdir = tempfile.mkdtemp(prefix="ra-bench-")
+    stages = {}
+    failures = []
+    try:
+        paths = []
+        for i in range(args.pdfs):
+            path = os.path.join(workdir, f"synthetic-{i}.pdf")
+            write_synthetic_pdf(path, pages=args.pages, chars_per_page=args.chars_per_page, seed=args.seed + i)
+            paths.append(path)
+        pdf_bytes = sum(os.path.getsize(path) for path in paths)
+        pages = args.pdfs * args.pages
+
+        def extract_all(backend):
+            return ["\n".join(backend.iter_pages(path)) for path in paths]
+
+        reference = None
+        for name, backend in BACKENDS.items():
+            if not backend.available():
+                print(f"⏭️  {name} is not installed, skipping")
+                continue
+            texts = time_stage(stages, name, lambda: extract_all(backend),
+                               items=pages, size_bytes=pdf_bytes, repeat=args.repeat)
+            reference = texts if name == "pdfplumber" else reference
+            similarity = min(text_similarity(ref, text) for ref, text in zip(reference, texts))
+            stages[name]["similarity"] = round(similarity, 4)
+            print(f"🎯 {name:<16} word-level similarity to pdfplumber: {similarity:.4f}")
+            if similarity < args.min_similarity:
+                failures.append(f"{name}: similarity {similarity:.4f} is below {args.min_similarity}")
+
+        def extract_auto():
+            return [(backend.name, "\n".join(backend.iter_pages(path)))
+                    for path, (backend, _) in ((path, choose_backend(path)) for path in paths)]
+
+        chosen = time_stage(stages, "auto", extract_auto, items=pages, size_bytes=pdf_bytes, repeat=args.repeat)
+        stages["auto"]["backends"] = sorted({name for name, _ in chosen})
+        print(f"🤖 auto chose: {', '.join(stages['auto']['backends'])}")
+        if args.pages > SAMPLE_PAGES and fast_backend() and "pdfplumber" in stages["auto"]["backends"]:
+            failures.append("auto: kept pdfplumber for plain-text PDFs that a fast backend reads identically")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    args.check_failures = failures
+    return stages
+
+def run_crawl_benchmark(args):
+    """Crawl a synthetic site sequentially and concurrently, and check every page is fetched exactly once."""
+    from crawler import crawl_options, iter_crawl
+    from fixtures import build_site, start_fixture_server
+
+    workdir = tempfile.mkdtemp(prefix="ra-bench-")
+    server = None
+    stages = {}
+    failures = []
+    try:
+        pages = build_site(workdir, num_pages=args.site_pages, html_chars=args.html_chars, seed=args.seed)
+        server, base_url = start_fixture_server(workdir, latency=args.latency)
+        expected = {base_url + page for page in pages}
+        html_bytes = sum(os.path.getsize(os.path.join(workdir, page)) for page in pages)
+
+        for name, concurrency in (("crawl_sequential", 1), ("crawl_concurrent", args.concurrency)):
+            options = crawl_options({"url": base_url + "index.html", "max_depth": args.site_pages,
+                                     "max_pages": args.site_pages, "per_host": concurrency,
+                                     "concurrency": concurrency})
+            urls = time_stage(stages, name, lambda: [page.url for page in iter_crawl(**options)],
+                              items=len, size_bytes=html_bytes, repeat=args.repeat)
+            if len(urls) != len(set(urls)):
+                failures.append(f"{name}: {len(urls) - len(set(urls))} pages were fetched more than once")
+            if set(urls) != expected:
+                failures.append(f"{name}: reached {len(set(urls) & expected)}/{len(expected)} pages, "
+                                f"{len(set(urls) - expected)} unexpected (robots.txt or canonicalization)")
+
+        speedup = stages["crawl_sequential"]["seconds"] / stages["crawl_concurrent"]["seconds"]
+        print(f"📈 Concurrent crawl was {speedup:.1f}x faster than sequential")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    args.check_failures = failures
+    return stages
+
+def splitter_samples(chars, seed=0):
+    """Texts shaped like each kind of source: PDF paragraphs, wrapped lines, flattened HTML and unbroken tokens."""
+    from fixtures import _wrap_lines, synthetic_text
+    paragraphs = synthetic_text(chars, seed=seed)
+    return {
+        "paragraphs": paragraphs,
+        "lines": "\n".join(_wrap_lines(paragraphs)),
+        "html_text": " ".join(paragraphs.split()),
+        "long_tokens": "".join(word * 40 if i % 7 == 0 else word + " " for i, word in enumerate(paragraphs.split())),
+    }
+
+def run_splitter_benchmark(args):
+    """Check the offset splitter returns exactly LangChain's chunks and compare their throughput in MB/s."""
+    from utils import OffsetTextSplitter, make_langchain_text_splitter
+
+    stages = {}
+    failures = []
+    offset_splitter = OffsetTextSplitter()
+    langchain_splitter = make_langchain_text_splitter()
+    for name, text in splitter_samples(args.chars, args.seed).items():
+        size = len(text.encode("utf-8"))
+        expected = time_stage(stages, f"langchain_{name}", lambda: langchain_splitter.split_text(text),
+                              items=len, size_bytes=size, repeat=args.repeat)
+        offsets = time_stage(stages, f"offsets_{name}", lambda: offset_splitter.split_offsets(text),
+                             items=len, size_bytes=size, repeat=args.repeat)
+        chunks = [text[start:end] for start, end in offsets]
+        if chunks != expected:
+            first = next((i for i, (a, b) in enumerate(zip(chunks, expected)) if a != b), min(len(chunks), len(expected)))
+            failures.append(f"{name}: offset splitter differs from LangChain at chunk {first} "
+                            f"({len(chunks)} vs {len(expected)} chunks)")
+        speedup = stages[f"langchain_{name}"]["seconds"] / stages[f"offsets_{name}"]["seconds"]
+        print(f"📈 {name}: {stages[f'offsets_{name}']['mb_per_second']} MB/s vs "
+              f"{stages[f'langchain_{name}']['mb_per_second']} MB/s ({speedup:.1f}x), "
+              f"{'identical' if chunks == expected else 'DIFFERENT'} chunks")
+    args.check_failures = failures
+    return stages
+
+def packing_candidates(count, dims, clusters, sources, seed=0):
+    """Candidate vectors shaped like retrieval results: clusters of near-duplicate chunks, spread over sources.
+
+    Returns (query, vectors, cluster of each vector, source of each vector).
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+
+    def unit(rows):
+        return rows / np.linalg.norm(rows, axis=-1, keepdims=True)
+
+    query = unit(rng.standard_normal(dims)).astype(np.float32)
+    # Unit cluster centres at cosine similarities of 0.3-0.7 to the query, like paragraphs more or less on topic
+    similarity = rng.uniform(0.3, 0.7, clusters)[:, None]
+    off_topic = unit(rng.standard_normal((clusters, dims)))
+    off_topic = unit(off_topic - (off_topic @ query)[:, None] * query)
+    centres = similarity * query + np.sqrt(1.0 - similarity ** 2) * off_topic
+    cluster_of = rng.integers(0, clusters, count)
+    # Members of a cluster are near-duplicates of each other (cosine similarity about 0.99)
+    vectors = (centres[cluster_of] + 0.1 * rng.standard_normal((count, dims)) / np.sqrt(dims)).astype(np.float32)
+    # Most clusters come from one source, as repeated text usually does
+    source_of = np.where(rng.random(count) < 0.9, cluster_of % sources, rng.integers(0, sources, count))
+    return query, vectors, cluster_of, source_of
+
+def run_packing_benchmark(args):
+    """Time MMR context packing over the candidate set, check it against LangChain's MMR and report diversity."""
+    import numpy as np
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+    from packing import mmr_select
+
+    query, vectors, cluster_of, source_of = packing_candidates(args.candidates, args.dims, args.clusters,
+                                                               args.sources, args.seed)
+    ranking = np.argsort(-(vectors @ query / np.linalg.norm(vectors, axis=1)))
+    stages = {}
+    failures = []
+    for k in [int(k) for k in args.k.split(",")]:
+        picked = time_stage(stages, f"mmr_k{k}", lambda: mmr_select(query, vectors, k, args.mmr_lambda),
+                            items=k, repeat=args.repeat)
+        capped = time_stage(stages, f"mmr_k{k}_capped",
+                            lambda: mmr_select(query, vectors, k, args.mmr_lambda, source_of, args.per_source_cap),
+                            items=k, repeat=args.repeat)
+        reference = time_stage(stages, f"langchain_mmr_k{k}",
+                               lambda: maximal_marginal_relevance(query, vectors, args.mmr_lambda, k),
+                               items=k, repeat=1)
+        if picked != reference:
+            first = next((i for i, (a, b) in enumerate(zip(picked, reference)) if a != b), min(len(picked), len(reference)))
+            failures.append(f"k={k}: MMR selection differs from LangChain's at pick {first}")
+        if max(np.bincount(source_of[capped])) > args.per_source_cap:
+            failures.append(f"k={k}: more than {args.per_source_cap} chunks picked from one source")
+        seconds = stages[f"mmr_k{k}"]["seconds"]
+        if seconds * 1000 > args.budget_ms:
+            failures.append(f"k={k}: selection took {seconds * 1000:.1f} ms, over the {args.budget_ms:g} ms budget")
+        print(f"📈 k={k}: {seconds * 1000:.2f} ms vs {stages[f'langchain_mmr_k{k}']['seconds'] * 1000:.1f} ms for LangChain; "
+              f"distinct clusters {len(set(cluster_of[ranking[:k]]))} by similarity, {len(set(cluster_of[picked]))} by MMR, "
+              f"{len(set(cluster_of[capped]))} with at most {args.per_source_cap} per source")
+    args.check_failures = failures
+    return stages
+
+# Modules the CLI entry points import at startup and must not pull in the heavy stacks
+STARTUP_ENTRY_POINTS = ("main", "main_simple", "main_enhanced")
+
+# Imported only where they are used, e.g. bs4 when a page is parsed or numpy for a semantic cache lookup
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "openai", "httpx",
+                 "requests", "bs4", "pdfplumber", "pypdfium2", "fitz", "numpy", "faiss", "torch",
+                 "sentence_transformers", "markdown2", "docx")
+
+def import_profile(statement):
+    """Run statement in a fresh interpreter under -X importtime. Returns {module: cumulative microseconds}."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=here,
+                               capture_output=True, text=True, check=True)
+    profile = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                profile.setdefault(name.strip(), int(cumulative))
+    return profile
+
+def run_startup_benchmark(args):
+    """Measure the import time of each CLI entry point and check it stays within budget without the heavy stacks."""
+    stages = {}
+    failures = []
+    # Modules the interpreter itself imports at startup (site hooks etc.) are not the entry points' doing
+    preloaded = set(import_profile("pass"))
+    for entry in STARTUP_ENTRY_POINTS:
+        profiles = [import_profile(f"import {entry}") for _ in range(args.repeat)]
+        seconds = min(profile[entry] for profile in profiles) / 1e6
+        stages[f"import_{entry}"] = {"seconds": round(seconds, 6)}
+        imported = set(profiles[0]) - preloaded
+        heavy = sorted({name.split(".")[0] for name in imported} & set(HEAVY_MODULES))
+        slowest = sorted(((profiles[0][name], name) for name in imported if name != entry and "." not in name),
+                         reverse=True)[:args.top]
+        print(f"⏱️  import {entry:<14} {seconds * 1000:8.1f} ms, {len(imported)} modules")
+        print(f"    slowest: {', '.join(f'{name} {micros / 1000:.1f} ms' for micros, name in slowest)}")
+        if heavy:
+            failures.append(f"import {entry} pulls in {', '.join(heavy)} at startup")
+        if seconds * 1000 > args.budget_ms:
+            failures.append(f"import {entry} took {seconds * 1000:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    time_stage(stages, "main_help", lambda: subprocess.run([sys.executable, "main.py", "--help"], cwd=here,
+                                                           capture_output=True, check=True),
+               repeat=args.repeat)
+    args.check_failures = failures
+    return stages
+
+def percentile(values, q):
+    """Nearest-rank percentile q (0-100) of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def latency_summary(values):
+    return {f"p{q}": round(percentile(values, q), 4) for q in (50, 95, 99)}
+
+def _load_level(session_sources, warmup_sources, mode, llm_latency, llm_rpm, workdir):
+    """Run one generation session per entry of session_sources at once, in a fresh process like one app.py host.
+
+    Sessions are threads sharing one cache directory. A warm-up session with its own
+    sources and cache runs first, so lazy imports are not counted as session memory.
+    The client-side rate limit is llm_rpm requests per minute (0 for none) and no
+    token limit, so by default the sessions only contend for the host.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import redirect_stdout
+    os.environ["RESEARCH_FAKE_LLM"] = "1"
+    os.environ["RESEARCH_FAKE_LLM_LATENCY"] = str(llm_latency)
+    os.environ["RESEARCH_LLM_RPM"] = str(llm_rpm)
+    os.environ.pop("RESEARCH_LLM_TPM", None)
+    os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark-placeholder")
+    from instrumentation import Tracer, current_rss_bytes
+    from pipeline import Pipeline
+
+    def session(index, sources, cache_dir, barrier=None):
+        tracer = Tracer(registry=None)
+        pipeline = Pipeline(mode=mode, cache_dir=cache_dir, semantic_cache=False,
+                            output_file=os.path.join(workdir, f"paper-{index}.md"), log=lambda level, message: None)
+        if barrier is not None:
+            barrier.wait()
+        start = time.perf_counter()
+        try:
+            with tracer.activate():
+                result = pipeline.run(sources)
+            error = None if result.paper else f"no paper ({len(result.sources_failed)} sources failed)"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return time.perf_counter() - start, tracer.records, error
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        session("warmup", warmup_sources, os.path.join(workdir, "warmup-cache"))
+        baseline_rss = current_rss_bytes()
+        peak_rss = [baseline_rss]
+        done = threading.Event()
+
+        def sample_rss():
+            while not done.wait(0.05):
+                peak_rss[0] = max(peak_rss[0], current_rss_bytes())
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        barrier = threading.Barrier(len(session_sources))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(session_sources)) as pool:
+            outcomes = list(pool.map(lambda item: session(item[0], item[1], os.path.join(workdir, "cache"), barrier),
+                                     enumerate(session_sources)))
+        wall = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+    spans = {}
+    for _, records, _ in outcomes:
+        for record in records:
+            spans.setdefault(record["name"], []).append(record["duration_seconds"])
+    return {
+        "wall": wall,
+        "session_seconds": [seconds for seconds, _, _ in outcomes],
+        "rate_wait_seconds": [sum(record["duration_seconds"] for record in records if record["name"] == "llm_rate_wait")
+                              for _, records, _ in outcomes],
+        "errors": [error for _, _, error in outcomes if error],
+        "spans": spans,
+        "session_rss_bytes": max(0, peak_rss[0] - baseline_rss) / len(session_sources),
+    }
+
+def run_load_benchmark(args):
+    """Ramp concurrent generation sessions and report latency per stage, throughput and memory per session."""
+    import multiprocessing
+    from fixtures import build_corpus, synthetic_html, start_fixture_server
+
+    levels = sorted(int(level) for level in args.sessions.split(","))
+    workdir = tempfile.mkdtemp(prefix="ra-bench-")
+    server = None
+    stages = {}
+    failures = []
+    try:
+        corpus = build_corpus(workdir, num_pdfs=args.pdfs, pages_per_pdf=args.pages, num_html=args.html,
+                              html_chars=args.html_chars, seed=args.seed)
+        # Besides the shared corpus, every session brings pages of its own, like users with their own links
+        own_pages = {}
+        for number, session in enumerate(["warmup"] + list(range(levels[-1]))):
+            own_pages[session] = []
+            for i in range(args.own_pages):
+                name = f"session-{session}-{i}.html"
+                with open(os.path.join(workdir, name), "w", encoding="utf-8") as f:
+                    f.write(synthetic_html(args.html_chars, seed=args.seed + 5000 + number * args.own_pages + i,
+                                           title=f"Session {session} page {i}"))
+                own_pages[session].append(name)
+        server, base_url = start_fixture_server(workdir, latency=args.latency)
+
+        def sources(session):
+            pages = corpus["pages"] + own_pages[session]
+            return {"topic": f"{args.topic} (session {session})", "pdfs": list(corpus["pdfs"]),
+                    "urls": [base_url + page for page in pages]}
+
+        context = multiprocessing.get_context("spawn")
+        print(f"{'sessions':>9}{'sessions/s':>12}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'rate wait p95':>15}"
+              f"{'MB/session':>12}{'errors':>8}")
+        first_p95 = None
+        collapsed = None
+        for level in levels:
+            level_dir = tempfile.mkdtemp(prefix=f"load-{level}-", dir=workdir)
+            with context.Pool(1) as pool:
+                outcome = pool.apply(_load_level, ([sources(i) for i in range(level)], sources("warmup"),
+                                                   args.mode, args.llm_latency, args.llm_rpm, level_dir))
+            latency = latency_summary(outcome["session_seconds"])
+            rate_wait = latency_summary(outcome["rate_wait_seconds"])
+            # Collapse is judged without the rate-limit wait, so it reflects contention on the host
+            pipeline_latency = latency_summary([max(0.0, seconds - wait) for seconds, wait
+                                                in zip(outcome["session_seconds"], outcome["rate_wait_seconds"])])
+            stage = {
+                "seconds": round(outcome["wall"], 6),
+                "items": level,
+                "items_per_second": round(level / outcome["wall"], 3),
+                "session_latency": latency,
+                "session_rate_wait": rate_wait,
+                "session_latency_without_rate_wait": pipeline_latency,
+                "stage_latency": {name: dict(latency_summary(durations), calls=len(durations))
+                                  for name, durations in sorted(outcome["spans"].items())},
+                "session_rss_bytes": round(outcome["session_rss_bytes"]),
+                "errors": len(outcome["errors"]),
+            }
+            stages[f"sessions_{level}"] = stage
+            print(f"{level:>9}{stage['items_per_second']:>12.2f}{latency['p50']:>9.2f}{latency['p95']:>9.2f}"
+                  f"{latency['p99']:>9.2f}{rate_wait['p95']:>15.2f}{stage['session_rss_bytes'] / 1e6:>12.1f}"
+                  f"{stage['errors']:>8}")
+            for error in sorted(set(outcome["errors"])):
+                failures.append(f"{level} sessions: {outcome['errors'].count(error)} failed with {error}")
+
+            first_p95 = first_p95 or pipeline_latency["p95"]
+            if collapsed is None and (pipeline_latency["p95"] > first_p95 * args.collapse_factor or outcome["errors"]):
+                collapsed = level
+
+        print("⏱️  Latency per stage (p50 / p95 / p99 seconds per call):")
+        names = sorted({name for stage in stages.values() for name in stage["stage_latency"]})
+        print(f"  {'stage':<16}" + "".join(f"{f'{level} sessions':>24}" for level in levels))
+        for name in names:
+            cells = []
+            for level in levels:
+                row = stages[f"sessions_{level}"]["stage_latency"].get(name)
+                cells.append(f"{row['p50']:.3f}/{row['p95']:.3f}/{row['p99']:.3f}" if row else "-")
+            print(f"  {name:<16}" + "".join(f"{cell:>24}" for cell in cells))
+        if args.llm_rpm:
+            print(f"⏱️  Sessions waited for the {args.llm_rpm:g} requests/minute rate limit in llm_rate_wait; "
+                  f"collapse is judged on latency without that wait")
+        if collapsed is None:
+            print(f"📈 p95 latency stayed within {args.collapse_factor:g}x of {levels[0]} session(s) "
+                  f"up to {levels[-1]} sessions")
+        elif collapsed == levels[0]:
+            print(f"📉 Sessions failed at {levels[0]} session(s)")
+        else:
+            print(f"📉 p95 latency stayed within {args.collapse_factor:g}x of {levels[0]} session(s) up to "
+                  f"{levels[levels.index(collapsed) - 1]} sessions and collapsed at {collapsed}")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    args.check_failures = failures
+    return stages
+
+def run_params(args):
+    """Return the parameters that must match for two runs to be comparable."""
+    params = {key: value for key, value in vars(args).items() if key not in _REPORTING_OPTIONS}
+    params["benchmark"] = params.pop("command")
+    return params
+
+def load_json(path, default):
+    """Load a JSON file, returning default if it is missing or unreadable."""
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"❌ Error reading {path}: {e}")
+    return default
+
+def save_json(path, data):
+    """Write data to a JSON file atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def find_regressions(record, baseline, tolerance, memory_tolerance, min_delta=0.005):
+    """Compare a run against the baseline and describe every stage that got slower or bigger."""
+    regressions = []
+    if baseline.get("params") != record["params"]:
+        print("⚠️  Baseline was recorded with different parameters; skipping comparison.")
+        return regressions
+
+    for name, stage in record["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        # Very short stages are dominated by timer noise, so also require an absolute slowdown
+        slower = stage["seconds"] - base["seconds"] > min_delta
+        if base["seconds"] > 0 and slower and stage["seconds"] > base["seconds"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {stage['seconds']:.4f}s vs baseline {base['seconds']:.4f}s "
+                f"(+{(stage['seconds'] / base['seconds'] - 1) * 100:.0f}%)"
+            )
+        if stage.get("peak_rss_bytes") and base.get("peak_rss_bytes"):
+            if stage["peak_rss_bytes"] > base["peak_rss_bytes"] * (1 + memory_tolerance):
+                regressions.append(
+                    f"{name}: peak RSS {stage['peak_rss_bytes'] / 1e6:.1f} MB vs baseline "
+                    f"{base['peak_rss_bytes'] / 1e6:.1f} MB"
+                )
+    return regressions
+
+def record_and_compare(args, stages):
+    """Append the run to the history file and check it against the baseline. Returns an exit code."""
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": run_params(args),
+        "stages": stages,
+    }
+
+    history = load_json(args.history, [])
+    history.append(record)
+    save_json(args.history, history)
+    print(f"📊 Run appended to {args.history} ({len(history)} runs recorded)")
+
+    if args.save_baseline:
+        save_json(args.baseline, record)
+        print(f"✅ Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_json(args.baseline, None)
+    if not baseline:
+        print(f"💡 No baseline found. Run with --save-baseline to create {args.baseline}")
+        return 0
+
+    regressions = find_regressions(record, baseline, args.tolerance, args.memory_tolerance, args.min_delta)
+    if regressions:
+        print("❌ Regressions against baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("✅ No regressions against baseline.")
+    return 0
+
+def add_common_arguments(parser):
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON file that accumulates every run")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file holding the reference run")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak RSS growth before flagging")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the Research Assistant AI pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pipeline = subparsers.add_parser("pipeline", help="Time every pipeline stage on a synthetic corpus")
+    pipeline.add_argument("--mode", choices=["standard", "simple", "enhanced"], default="simple",
+                          help="Generator whose embedding and prompt are measured")
+    pipeline.add_argument("--pdfs", type=int, default=4, help="Number of synthetic PDFs")
+    pipeline.add_argument("--pages", type=int, default=10, help="Pages per PDF")
+    pipeline.add_argument("--chars-per-page", type=int, default=3000, help="Characters of text per PDF page")
+    pipeline.add_argument("--html", type=int, default=4, help="Number of synthetic HTML pages")
+    pipeline.add_argument("--html-chars", type=int, default=20000, help="Characters of text per HTML page")
+    pipeline.add_argument("--queries", type=int, default=20, help="Retrieval and prompt assembly repetitions")
+    pipeline.add_argument("-k", type=int, default=8, help="Chunks retrieved per query")
+    pipeline.add_argument("--topic", default="Impact of Climate Change on Agriculture", help="Query topic")
+    add_common_arguments(pipeline)
+    pipeline.set_defaults(func=run_pipeline_benchmark)
+
+    memory = subparsers.add_parser("memory", help="Check that bounded mode keeps peak memory flat as the corpus grows")
+    memory.add_argument("--mode", choices=["standard", "simple", "enhanced"], default="simple",
+                        help="Pipeline mode; standard also streams embedding and index building")
+    memory.add_argument("--sizes", default="2,4,8", help="Comma-separated corpus sizes, in pages")
+    memory.add_argument("--page-chars", type=int, default=2_000_000, help="Characters of text per page")
+    memory.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    memory.add_argument("--max-rss-mb", type=float, help="RSS ceiling enforced by the bounded pipeline")
+    memory.add_argument("--flat-tolerance", type=float, default=0.15,
+                        help="Largest allowed growth of bounded peak RSS from the smallest to the largest corpus")
+    memory.add_argument("--compare-unbounded", action="store_true", help="Also measure the in-memory pipeline")
+    add_common_arguments(memory)
+    memory.set_defaults(func=run_memory_benchmark)
+
+    pdf = subparsers.add_parser("pdf-backends", help="Compare PDF backends' pages per second and text fidelity")
+    pdf.add_argument("--pdfs", type=int, default=4, help="Number of synthetic PDFs")
+    pdf.add_argument("--pages", type=int, default=20, help="Pages per PDF")
+    pdf.add_argument("--chars-per-page", type=int, default=3000, help="Characters of text per PDF page")
+    pdf.add_argument("--min-similarity", type=float, default=0.97,
+                     help="Lowest acceptable word-level similarity of a backend's text to pdfplumber's")
+    add_common_arguments(pdf)
+    pdf.set_defaults(func=run_pdf_backend_benchmark)
+
+    crawl = subparsers.add_parser("crawl", help="Time a same-site crawl of a synthetic site and check deduplication")
+    crawl.add_argument("--site-pages", type=int, default=40, help="Pages on the synthetic site")
+    crawl.add_argument("--html-chars", type=int, default=5000, help="Characters of text per page")
+    crawl.add_argument("--latency", type=float, default=0.02, help="Seconds the fixture server waits before each response")
+    crawl.add_argument("--concurrency", type=int, default=8, help="Parallel fetches in the concurrent run")
+    add_common_arguments(crawl)
+    crawl.set_defaults(func=run_crawl_benchmark)
+
+    splitter = subparsers.add_parser("splitter", help="Check the offset splitter matches LangChain's and compare MB/s")
+    splitter.add_argument("--chars", type=int, default=2_000_000, help="Characters of text per sample")
+    add_common_arguments(splitter)
+    splitter.set_defaults(func=run_splitter_benchmark)
+
+    packing = subparsers.add_parser("packing", help="Time MMR context packing and check it against LangChain's MMR")
+    packing.add_argument("--candidates", type=int, default=1000, help="Retrieved candidates to pick from")
+    packing.add_argument("--dims", type=int, default=384, help="Embedding dimensions")
+    packing.add_argument("-k", default="10,50,100", help="Comma-separated numbers of chunks to pick")
+    packing.add_argument("--clusters", type=int, default=100, help="Groups of near-duplicate chunks among the candidates")
+    packing.add_argument("--sources", type=int, default=20, help="Sources the candidates come from")
+    packing.add_argument("--mmr-lambda", type=float, default=0.7, help="Relevance weight of the MMR score")
+    packing.add_argument("--per-source-cap", type=int, default=3, help="Most chunks picked per source in the capped run")
+    packing.add_argument("--budget-ms", type=float, default=50,
+                         help="Largest allowed selection time for each k, in milliseconds")
+    add_common_arguments(packing)
+    packing.set_defaults(func=run_packing_benchmark)
+
+    startup = subparsers.add_parser("startup", help="Check the CLI entry points' import time against a cold-start budget")
+    startup.add_argument("--budget-ms", type=float, default=300,
+                         help="Largest allowed import time of each entry point, in milliseconds")
+    startup.add_argument("--top", type=int, default=5, help="Slowest top-level imports listed per entry point")
+    add_common_arguments(startup)
+    startup.set_defaults(func=run_startup_benchmark)
+
+    load = subparsers.add_parser("load", help="Ramp concurrent generation sessions with the fake LLM and report latency")
+    load.add_argument("--sessions", default="1,2,4,8,16", help="Comma-separated concurrent session counts to ramp through")
+    load.add_argument("--mode", choices=["standard", "simple", "enhanced"], default="simple", help="Pipeline mode")
+    load.add_argument("--pdfs", type=int, default=2, help="Synthetic PDFs shared by every session")
+    load.add_argument("--pages", type=int, default=10, help="Pages per PDF")
+    load.add_argument("--html", type=int, default=2, help="Synthetic HTML pages shared by every session")
+    load.add_argument("--own-pages", type=int, default=2, help="HTML pages of each session's own")
+    load.add_argument("--html-chars", type=int, default=20000, help="Characters of text per HTML page")
+    load.add_argument("--latency", type=float, default=0.02, help="Seconds the fixture server waits before each response")
+    load.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the fake LLM takes per call")
+    load.add_argument("--llm-rpm", type=float, default=0,
+                      help="Client-side LLM requests per minute, as RESEARCH_LLM_RPM; 0 (the default) for no limit")
+    load.add_argument("--collapse-factor", type=float, default=3.0,
+                      help="p95 session latency, as a multiple of the lowest level's, that counts as collapsed")
+    load.add_argument("--topic", default="Impact of Climate Change on Agriculture", help="Topic; each session adds its number")
+    add_common_arguments(load)
+    load.set_defaults(func=run_load_benchmark)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    print("=" * 60)
+    print(f"🧪 Research Assistant AI Benchmark: {args.command}")
+    print("=" * 60)
+    stages = args.func(args)
+    exit_code = record_and_compare(args, stages)
+    for failure in getattr(args, "check_failures", []):
+        print(f"❌ {failure}")
+        exit_code = 1
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
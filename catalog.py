@@ -0,0 +1,162 @@
+"""
+Source catalog for Research Assistant AI
+A small SQLite table, kept in the pipeline cache, with one row per ingested
+source: content hash, size, extraction backend and time, character and chunk
+counts, and when it was last ingested and last changed.
+
+The pipeline uses the stored file size and modification time to skip hashing
+unchanged PDFs, and the stored ETag/Last-Modified headers to ask websites
+whether a page changed. The web interface renders the catalog without touching
+the sources themselves.
+
+The catalog uses SQLite's WAL journal, which needs shared memory that network
+filesystems do not provide. When the cache is on a volume shared by several
+hosts (see workers.py), open it with journal_mode="delete", or set
+RESEARCH_CACHE_JOURNAL=delete for every process that uses the cache.
+"""
+
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+CATALOG_NAME = "catalog.sqlite"
+
+JOURNAL_MODES = ("wal", "delete", "truncate", "persist")
+
+COLUMNS = (
+    "location", "kind", "content_hash", "size_bytes", "mtime_ns", "etag", "last_modified", "backend",
+    "extract_seconds", "chars", "chunks", "status", "error", "first_ingested", "last_ingested", "last_changed",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    location TEXT PRIMARY KEY,
+    kind TEXT,
+    content_hash TEXT,
+    size_bytes INTEGER,
+    mtime_ns INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    backend TEXT,
+    extract_seconds REAL,
+    chars INTEGER,
+    chunks INTEGER,
+    status TEXT,
+    error TEXT,
+    first_ingested TEXT,
+    last_ingested TEXT,
+    last_changed TEXT
+)
+"""
+
+def catalog_path(cache_dir):
+    return os.path.join(cache_dir, CATALOG_NAME)
+
+def default_journal_mode():
+    """Journal mode for the cache's SQLite databases: RESEARCH_CACHE_JOURNAL, or WAL."""
+    mode = os.getenv("RESEARCH_CACHE_JOURNAL", "wal").lower()
+    if mode not in JOURNAL_MODES:
+        print(f"⚠️ Ignoring invalid RESEARCH_CACHE_JOURNAL={mode!r}")
+        return "wal"
+    return mode
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+class SourceCatalog:
+    """Per-source ingest metadata stored in SQLite."""
+
+    def __init__(self, path, journal_mode=None):
+        self.path = path
+        self.journal_mode = journal_mode or default_journal_mode()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(_SCHEMA)
+        return conn
+
+    def get(self, location):
+        """Return the catalog row for a source as a dict, or None."""
+        if not os.path.exists(self.path):
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM sources WHERE location = ?", (location,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def all(self):
+        """Return every row, most recently ingested first."""
+        if not os.path.exists(self.path):
+            return []
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute("SELECT * FROM sources ORDER BY last_ingested DESC, location")]
+        finally:
+            conn.close()
+
+    def totals(self):
+        """Return aggregate counts over every source that has text."""
+        if not os.path.exists(self.path):
+            return {"sources": 0, "chars": 0, "chunks": 0, "size_bytes": 0}
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chars), 0), COALESCE(SUM(chunks), 0), COALESCE(SUM(size_bytes), 0) "
+                "FROM sources WHERE status != 'failed'"
+            ).fetchone()
+            return {"sources": row[0], "chars": row[1], "chunks": row[2], "size_bytes": row[3]}
+        finally:
+            conn.close()
+
+    def record(self, location, kind, content_hash, **fields):
+        """Record an ingest of location. Status becomes new, changed or unchanged by comparing content hashes.
+
+        Fields not passed keep their stored values, so a source whose extraction
+        was reused from the cache keeps its backend, timing and counts.
+        """
+        fields = {key: value for key, value in fields.items() if key in COLUMNS and value is not None}
+        now = _now()
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT content_hash, first_ingested, last_changed FROM sources WHERE location = ?",
+                                   (location,)).fetchone()
+                if row is None:
+                    status, first, changed = "new", now, now
+                elif row["content_hash"] != content_hash:
+                    status, first, changed = "changed", row["first_ingested"], now
+                else:
+                    status, first, changed = "unchanged", row["first_ingested"], row["last_changed"]
+                values = dict(fields, location=location, kind=kind, content_hash=content_hash, status=status,
+                              error=None, first_ingested=first, last_ingested=now, last_changed=changed)
+                names = list(values)
+                updates = ", ".join(f"{name} = excluded.{name}" for name in names if name != "location")
+                conn.execute(
+                    f"INSERT INTO sources ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)}) "
+                    f"ON CONFLICT(location) DO UPDATE SET {updates}",
+                    [values[name] for name in names],
+                )
+            return status
+        finally:
+            conn.close()
+
+    def record_failure(self, location, kind, error):
+        """Mark a source as failed, keeping whatever was recorded about its last successful ingest."""
+        now = _now()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO sources (location, kind, status, error, first_ingested, last_ingested) "
+                    "VALUES (?, ?, 'failed', ?, ?, ?) "
+                    "ON CONFLICT(location) DO UPDATE SET status = 'failed', error = excluded.error, "
+                    "last_ingested = excluded.last_ingested",
+                    (location, kind, str(error), now, now),
+                )
+        finally:
+            conn.close()
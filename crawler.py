@@ -0,0 +1,319 @@
+"""
+Same-site web crawler for Research Assistant AI
+Starts from one URL and follows links on the same site breadth-first, up to a
+depth and page budget. Fetches run concurrently on an asyncio event loop, with
+a limit on parallel requests per host. robots.txt rules and Crawl-delay are
+respected, and URLs are canonicalized so every page is fetched only once.
+
+Pages are handed over as soon as they are fetched, so the caller can extract
+and chunk them while the crawl continues:
+
+    for page in iter_crawl("https://example.com/docs/", max_depth=2, max_pages=50):
+        print(page.url, len(page.html))
+"""
+
+import contextvars
+import posixpath
+import queue
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit, urlunsplit
+
+from deadline import fetch_timeout
+from instrumentation import span
+
+USER_AGENT = "Mozilla/5.0 (compatible; ResearchAssistantAI/1.0)"
+ROBOTS_AGENT = "ResearchAssistantAI"
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".tar", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico",
+    ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".json", ".xml", ".woff", ".woff2", ".exe",
+)
+
+# Defaults for a crawl entry in sources.json
+CRAWL_DEFAULTS = {"max_depth": 2, "max_pages": 50, "per_host": 4, "concurrency": 8, "same_domain": True}
+
+class CrawledPage:
+    def __init__(self, url, html, depth):
+        self.url = url
+        self.html = html
+        self.depth = depth
+
+def crawl_options(spec):
+    """Normalise a crawl entry from sources.json (a URL or a dict with "url") into iter_crawl keyword arguments."""
+    if isinstance(spec, str):
+        spec = {"url": spec}
+    options = dict(CRAWL_DEFAULTS)
+    options.update({key: value for key, value in spec.items() if key in CRAWL_DEFAULTS})
+    options["start_url"] = spec["url"]
+    return options
+
+def _remove_dot_segments(path):
+    normalized = posixpath.normpath(path)
+    if normalized == ".":
+        normalized = "/"
+    if path.endswith("/") and not normalized.endswith("/"):
+        normalized += "/"
+    return normalized if normalized.startswith("/") else "/" + normalized
+
+def canonicalize_url(url, base=None):
+    """Return a canonical form of url (resolved against base), or None if it is not an http(s) URL.
+
+    Lowercases the scheme and host, drops default ports, fragments and tracking
+    parameters, resolves dot segments and sorts the query string.
+    """
+    try:
+        if base:
+            url = urljoin(base, url.strip())
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return None
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    netloc = host if port is None or port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+    path = quote(_remove_dot_segments(parts.path or "/"), safe="/:@!$&'()*+,;=-._~%")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def site_of(url):
+    """Return the host a URL belongs to for same-site checks, ignoring a leading "www."."""
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.base = None
+        self.nofollow = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href"):
+            if "nofollow" not in (attrs.get("rel") or "").lower():
+                self.links.append(attrs["href"])
+        elif tag == "base" and attrs.get("href") and self.base is None:
+            self.base = attrs["href"]
+        elif tag == "meta" and (attrs.get("name") or "").lower() == "robots":
+            if "nofollow" in (attrs.get("content") or "").lower():
+                self.nofollow = True
+
+def extract_links(html, page_url):
+    """Return the canonical URLs a page links to, honouring <base href> and nofollow."""
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    if parser.nofollow:
+        return []
+    base = urljoin(page_url, parser.base) if parser.base else page_url
+    links = []
+    for href in parser.links:
+        link = canonicalize_url(href, base)
+        if link and not urlsplit(link).path.lower().endswith(SKIPPED_EXTENSIONS):
+            links.append(link)
+    return links
+
+_sessions = threading.local()
+
+def fetch_page(url, timeout=30):
+    """Download url with a per-thread pooled session. Returns (final_url, html), or (final_url, None) for non-HTML responses."""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        import requests
+        session = _sessions.session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+    with span("fetch", source=url) as s:
+        response = session.get(url, timeout=fetch_timeout(timeout))
+        s.set(bytes=len(response.content), status_code=response.status_code)
+        response.raise_for_status()
+    final_url = canonicalize_url(response.url) or url
+    if "html" not in response.headers.get("Content-Type", "text/html").lower():
+        return final_url, None
+    return final_url, response.text
+
+class RobotsCache:
+    """Fetches and caches robots.txt once per origin."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._parsers = {}
+
+    def _load(self, origin):
+        import requests
+        from urllib.robotparser import RobotFileParser
+        parser = RobotFileParser(f"{origin}/robots.txt")
+        try:
+            response = requests.get(f"{origin}/robots.txt", headers={"User-Agent": USER_AGENT}, timeout=self.timeout)
+        except requests.RequestException:
+            parser.allow_all = True
+            return parser
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+    async def parser_for(self, url):
+        import asyncio
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._parsers:
+            self._parsers[origin] = asyncio.ensure_future(asyncio.to_thread(self._load, origin))
+        return await self._parsers[origin]
+
+    async def allowed(self, url):
+        return (await self.parser_for(url)).can_fetch(ROBOTS_AGENT, url)
+
+    async def crawl_delay(self, url):
+        return (await self.parser_for(url)).crawl_delay(ROBOTS_AGENT)
+
+async def crawl(start_url, on_page, max_depth=2, max_pages=50, per_host=4, concurrency=8,
+                same_domain=True, respect_robots=True, timeout=30, stop=None):
+    """Crawl breadth-first from start_url, awaiting on_page(page) for every HTML page fetched.
+
+    Returns a dict of counts: fetched, failed, blocked (by robots.txt) and duplicate
+    (pages that redirected to a URL already crawled).
+    """
+    # Imported here rather than at startup, since most runs never crawl
+    import asyncio
+    start = canonicalize_url(start_url)
+    if not start:
+        raise ValueError(f"Not an http(s) URL: {start_url}")
+    home = site_of(start)
+    robots = RobotsCache(timeout) if respect_robots else None
+    frontier = asyncio.Queue()
+    frontier.put_nowait((start, 0))
+    seen = {start}
+    host_slots = {}
+    host_next_fetch = {}
+    stats = {"fetched": 0, "failed": 0, "blocked": 0, "duplicate": 0}
+    reserved = 0
+
+    async def wait_for_crawl_delay(url, host):
+        delay = await robots.crawl_delay(url) if robots else None
+        if not delay:
+            return
+        now = time.monotonic()
+        start_at = max(now, host_next_fetch.get(host, now))
+        host_next_fetch[host] = start_at + delay
+        await asyncio.sleep(start_at - now)
+
+    async def visit(url, depth):
+        nonlocal reserved
+        if robots and not await robots.allowed(url):
+            stats["blocked"] += 1
+            return
+        # Reserve a slot in the page budget before fetching so concurrent workers cannot overshoot it
+        if stats["fetched"] + reserved >= max_pages:
+            return
+        reserved += 1
+        try:
+            host = urlsplit(url).netloc
+            async with host_slots.setdefault(host, asyncio.Semaphore(per_host)):
+                await wait_for_crawl_delay(url, host)
+                final_url, html = await asyncio.to_thread(fetch_page, url, timeout)
+        except Exception as e:
+            print(f"❌ Error crawling {url}: {str(e)}")
+            stats["failed"] += 1
+            return
+        finally:
+            reserved -= 1
+        if final_url != url:
+            if final_url in seen or (same_domain and site_of(final_url) != home):
+                stats["duplicate"] += 1
+                return
+            seen.add(final_url)
+        if html is None:
+            return
+        stats["fetched"] += 1
+        if depth < max_depth:
+            for link in extract_links(html, final_url):
+                if link not in seen and (not same_domain or site_of(link) == home):
+                    seen.add(link)
+                    frontier.put_nowait((link, depth + 1))
+        await on_page(CrawledPage(final_url, html, depth))
+
+    async def worker():
+        while True:
+            url, depth = await frontier.get()
+            try:
+                if not (stop and stop.is_set()):
+                    await visit(url, depth)
+            finally:
+                frontier.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await frontier.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return stats
+
+_DONE = object()
+
+def iter_crawl(start_url, **options):
+    """Run crawl() on a background event loop and yield each CrawledPage as soon as it is fetched.
+
+    At most a few pages are buffered, so a slow consumer slows the crawl down
+    instead of letting fetched HTML pile up in memory. Closing the generator
+    stops the crawl. The counts returned by crawl() are left in the generator's
+    StopIteration value.
+    """
+    import asyncio
+    concurrency = options.get("concurrency", CRAWL_DEFAULTS["concurrency"])
+    pages = queue.Queue(maxsize=concurrency * 2)
+    stop = threading.Event()
+    outcome = {}
+
+    async def hand_over(page):
+        while not stop.is_set():
+            try:
+                pages.put_nowait(page)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    def run():
+        try:
+            outcome["stats"] = asyncio.run(crawl(start_url, hand_over, stop=stop, **options))
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            pages.put(_DONE)
+
+    # Copy the caller's context so spans recorded by the crawl reach the active tracer
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                break
+            yield page
+    finally:
+        stop.set()
+        # Drain the buffer so a crawl blocked on a full queue can finish
+        while thread.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("stats")
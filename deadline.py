@@ -0,0 +1,110 @@
+"""
+Run deadlines for Research Assistant AI
+A run given a time budget (Pipeline(deadline=seconds), --deadline, or the time
+budget in the web interface) carries a Deadline in a context variable, so the
+steps that can run long consult it without it being passed through every call:
+
+    fetches     requests time out when the ingestion budget does, not after 30s
+    sources     sources that are not cached yet are skipped once the ingestion
+                budget is spent, or when their last extraction took longer than
+                what is left; cached web pages are reused without rechecking them
+    PDFs        extraction stops at the page where the ingestion budget runs out
+    crawls      stop taking pages, and feeds stop fetching, when it runs out
+    indexing    sources not embedded in time are left out of retrieval; with no
+                time to index at all, the run switches to the simple generator
+    retrieval   half as many chunks are retrieved when the budget is short
+    generation  enhanced mode switches to the simple generator when the budget is
+                short, and LLM calls time out when the budget does
+
+GENERATION_SHARE of the budget is kept back for retrieval and generation while
+sources are ingested and indexed. Whatever was skipped, truncated or degraded is
+recorded on the deadline and reported in PipelineResult.degraded. Output cut
+short by the deadline is used for the run but never cached.
+
+    with Deadline(60).activate() as deadline:
+        ...
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Share of the budget kept for retrieval and generation while sources are ingested and indexed
+GENERATION_SHARE = 0.4
+
+# Less than this many generation reserves left counts as a short budget
+SHORT_BUDGET = 1.5
+
+# Retrieval depth is never lowered below this
+MIN_K = 3
+
+# Shortest timeout given to a fetch, so a request is never sent with no time to answer
+MIN_FETCH_TIMEOUT = 1.0
+
+_current_deadline = contextvars.ContextVar("research_deadline", default=None)
+
+def current_deadline():
+    """Return the deadline of the run in progress, or None."""
+    return _current_deadline.get()
+
+def fetch_timeout(default):
+    """Return a fetch timeout of default seconds, capped at what is left of the ingestion budget."""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    return max(MIN_FETCH_TIMEOUT, min(default, deadline.ingest_remaining()))
+
+class Deadline:
+    """A time budget for one run and the record of what was dropped to meet it."""
+
+    def __init__(self, seconds, generation_share=GENERATION_SHARE):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds
+        self.reserve = seconds * generation_share
+        self.dropped = []
+        self.skipped = set()
+        self.truncations = 0
+
+    @contextmanager
+    def activate(self):
+        token = _current_deadline.set(self)
+        try:
+            yield self
+        finally:
+            _current_deadline.reset(token)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def ingest_remaining(self):
+        """Seconds left before ingestion and indexing must stop to leave the generation reserve."""
+        return max(0.0, self.expires - self.reserve - time.monotonic())
+
+    def ingest_expired(self):
+        return self.ingest_remaining() <= 0
+
+    def short(self):
+        """True when little more than the generation reserve is left."""
+        return self.remaining() < self.reserve * SHORT_BUDGET
+
+    def _record(self, action, item, reason):
+        self.dropped.append({"action": action, "item": item, "reason": reason,
+                             "at": round(self.elapsed(), 2)})
+
+    def skip(self, item, reason):
+        """Record a source left out of the run."""
+        self.skipped.add(item)
+        self._record("skipped", item, reason)
+
+    def truncate(self, item, reason):
+        """Record output cut short, which marks the stage computing it as not cacheable."""
+        self.truncations += 1
+        self._record("truncated", item, reason)
+
+    def degrade(self, item, reason):
+        """Record a cheaper setting the run switched to."""
+        self._record("degraded", item, reason)
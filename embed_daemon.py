@@ -0,0 +1,286 @@
+"""
+Embedding daemon for Research Assistant AI
+Every CLI run otherwise pays for importing torch and loading the
+sentence-transformers model before it does any work. This daemon loads the
+model once and serves embeddings over a Unix socket, so repeated runs (e.g.
+from a batch script) only pay for a socket round-trip.
+
+    python embed_daemon.py serve     # keep running in a terminal or under a supervisor
+    python embed_daemon.py status
+    python embed_daemon.py stop
+
+The generators call load_embedding(), which connects to the daemon when it is
+running and loads the model in-process when it is not. If the daemon goes
+away during a run, or stops answering within a timeout that grows with the
+batch size (and never runs past the run's time budget, see deadline.py), the
+client loads the model and carries on. The socket is
+RESEARCH_EMBED_SOCKET (default .research_cache/embed.sock); set
+RESEARCH_EMBED_DAEMON=off to never use it.
+
+Protocol: one JSON request per line; every reply is a JSON header line,
+followed for embeddings by rows * dims float32 values.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from deadline import MIN_FETCH_TIMEOUT, current_deadline
+
+# Use a lightweight embedding model that's more likely to be available
+MODEL_NAME = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+MODEL_KWARGS = {"device": "cpu"}
+ENCODE_KWARGS = {"normalize_embeddings": True}
+
+SOCKET_PATH = os.path.join(".research_cache", "embed.sock")
+
+# Texts sent per request, so one huge batch never has to fit in a single message
+REQUEST_TEXTS = 512
+
+CONNECT_TIMEOUT = 0.5
+
+# Seconds a request may wait for the daemon's reply, plus this much per text in it
+REQUEST_TIMEOUT = 30.0
+TIMEOUT_PER_TEXT = 0.1
+
+def socket_path():
+    return os.getenv("RESEARCH_EMBED_SOCKET") or SOCKET_PATH
+
+def daemon_enabled():
+    return hasattr(socket, "AF_UNIX") and os.getenv("RESEARCH_EMBED_DAEMON", "").lower() not in ("0", "off", "false", "no")
+
+def load_local_embedding():
+    """Load the embedding model in this process."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=MODEL_NAME, model_kwargs=MODEL_KWARGS, encode_kwargs=ENCODE_KWARGS)
+
+def request_timeout(texts):
+    """Seconds to wait for the reply to a request of texts texts, capped at what is left of the run's budget."""
+    timeout = REQUEST_TIMEOUT + TIMEOUT_PER_TEXT * texts
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    return max(MIN_FETCH_TIMEOUT, min(timeout, deadline.remaining()))
+
+def _send(conn, header, vectors=None):
+    if vectors is not None:
+        header = dict(header, rows=len(vectors), dims=len(vectors[0]) if vectors else 0)
+    data = (json.dumps(header) + "\n").encode("utf-8")
+    if vectors:
+        data += array("f", [value for vector in vectors for value in vector]).tobytes()
+    conn.sendall(data)
+
+class DaemonError(RuntimeError):
+    """The daemon answered a request with an error."""
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ConnectionError("embedding daemon closed the connection")
+    return data
+
+def _receive(stream):
+    """Read one reply. Returns (header, vectors or None)."""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("embedding daemon closed the connection")
+    header = json.loads(line)
+    if "error" in header:
+        raise DaemonError(f"embedding daemon: {header['error']}")
+    if "rows" not in header:
+        return header, None
+    rows, dims = header["rows"], header["dims"]
+    values = array("f")
+    values.frombytes(_read_exact(stream, rows * dims * 4))
+    return header, [values[row * dims:(row + 1) * dims].tolist() for row in range(rows)]
+
+class DaemonEmbeddings(Embeddings):
+    """Embeddings served by a running daemon, falling back to the in-process model if it goes away."""
+
+    def __init__(self, path, model_name, fallback=load_local_embedding):
+        self.path = path
+        self.model_name = model_name
+        self._fallback = fallback
+        self._local = None
+        self._conn = None
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def _request(self, request, texts=1):
+        with self._lock:
+            if self._conn is None:
+                self._conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._conn.settimeout(CONNECT_TIMEOUT)
+                self._conn.connect(self.path)
+                self._stream = self._conn.makefile("rb")
+            # A daemon that accepted the connection but hangs raises socket.timeout (an OSError)
+            self._conn.settimeout(request_timeout(texts))
+            _send(self._conn, request)
+            return _receive(self._stream)
+
+    def _local_model(self, error):
+        if self._local is None:
+            print(f"⚠️ Embedding daemon unavailable ({error}), loading the model in-process...")
+            self._close()
+            self._local = self._fallback()
+        return self._local
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = self._stream = None
+
+    def embed_documents(self, texts):
+        if self._local is None:
+            try:
+                vectors = []
+                for start in range(0, len(texts), REQUEST_TEXTS):
+                    batch = texts[start:start + REQUEST_TEXTS]
+                    vectors += self._request({"op": "embed_documents", "texts": batch}, len(batch))[1]
+                return vectors
+            except (OSError, ConnectionError, ValueError, DaemonError) as e:
+                return self._local_model(e).embed_documents(texts)
+        return self._local.embed_documents(texts)
+
+    def embed_query(self, text):
+        if self._local is None:
+            try:
+                return self._request({"op": "embed_query", "text": text})[1][0]
+            except (OSError, ConnectionError, ValueError, DaemonError) as e:
+                return self._local_model(e).embed_query(text)
+        return self._local.embed_query(text)
+
+def ping(path=None, timeout=CONNECT_TIMEOUT):
+    """Return the daemon's status header, or None if no daemon answers on the socket."""
+    path = path or socket_path()
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(path)
+            _send(conn, {"op": "ping"})
+            with conn.makefile("rb") as stream:
+                return _receive(stream)[0]
+    except (OSError, ValueError, DaemonError):
+        return None
+
+def load_embedding():
+    """Return a client for the running daemon if its model matches, otherwise the model loaded in-process."""
+    if daemon_enabled():
+        status = ping()
+        if status and status.get("model") == MODEL_NAME:
+            print(f"⚡ Using the embedding daemon at {socket_path()}")
+            return DaemonEmbeddings(socket_path(), MODEL_NAME)
+    return load_local_embedding()
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "ping":
+                    _send(self.connection, {"model": server.model_name, "pid": os.getpid(),
+                                            "uptime": round(time.time() - server.started, 1), "requests": server.requests})
+                elif op == "embed_documents":
+                    with server.model_lock:
+                        vectors = server.embedding.embed_documents(request["texts"])
+                    _send(self.connection, {}, vectors)
+                elif op == "embed_query":
+                    with server.model_lock:
+                        vector = server.embedding.embed_query(request["text"])
+                    _send(self.connection, {}, [vector])
+                elif op == "shutdown":
+                    _send(self.connection, {"stopping": True})
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+                    return
+                else:
+                    _send(self.connection, {"error": f"unknown op {op!r}"})
+                with server.stats_lock:
+                    server.requests += 1
+            except Exception as e:
+                _send(self.connection, {"error": str(e)})
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, embedding, model_name=MODEL_NAME):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.model_lock = threading.Lock()
+        # Handlers run on their own threads, so the request count has a lock of its own
+        self.stats_lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        super().__init__(path, _Handler)
+
+def serve(path=None, embedding=None, model_name=MODEL_NAME):
+    """Bind the socket and return the server; call serve_forever() on it. Loads the model unless embedding is given."""
+    path = path or socket_path()
+    if ping(path):
+        raise RuntimeError(f"an embedding daemon is already running at {path}")
+    if os.path.exists(path):
+        # Left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return EmbeddingServer(path, embedding if embedding is not None else load_local_embedding(), model_name)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve embeddings to CLI runs over a Unix socket.")
+    parser.add_argument("command", choices=["serve", "status", "stop"])
+    parser.add_argument("--socket", default=None, help=f"Socket path (default: RESEARCH_EMBED_SOCKET or {SOCKET_PATH})")
+    args = parser.parse_args()
+    path = args.socket or socket_path()
+
+    if args.command == "status":
+        status = ping(path)
+        if status:
+            print(f"✅ Embedding daemon running at {path}: {status['model']}, pid {status['pid']}, "
+                  f"up {status['uptime']}s, {status['requests']} requests served")
+        else:
+            print(f"❌ No embedding daemon running at {path}")
+        return
+    if args.command == "stop":
+        if not ping(path):
+            print(f"❌ No embedding daemon running at {path}")
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(path)
+            _send(conn, {"op": "shutdown"})
+            with conn.makefile("rb") as stream:
+                _receive(stream)
+        print("👋 Embedding daemon stopped.")
+        return
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("❌ Unix sockets are not available on this platform.")
+        return
+    print(f"🔧 Loading {MODEL_NAME}...")
+    try:
+        server = serve(path)
+    except Exception as e:
+        print(f"❌ {e}")
+        return
+    print(f"⚡ Serving embeddings at {path}")
+    print("⏹️  Press Ctrl+C to stop the daemon")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        print("\n👋 Embedding daemon stopped.")
+
+if __name__ == "__main__":
+    main()
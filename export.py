@@ -0,0 +1,180 @@
+"""
+Paper export for Research Assistant AI
+Renders the generated Markdown paper as HTML or Word (DOCX) on demand.
+
+Renders are cached under a hash of the paper's text, so downloading the same
+paper again returns the stored file without rendering it a second time.
+
+    path = export_paper(paper, "docx")
+    export_to(paper, "html", "research_paper.html")
+"""
+
+import hashlib
+import html
+import os
+import re
+import shutil
+import threading
+
+from instrumentation import record_cache, span
+
+EXPORT_DIR = os.path.join(".research_cache", "exports")
+
+FORMATS = {
+    "md": {"label": "Markdown", "extension": ".md", "mime": "text/markdown"},
+    "html": {"label": "HTML", "extension": ".html", "mime": "text/html"},
+    "docx": {"label": "Word", "extension": ".docx",
+             "mime": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"},
+}
+
+# Bump whenever a renderer's output changes so stale cached files are ignored
+RENDER_VERSION = 2
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+BULLET = re.compile(r"^\s*[-*+]\s+(.*)$")
+NUMBERED = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+INLINE = re.compile(r"(\*\*[^*]+\*\*|__[^_]+__|\*[^*]+\*|_[^_]+_|`[^`]+`)")
+FENCE = re.compile(r"^\s*(```|~~~)")
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ max-width: 48rem; margin: 2rem auto; padding: 0 1rem; font-family: Georgia, serif; line-height: 1.6; }}
+h1, h2, h3 {{ font-family: Helvetica, Arial, sans-serif; }}
+pre, code {{ background: #f5f5f5; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 0.25rem 0.5rem; }}
+</style>
+</head>
+<body>
+"""
+HTML_TAIL = "</body>\n</html>\n"
+
+def paper_hash(paper):
+    """Hash the paper together with the renderer version."""
+    digest = hashlib.sha256(f"{RENDER_VERSION}:".encode("utf-8"))
+    digest.update(paper.encode("utf-8"))
+    return digest.hexdigest()
+
+def paper_title(paper):
+    """Return the first heading of the paper, or a generic title."""
+    for line in paper.splitlines():
+        match = HEADING.match(line)
+        if match:
+            return match.group(2)
+    return "Research Paper"
+
+def render_html(paper, out):
+    """Write the paper as a standalone HTML document to the open text file out."""
+    import markdown2
+    out.write(HTML_HEAD.format(title=html.escape(paper_title(paper))))
+    # One call over the whole paper: code fences and reference links can span sections
+    out.write(markdown2.markdown(paper, extras=["tables", "fenced-code-blocks", "cuddled-lists", "strike"]))
+    out.write(HTML_TAIL)
+
+def _add_inline(paragraph, text):
+    """Add text to a docx paragraph, turning **bold**, *italic* and `code` markup into formatted runs."""
+    for part in INLINE.split(text):
+        if not part:
+            continue
+        if part[:2] in ("**", "__") and part[-2:] == part[:2] and len(part) > 4:
+            paragraph.add_run(part[2:-2]).bold = True
+        elif part[0] in "*_" and part[-1] == part[0] and len(part) > 2:
+            paragraph.add_run(part[1:-1]).italic = True
+        elif part[0] == "`" and part[-1] == "`" and len(part) > 2:
+            paragraph.add_run(part[1:-1]).font.name = "Courier New"
+        else:
+            paragraph.add_run(part)
+
+def render_docx(paper, path):
+    """Write the paper as a Word document to path.
+
+    Covers the Markdown the generators produce: headings, paragraphs, bullet
+    and numbered lists, bold, italic, inline code and fenced code blocks.
+    """
+    from docx import Document
+    document = Document()
+    lines = []
+    fence = None
+
+    def flush():
+        if lines:
+            _add_inline(document.add_paragraph(), " ".join(lines))
+            lines.clear()
+
+    for line in paper.splitlines():
+        marker = FENCE.match(line)
+        if fence is not None:
+            # Inside a code block every line is kept as it is, even one that looks like a heading
+            if marker and marker.group(1) == fence:
+                fence = None
+            else:
+                document.add_paragraph().add_run(line).font.name = "Courier New"
+            continue
+        heading = HEADING.match(line)
+        bullet = BULLET.match(line)
+        numbered = NUMBERED.match(line)
+        if marker:
+            flush()
+            fence = marker.group(1)
+        elif not line.strip():
+            flush()
+        elif heading:
+            flush()
+            document.add_heading(heading.group(2), level=min(len(heading.group(1)) - 1, 4))
+        elif bullet:
+            flush()
+            _add_inline(document.add_paragraph(style="List Bullet"), bullet.group(1))
+        elif numbered:
+            flush()
+            _add_inline(document.add_paragraph(style="List Number"), numbered.group(1))
+        elif re.match(r"^\s*([-*_])(\s*\1){2,}\s*$", line):
+            flush()
+        else:
+            lines.append(line.strip())
+    flush()
+    document.save(path)
+
+def _render(paper, fmt, path):
+    # Unique per thread, since two sessions may render the same paper at once
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if fmt == "md":
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(paper)
+        elif fmt == "html":
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                render_html(paper, f)
+        else:
+            render_docx(paper, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def export_path(paper, fmt, root=EXPORT_DIR):
+    digest = paper_hash(paper)
+    return os.path.join(root, digest[:2], digest + FORMATS[fmt]["extension"])
+
+def export_paper(paper, fmt, root=EXPORT_DIR):
+    """Return the path of the paper rendered as fmt ("md", "html" or "docx"), rendering it only if not cached."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+    path = export_path(paper, fmt, root)
+    if os.path.exists(path):
+        record_cache(f"export.{fmt}", True)
+        return path
+    record_cache(f"export.{fmt}", False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with span("export", format=fmt, bytes=len(paper)) as s:
+        _render(paper, fmt, path)
+        s.set(output_bytes=os.path.getsize(path))
+    return path
+
+def export_to(paper, fmt, destination, root=EXPORT_DIR):
+    """Render the paper as fmt (or reuse the cached render) and copy it to destination."""
+    shutil.copyfile(export_paper(paper, fmt, root), destination)
+    return destination
@@ -0,0 +1,173 @@
+"""
+Synthetic corpus fixtures for Research Assistant AI
+Generates PDFs and HTML pages of controlled sizes and serves them over a local
+HTTP server, so benchmarks never depend on real documents or the internet.
+"""
+
+import os
+import random
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "climate agriculture yield rainfall drought soil crop farmer irrigation "
+    "temperature adaptation resilience policy market food security livestock "
+    "emissions carbon forest water harvest season variability model analysis "
+    "region africa smallholder maize sorghum cassava fertilizer research data "
+    "survey impact risk insurance technology extension income poverty growth"
+).split()
+
+def synthetic_text(num_chars, seed=0):
+    """Generate deterministic paragraph text of roughly num_chars characters."""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < num_chars:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:num_chars]
+
+def _wrap_lines(text, width=90):
+    """Wrap text into lines no longer than width characters."""
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_synthetic_pdf(file_path, pages=5, chars_per_page=3000, seed=0):
+    """Write a plain-text PDF with the given number of pages using only the standard library."""
+    lines_per_page = 60
+    page_streams = []
+    for page_number in range(pages):
+        lines = _wrap_lines(synthetic_text(chars_per_page, seed=seed * 10007 + page_number))
+        body = "".join(f"({_pdf_escape(line)}) '\n" for line in lines[:lines_per_page])
+        page_streams.append(f"BT\n/F1 10 Tf\n12 TL\n50 800 Td\n{body}ET\n".encode("latin-1"))
+
+    # Object layout: 1 catalog, 2 page tree, 3 font, then a page/content pair per page
+    objects = []
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("latin-1"))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, stream in enumerate(page_streams):
+        content_ref = 5 + 2 * i
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>".encode("latin-1")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(file_path, "wb") as f:
+        f.write(out)
+    return file_path
+
+def synthetic_html(num_chars, seed=0, title="Synthetic page", links=()):
+    """Build an HTML page with boilerplate, scripts and roughly num_chars of body text."""
+    text = synthetic_text(num_chars, seed=seed)
+    paragraphs = "\n".join(f"<p>{p}</p>" for p in text.split("\n\n"))
+    anchors = "\n".join(f'<a href="{href}">{href}</a>' for href in links)
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<title>{title}</title>
+<style>body {{ font-family: sans-serif; }} p {{ margin: 1em; }}</style>
+<script>var analytics = {{ page: "{title}" }};</script>
+</head>
+<body>
+<nav>{anchors}</nav>
+<h1>{title}</h1>
+{paragraphs}
+</body>
+</html>
+"""
+
+def build_corpus(root, num_pdfs=2, pages_per_pdf=5, chars_per_page=3000, num_html=2, html_chars=20000, seed=0):
+    """Create a synthetic corpus under root and return its PDF paths and HTML file names."""
+    os.makedirs(root, exist_ok=True)
+    pdfs = []
+    for i in range(num_pdfs):
+        path = os.path.join(root, f"synthetic-{i}.pdf")
+        write_synthetic_pdf(path, pages=pages_per_pdf, chars_per_page=chars_per_page, seed=seed + i)
+        pdfs.append(path)
+
+    pages = [f"page-{i}.html" for i in range(num_html)]
+    for i, name in enumerate(pages):
+        links = [pages[(i + 1) % num_html], pages[(i + 2) % num_html]] if num_html > 1 else []
+        html = synthetic_html(html_chars, seed=seed + 1000 + i, title=f"Synthetic page {i}", links=links)
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(html)
+    return {"pdfs": pdfs, "pages": pages}
+
+def build_site(root, num_pages=20, html_chars=5000, seed=0):
+    """Create a linked site for crawling under root and return the page names a crawl should reach.
+
+    Pages link to each other through relative, absolute, fragment and tracking-parameter
+    variants of the same URLs, and a private/ section is disallowed in robots.txt.
+    """
+    os.makedirs(os.path.join(root, "docs"), exist_ok=True)
+    os.makedirs(os.path.join(root, "private"), exist_ok=True)
+    pages = ["index.html"] + [f"docs/page-{i}.html" for i in range(num_pages - 1)]
+    rng = random.Random(seed)
+    for i, name in enumerate(pages):
+        targets = [pages[(i + 1) % num_pages], pages[(i * 7 + 3) % num_pages], rng.choice(pages)]
+        links = [f"/{target}" for target in targets]
+        links += [f"/{targets[0]}#section-2", f"/{targets[1]}?utm_source=newsletter", "/private/secret.html"]
+        html = synthetic_html(html_chars, seed=seed + i, title=f"Site page {i}", links=links)
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(html)
+    with open(os.path.join(root, "private", "secret.html"), "w", encoding="utf-8") as f:
+        f.write(synthetic_html(html_chars, seed=seed - 1, title="Private page"))
+    with open(os.path.join(root, "robots.txt"), "w", encoding="utf-8") as f:
+        f.write("User-agent: *\nDisallow: /private/\n")
+    return pages
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().send_head()
+
+def start_fixture_server(root, host="127.0.0.1", port=0, latency=0.0):
+    """Serve root over HTTP in a background thread. Returns (server, base_url); call server.shutdown() when done.
+
+    latency adds a delay to every response, to model a remote server.
+    """
+    handler = partial(type("_Handler", (_QuietHandler,), {"latency": latency}), directory=root)
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/"
+    return server, base_url
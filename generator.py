@@ -1,8 +1,8 @@
 import os
 from dotenv import load_dotenv
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI
+from embed_daemon import load_embedding
+from instrumentation import span
+from llm_client import create_chat_model
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_API_KEY")
@@ -15,15 +15,11 @@ if not api_key:
     exit(1)
 
 try:
-    # Use a lightweight embedding model that's more likely to be available
-    embedding = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-MiniLM-L3-v2",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    # Served by the warm embedding daemon if one is running, otherwise loaded here
+    embedding = load_embedding()
 
     # Configure LLM to use DeepSeek API (only for text generation)
-    llm = ChatOpenAI(
+    llm = create_chat_model(
         openai_api_key="sk-dcf3e0319b1b4196b3c43435fba9a5a6",
         openai_api_base="https://api.deepseek.com",
         model_name="deepseek-chat",
@@ -36,8 +32,9 @@ except Exception as e:
     print("📦 If embedding model fails, try: pip install sentence-transformers")
     exit(1)
 
-def generate_research_paper(context_text, topic_prompt):
-    prompt = f"""
+def build_prompt(context_text, topic_prompt):
+    """Assemble the generation prompt from source materials and topic."""
+    return f"""
 You are an expert research assistant. Based on the following materials, write a comprehensive, detailed research paper.
 
 Instructions:
@@ -61,7 +58,13 @@ Source Materials:\n{context_text[:8000]}
 
 Write a complete, detailed research paper following academic standards. Include proper citations and references.
 """
-    return llm.invoke(prompt).content
+
+def generate_research_paper(context_text, topic_prompt):
+    prompt = build_prompt(context_text, topic_prompt)
+    with span("llm_call", bytes=len(prompt)) as s:
+        content = llm.invoke(prompt).content
+        s.set(response_chars=len(content))
+    return content
 
 def save_to_markdown(text, filename="research_paper.md"):
     with open(filename, "w", encoding="utf-8") as f:
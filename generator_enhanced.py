@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from instrumentation import span
+from langchain_core.embeddings import Embeddings
+from llm_client import create_chat_model
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_API_KEY")
@@ -14,7 +16,7 @@ if not api_key:
 
 try:
     # Configure LLM to use DeepSeek API (only for text generation)
-    llm = ChatOpenAI(
+    llm = create_chat_model(
         openai_api_key="sk-dcf3e0319b1b4196b3c43435fba9a5a6",
         openai_api_base="https://api.deepseek.com",
         model_name="deepseek-chat",
@@ -26,8 +28,9 @@ except Exception as e:
     print("💡 Make sure you're using a valid DeepSeek API key from: https://platform.deepseek.com/")
     exit(1)
 
-def generate_research_paper(context_text, topic_prompt):
-    prompt = f"""
+def build_prompt(context_text, topic_prompt):
+    """Assemble the generation prompt from source materials and topic."""
+    return f"""
 You are an expert academic researcher and writer. Based on the following materials, write a comprehensive, detailed research paper that meets high academic standards.
 
 Instructions:
@@ -67,7 +70,13 @@ Source Materials:\n{context_text[:10000]}
 
 Write a complete, detailed research paper following academic standards. Include proper citations, references, and ensure the paper is comprehensive, well-structured, and academically rigorous.
 """
-    return llm.invoke(prompt).content
+
+def generate_research_paper(context_text, topic_prompt):
+    prompt = build_prompt(context_text, topic_prompt)
+    with span("llm_call", bytes=len(prompt)) as s:
+        content = llm.invoke(prompt).content
+        s.set(response_chars=len(content))
+    return content
 
 def save_to_markdown(text, filename="research_paper.md"):
     with open(filename, "w", encoding="utf-8") as f:
@@ -81,7 +90,7 @@ def dummy_embedding(text):
     return [float(x) for x in hash_obj.digest()[:8]]
 
 # Create a simple embedding object for compatibility
-class SimpleEmbeddings:
+class SimpleEmbeddings(Embeddings):
     def embed_documents(self, texts):
         return [dummy_embedding(text) for text in texts]
     
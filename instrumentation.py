@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for Research Assistant AI
+Records timing and memory spans around source fetches, PDF parsing, splitting,
+embedding, index builds and LLM calls, plus cache hit ratios. Spans can be
+exported as JSON lines and scraped as Prometheus text.
+
+Usage:
+    tracer = Tracer()
+    with tracer.activate():
+        with span("split") as s:
+            docs = prepare_documents(text)
+            s.set(chunks=len(docs))
+    tracer.write_jsonl()
+
+    Tracer(profiler=RunProfiler()) also profiles each span as a stage (see profiling.py).
+
+    python instrumentation.py serve --port 9464   # Prometheus endpoint over run_metrics.jsonl
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_FILE = "run_metrics.jsonl"
+
+_current_tracer = contextvars.ContextVar("research_tracer", default=None)
+
+def peak_rss_bytes():
+    """Return the process peak resident set size in bytes, or None if unavailable."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    except ImportError:
+        return None
+
+def current_rss_bytes():
+    """Return the current resident set size in bytes, or None if unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+class Span:
+    """A single timed operation. Attributes such as bytes or chunks are attached with set()."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self._peak_start = peak_rss_bytes()
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, run_id):
+        duration = time.perf_counter() - self._perf_start
+        peak = peak_rss_bytes()
+        record = {
+            "run_id": run_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_seconds": round(duration, 6),
+            "peak_rss_bytes": peak,
+            "peak_rss_delta_bytes": peak - self._peak_start if peak is not None and self._peak_start is not None else None,
+            "rss_bytes": current_rss_bytes(),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+class _NullSpan:
+    """Stand-in used when no tracer is active, so instrumented code never has to check."""
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class MetricsRegistry:
+    """Process-wide aggregate of finished spans and cache lookups, rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.caches = {}
+
+    def observe_span(self, record):
+        with self._lock:
+            stage = self.stages.setdefault(record["name"], {
+                "calls": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "chunks": 0, "peak_rss_bytes": 0,
+            })
+            stage["calls"] += 1
+            stage["errors"] += record["status"] != "ok"
+            stage["seconds"] += record["duration_seconds"]
+            stage["bytes"] += record["attrs"].get("bytes") or 0
+            stage["chunks"] += record["attrs"].get("chunks") or 0
+            stage["peak_rss_bytes"] = max(stage["peak_rss_bytes"], record.get("peak_rss_bytes") or 0)
+
+    def observe_cache(self, cache, hit):
+        with self._lock:
+            counts = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def prometheus_text(self):
+        """Render the aggregate in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {name: dict(values) for name, values in self.stages.items()}
+            caches = {name: dict(values) for name, values in self.caches.items()}
+
+        lines = []
+        stage_metrics = [
+            ("research_stage_calls_total", "counter", "calls", "Number of completed spans per stage"),
+            ("research_stage_errors_total", "counter", "errors", "Number of spans per stage that raised"),
+            ("research_stage_duration_seconds_total", "counter", "seconds", "Total time spent per stage"),
+            ("research_stage_bytes_total", "counter", "bytes", "Bytes processed per stage"),
+            ("research_stage_chunks_total", "counter", "chunks", "Chunks produced or consumed per stage"),
+            ("research_stage_peak_rss_bytes", "gauge", "peak_rss_bytes", "Highest process RSS observed at the end of a stage"),
+        ]
+        for metric, kind, key, help_text in stage_metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name in sorted(stages):
+                lines.append(f'{metric}{{stage="{_escape_label(name)}"}} {stages[name][key]}')
+
+        cache_metrics = [
+            ("research_cache_hits_total", "counter", "Cache lookups that hit"),
+            ("research_cache_misses_total", "counter", "Cache lookups that missed"),
+            ("research_cache_hit_ratio", "gauge", "Fraction of cache lookups that hit"),
+        ]
+        for metric, kind, help_text in cache_metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name in sorted(caches):
+                counts = caches[name]
+                if metric.endswith("hits_total"):
+                    value = counts["hits"]
+                elif metric.endswith("misses_total"):
+                    value = counts["misses"]
+                else:
+                    value = round(_hit_ratio(counts), 6)
+                lines.append(f'{metric}{{cache="{_escape_label(name)}"}} {value}')
+
+        peak = peak_rss_bytes()
+        if peak is not None:
+            lines.append("# HELP research_process_peak_rss_bytes Peak resident set size of this process")
+            lines.append("# TYPE research_process_peak_rss_bytes gauge")
+            lines.append(f"research_process_peak_rss_bytes {peak}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _hit_ratio(counts):
+    total = counts["hits"] + counts["misses"]
+    return counts["hits"] / total if total else 0.0
+
+class Tracer:
+    """Collects the spans of one run. Activate it so instrumented library code reports to it."""
+
+    def __init__(self, run_id=None, registry=METRICS, profiler=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.registry = registry
+        self.profiler = profiler
+        self.records = []
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        token = _current_tracer.set(self)
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            yield self
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            _current_tracer.reset(token)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        current = Span(name, attrs)
+        if self.profiler is not None:
+            self.profiler.enter(name)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = "error"
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if self.profiler is not None:
+                self.profiler.exit()
+            record = current.finish(self.run_id)
+            with self._lock:
+                self.records.append(record)
+            if self.registry is not None:
+                self.registry.observe_span(record)
+
+    def record_cache(self, cache, hit):
+        with self._lock:
+            counts = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+        if self.registry is not None:
+            self.registry.observe_cache(cache, hit)
+
+    def cache_hit_ratios(self):
+        with self._lock:
+            return {name: round(_hit_ratio(counts), 4) for name, counts in self.caches.items()}
+
+    def breakdown(self):
+        """Aggregate spans by stage name into rows suitable for printing or st.dataframe."""
+        with self._lock:
+            records = list(self.records)
+        if not records:
+            return []
+        run_start = min(r["start"] for r in records)
+        run_end = max(r["start"] + r["duration_seconds"] for r in records)
+        wall = max(run_end - run_start, 1e-9)
+
+        rows = {}
+        for record in records:
+            row = rows.setdefault(record["name"], {
+                "stage": record["name"], "calls": 0, "seconds": 0.0, "bytes": 0, "chunks": 0, "peak_rss_mb": 0.0,
+            })
+            row["calls"] += 1
+            row["seconds"] += record["duration_seconds"]
+            row["bytes"] += record["attrs"].get("bytes") or 0
+            row["chunks"] += record["attrs"].get("chunks") or 0
+            row["peak_rss_mb"] = max(row["peak_rss_mb"], round((record.get("peak_rss_bytes") or 0) / 1e6, 1))
+        for row in rows.values():
+            row["seconds"] = round(row["seconds"], 3)
+            row["share_of_run"] = f"{row['seconds'] / wall * 100:.0f}%"
+        return sorted(rows.values(), key=lambda row: row["seconds"], reverse=True)
+
+    def print_breakdown(self):
+        rows = self.breakdown()
+        if not rows:
+            return
+        print("⏱️ Timing breakdown:")
+        print(f"  {'stage':<20}{'calls':>6}{'seconds':>10}{'share':>7}{'chunks':>8}{'peak MB':>9}")
+        for row in rows:
+            print(f"  {row['stage']:<20}{row['calls']:>6}{row['seconds']:>10.3f}{row['share_of_run']:>7}"
+                  f"{row['chunks']:>8}{row['peak_rss_mb']:>9.1f}")
+        for cache, ratio in self.cache_hit_ratios().items():
+            print(f"  cache {cache}: {ratio * 100:.0f}% hit rate")
+
+    def to_jsonl(self):
+        with self._lock:
+            records = list(self.records)
+            caches = {name: dict(counts) for name, counts in self.caches.items()}
+        lines = [json.dumps(record, ensure_ascii=False) for record in records]
+        for name, counts in caches.items():
+            lines.append(json.dumps({"run_id": self.run_id, "cache": name, **counts}))
+        return "".join(line + "\n" for line in lines)
+
+    def write_jsonl(self, path=METRICS_FILE):
+        """Append this run's spans and cache counters to a JSON lines file."""
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(self.to_jsonl())
+        except Exception as e:
+            print(f"❌ Error writing metrics to {path}: {e}")
+
+def current_tracer():
+    return _current_tracer.get()
+
+def span(name, **attrs):
+    """Open a span on the active tracer, or a no-op span if none is active."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _null_span()
+    return tracer.span(name, **attrs)
+
+@contextmanager
+def _null_span():
+    yield _NULL_SPAN
+
+def record_cache(cache, hit):
+    """Count a cache lookup on the active tracer, or on the process registry if none is active."""
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.record_cache(cache, hit)
+    else:
+        METRICS.observe_cache(cache, hit)
+
+def registry_from_jsonl(path=METRICS_FILE):
+    """Rebuild an aggregate registry from a JSON lines metrics file."""
+    registry = MetricsRegistry()
+    if not os.path.exists(path):
+        return registry
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "cache" in record:
+                with registry._lock:
+                    counts = registry.caches.setdefault(record["cache"], {"hits": 0, "misses": 0})
+                    counts["hits"] += record.get("hits", 0)
+                    counts["misses"] += record.get("misses", 0)
+            elif "name" in record:
+                registry.observe_span(record)
+    return registry
+
+def start_metrics_server(port=9464, host="127.0.0.1", registry=None, jsonl_path=None):
+    """Serve Prometheus text on /metrics in a background thread and return the server.
+
+    By default the live process registry is exported; pass jsonl_path to export
+    the aggregate of a metrics file instead (re-read on every scrape).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            source = registry_from_jsonl(jsonl_path) if jsonl_path else (registry or METRICS)
+            body = source.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve pipeline metrics as a Prometheus endpoint.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Serve /metrics aggregated from a JSON lines file")
+    serve.add_argument("--file", default=METRICS_FILE, help="Metrics file written by the pipeline")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=9464)
+    args = parser.parse_args()
+
+    server = start_metrics_server(args.port, args.host, jsonl_path=args.file)
+    print(f"📈 Serving metrics from {args.file} at http://{args.host}:{args.port}/metrics")
+    print("⏹️  Press Ctrl+C to stop the server")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("\n👋 Metrics server stopped.")
+
+if __name__ == "__main__":
+    main()
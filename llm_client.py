@@ -0,0 +1,250 @@
+"""
+Resilient LLM call layer for Research Assistant AI
+Wraps the chat model with client-side token-bucket rate limiting, jittered
+exponential backoff on transient errors, a deadline per call, one pooled HTTP
+client shared by every model in the process, and coalescing of identical
+requests that are already in flight.
+
+Configuration (environment variables):
+    RESEARCH_LLM_RPM           requests per minute allowed client-side (default 60)
+    RESEARCH_LLM_TPM           prompt tokens per minute allowed client-side (default unlimited)
+    RESEARCH_LLM_MAX_ATTEMPTS  attempts per call, including the first (default 6)
+    RESEARCH_LLM_TIMEOUT       seconds a call may take including retries (default 600, and never
+                               past the time budget of the run, see deadline.py)
+    RESEARCH_FAKE_LLM          if set, answer from an offline fake model instead of the API
+    RESEARCH_FAKE_LLM_LATENCY  seconds the fake model takes per call (default 0)
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from deadline import current_deadline
+from instrumentation import record_cache, span
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "RemoteProtocolError", "PoolTimeout",
+}
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when a call cannot finish, or cannot be retried, within its deadline."""
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        print(f"⚠️ Ignoring invalid {name}={value!r}")
+        return default
+
+def estimate_tokens(text):
+    """Rough prompt size in tokens (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1, deadline=None):
+        """Block until amount tokens are available. Raises LLMDeadlineExceeded if that would pass deadline."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise LLMDeadlineExceeded(f"Rate limit wait of {wait:.1f}s would exceed the call deadline")
+            time.sleep(wait)
+
+class RateLimiter:
+    """Client-side request and prompt-token budgets shared by every caller in the process."""
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute / 6.0)) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute / 6.0) if tokens_per_minute else None
+
+    def acquire(self, prompt_tokens, deadline=None):
+        if self.requests:
+            self.requests.acquire(1, deadline)
+        if self.tokens:
+            self.tokens.acquire(prompt_tokens, deadline)
+
+_shared_lock = threading.Lock()
+_http_client = None
+_rate_limiter = None
+
+def shared_http_client():
+    """Return the process-wide pooled HTTP client used for every API call."""
+    global _http_client
+    with _shared_lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60),
+                timeout=httpx.Timeout(_env_float("RESEARCH_LLM_TIMEOUT", 600.0), connect=10.0),
+            )
+        return _http_client
+
+def shared_rate_limiter():
+    """Return the process-wide rate limiter configured from the environment."""
+    global _rate_limiter
+    with _shared_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_minute=_env_float("RESEARCH_LLM_RPM", 60.0),
+                tokens_per_minute=_env_float("RESEARCH_LLM_TPM", None),
+            )
+        return _rate_limiter
+
+def is_retryable(error):
+    """Return True for rate limits, server errors, timeouts and dropped connections."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+def retry_after_seconds(error):
+    """Return the server's Retry-After hint in seconds, if the error carries one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After hint."""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0.0)
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+class ResilientLLM:
+    """Drop-in wrapper for a chat model's invoke() that adds rate limiting, retries, deadlines and coalescing."""
+
+    def __init__(self, llm, limiter=None, max_attempts=None, timeout=None, backoff_base=1.0, backoff_cap=60.0):
+        self.llm = llm
+        self.limiter = limiter or shared_rate_limiter()
+        self.max_attempts = int(max_attempts or _env_float("RESEARCH_LLM_MAX_ATTEMPTS", 6))
+        self.timeout = timeout or _env_float("RESEARCH_LLM_TIMEOUT", 600.0)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.model_id = "|".join(str(getattr(llm, attr, "")) for attr in ("model_name", "temperature", "openai_api_base"))
+
+    def invoke(self, prompt, timeout=None):
+        """Call the model once per distinct prompt in flight and return its response message."""
+        timeout = timeout or self.timeout
+        budget = current_deadline()
+        if budget is not None:
+            # A run with a time budget never waits on the model past the end of it
+            timeout = min(timeout, budget.remaining())
+        deadline = time.monotonic() + timeout
+        key = hashlib.sha256(f"{self.model_id}\0{prompt}".encode("utf-8")).hexdigest()
+
+        with _inflight_lock:
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                _inflight[key] = future
+        record_cache("llm.coalesce", not leader)
+        if not leader:
+            remaining = deadline - time.monotonic()
+            try:
+                return future.result(timeout=max(0.0, remaining))
+            except FutureTimeoutError as e:
+                # Only an alias of the builtin TimeoutError from Python 3.11
+                raise LLMDeadlineExceeded("Timed out waiting for an identical in-flight request") from e
+
+        try:
+            response = self._invoke_with_retries(prompt, deadline)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    def _invoke_with_retries(self, prompt, deadline):
+        attempt = 0
+        while True:
+            attempt += 1
+            with span("llm_rate_wait", attempt=attempt):
+                self.limiter.acquire(estimate_tokens(prompt), deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded("Call deadline passed before the request could be sent")
+            try:
+                with span("llm_attempt", attempt=attempt):
+                    return self.llm.invoke(prompt, timeout=remaining)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_attempts:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after_seconds(e))
+                if time.monotonic() + delay >= deadline:
+                    raise LLMDeadlineExceeded(f"No time left to retry after {type(e).__name__}: {e}") from e
+                print(f"⚠️ LLM call failed ({type(e).__name__}); retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_attempts})")
+                time.sleep(delay)
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+class FakeLLM:
+    """Offline stand-in for the chat model that writes a deterministic paper from the prompt."""
+
+    def __init__(self, latency=None):
+        self.latency = _env_float("RESEARCH_FAKE_LLM_LATENCY", 0.0) if latency is None else latency
+        self.model_name = "fake"
+        self.temperature = 0.0
+
+    def invoke(self, prompt, timeout=None, **kwargs):
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                # Behave like the real client: wait out the timeout, then fail
+                time.sleep(timeout)
+                raise TimeoutError(f"Fake model took longer than {timeout:.1f}s")
+            time.sleep(self.latency)
+        match = re.search(r"Research Topic: (.+)", prompt)
+        topic = match.group(1).strip() if match else "Untitled"
+        sources = prompt.split("Source Materials:", 1)[-1]
+        excerpt = " ".join(sources.split()[:120])
+        section = re.search(r"Section heading: (.+)", prompt)
+        if section:
+            return FakeMessage(f"## {section.group(1).strip()}\n\n{excerpt}\n")
+        sections = ["Abstract", "Introduction", "Methodology", "Findings", "Discussion", "Conclusion", "References"]
+        body = "\n\n".join(f"## {section}\n\n{excerpt}" for section in sections)
+        return FakeMessage(f"# {topic}\n\n{body}\n")
+
+def create_chat_model(**chat_kwargs):
+    """Build the chat model behind the resilient call layer, or the fake model if RESEARCH_FAKE_LLM is set."""
+    if os.getenv("RESEARCH_FAKE_LLM"):
+        return ResilientLLM(FakeLLM())
+    from langchain_openai import ChatOpenAI
+    # Retries are handled here, so the SDK's own retry loop is switched off
+    chat = ChatOpenAI(http_client=shared_http_client(), max_retries=0, **chat_kwargs)
+    return ResilientLLM(chat)
@@ -1,8 +1,14 @@
-from utils import extract_text_from_pdf, extract_text_from_url, prepare_documents
-from generator import generate_research_paper, save_to_markdown, embedding
-from langchain_community.vectorstores import FAISS
+import argparse
 import os
 import json
+from crawler import crawl_options
+from export import FORMATS, export_to
+from feeds import feed_options
+from instrumentation import Tracer
+from packing import DEFAULT_LAMBDA
+from pdf_backends import BACKEND_CHOICES
+from pipeline import MODES, Pipeline, topic_output_file
+from profiling import RunProfiler, profile_dir
 
 def load_sources_from_config(config_file="sources.json"):
     """Load sources from a JSON configuration file."""
@@ -12,7 +18,7 @@ def load_sources_from_config(config_file="sources.json"):
                 return json.load(f)
         except Exception as e:
             print(f"❌ Error loading sources from {config_file}: {e}")
-    return {"pdfs": [], "urls": [], "topic": "Impact of Climate Change on Agriculture"}
+    return {"pdfs": [], "urls": [], "crawl": [], "feeds": [], "topic": "Impact of Climate Change on Agriculture"}
 
 def save_sources_to_config(sources, config_file="sources.json"):
     """Save sources to a JSON configuration file."""
@@ -23,23 +29,30 @@ def save_sources_to_config(sources, config_file="sources.json"):
     except Exception as e:
         print(f"❌ Error saving sources: {e}")
 
-def add_source_interactive():
+def mode_label(mode):
+    """Return the banner suffix for a mode, e.g. ' (Simple Mode)'."""
+    label = MODES[mode]["label"]
+    return f" ({label})" if label else ""
+
+def add_source_interactive(mode="standard", force=False, **pipeline_options):
     """Interactive function to add sources."""
     sources = load_sources_from_config()
     
-    print("\n📚 Source Management")
+    print(f"\n📚 Source Management{mode_label(mode)}")
     print("=" * 40)
     
     while True:
         print("\nOptions:")
         print("1. Add PDF document")
         print("2. Add website URL")
-        print("3. Set research topic")
-        print("4. View current sources")
-        print("5. Generate research paper")
-        print("6. Exit")
+        print("3. Crawl a website (follow links on the same site)")
+        print("4. Add sitemap or RSS/Atom feed")
+        print("5. Set research topic")
+        print("6. View current sources")
+        print("7. Generate research paper")
+        print("8. Exit")
         
-        choice = input("\nEnter your choice (1-6): ").strip()
+        choice = input("\nEnter your choice (1-8): ").strip()
         
         if choice == "1":
             pdf_path = input("Enter PDF file path (e.g., documents/paper.pdf): ").strip()
@@ -58,6 +71,35 @@ def add_source_interactive():
                 print("❌ Please enter a valid URL starting with http:// or https://")
         
         elif choice == "3":
+            url = input("Enter the start URL to crawl: ").strip()
+            if url.startswith(("http://", "https://")):
+                depth = input("Link depth to follow (default 2): ").strip()
+                pages = input("Maximum pages (default 50): ").strip()
+                sources.setdefault("crawl", []).append({
+                    "url": url,
+                    "max_depth": int(depth) if depth.isdigit() else 2,
+                    "max_pages": int(pages) if pages.isdigit() else 50,
+                })
+                print(f"✅ Added crawl: {url}")
+            else:
+                print("❌ Please enter a valid URL starting with http:// or https://")
+        
+        elif choice == "4":
+            url = input("Enter sitemap or feed URL: ").strip()
+            if url.startswith(("http://", "https://")):
+                include = input("Only include URLs matching (optional regex): ").strip()
+                since = input("Only pages modified since (optional, YYYY-MM-DD): ").strip()
+                feed = {"url": url}
+                if include:
+                    feed["include"] = include
+                if since:
+                    feed["since"] = since
+                sources.setdefault("feeds", []).append(feed)
+                print(f"✅ Added feed: {url}")
+            else:
+                print("❌ Please enter a valid URL starting with http:// or https://")
+        
+        elif choice == "5":
             topic = input("Enter research topic: ").strip()
             if topic:
                 sources["topic"] = topic
@@ -65,7 +107,7 @@ def add_source_interactive():
             else:
                 print("❌ Topic cannot be empty")
         
-        elif choice == "4":
+        elif choice == "6":
             print("\n📋 Current Sources:")
             print(f"Topic: {sources['topic']}")
             print(f"PDFs ({len(sources['pdfs'])}):")
@@ -74,119 +116,180 @@ def add_source_interactive():
             print(f"URLs ({len(sources['urls'])}):")
             for url in sources['urls']:
                 print(f"  - {url}")
+            crawls = sources.get('crawl', [])
+            print(f"Crawls ({len(crawls)}):")
+            for spec in crawls:
+                options = crawl_options(spec)
+                print(f"  - {options['start_url']} (depth {options['max_depth']}, up to {options['max_pages']} pages)")
+            feeds = sources.get('feeds', [])
+            print(f"Feeds ({len(feeds)}):")
+            for spec in feeds:
+                print(f"  - {feed_options(spec)['url']}")
         
-        elif choice == "5":
+        elif choice == "7":
             save_sources_to_config(sources)
-            run_agent_with_sources(sources)
+            run_agent_with_sources(sources, mode=mode, force=force, **pipeline_options)
             break
         
-        elif choice == "6":
+        elif choice == "8":
             save_sources_to_config(sources)
             print("👋 Goodbye!")
             break
         
         else:
-            print("❌ Invalid choice. Please enter 1-6.")
-
-def run_agent_with_sources(sources):
-    """Run the research agent with the provided sources."""
-    print("\n🚀 Starting Research Assistant AI...")
-    print(f"📝 Topic: {sources['topic']}")
-    
-    all_text = ""
-
-    # Process PDFs
-    for pdf_path in sources['pdfs']:
-        print(f"📄 Processing PDF: {pdf_path}")
-        try:
-            if os.path.exists(pdf_path):
-                pdf_text = extract_text_from_pdf(pdf_path)
-                if pdf_text:
-                    all_text += pdf_text + "\n\n"
-                    print(f"✅ PDF processed successfully. Extracted {len(pdf_text)} characters.")
-                else:
-                    print(f"❌ No text extracted from PDF: {pdf_path}")
-            else:
-                print(f"❌ PDF file not found: {pdf_path}")
-        except Exception as e:
-            print(f"❌ Error processing PDF {pdf_path}: {e}")
+            print("❌ Invalid choice. Please enter 1-8.")
 
-    # Process URLs
-    for url in sources['urls']:
-        print(f"🌐 Processing website: {url}")
+def export_formats(paper, output_file, formats):
+    """Write the paper next to output_file in each extra format, e.g. research_paper.html."""
+    stem = os.path.splitext(output_file)[0]
+    for fmt in formats:
         try:
-            website_text = extract_text_from_url(url)
-            if website_text:
-                all_text += website_text + "\n\n"
-                print(f"✅ Website processed successfully. Extracted {len(website_text)} characters.")
-            else:
-                print(f"❌ No text extracted from URL: {url}")
+            path = export_to(paper, fmt, stem + FORMATS[fmt]["extension"])
+            print(f"✅ Exported {FORMATS[fmt]['label']}: {path}")
         except Exception as e:
-            print(f"❌ Error processing website {url}: {e}")
+            print(f"❌ Error exporting {FORMATS[fmt]['label']}: {e}")
 
-    if not all_text.strip():
-        print("❌ No text extracted from sources. Please check your inputs.")
+def write_profile(profiler, output_file):
+    """Write the run's profile next to output_file, e.g. research_paper_profile/."""
+    if profiler is None:
         return
-
-    print(f"📊 Total text extracted: {len(all_text)} characters")
-    
-    print("🔧 Preparing documents...")
+    directory = profile_dir(output_file)
     try:
-        docs = prepare_documents(all_text)
-        print(f"✅ Documents prepared. Created {len(docs)} document chunks.")
+        profiler.write(directory)
+        profiler.print_summary()
+        print(f"🔬 Profile written to {directory}/ (all.pstats, <stage>.pstats, stacks.collapsed, allocations.txt)")
     except Exception as e:
-        print(f"❌ Error preparing documents: {e}")
-        return
+        print(f"❌ Error writing profile to {directory}: {e}")
 
-    print("🗄️ Creating vector database...")
-    try:
-        db = FAISS.from_documents(docs, embedding)
-        print("✅ Vector database created successfully.")
-    except Exception as e:
-        print(f"❌ Error creating vector database: {e}")
-        return
+def run_agent_with_sources(sources, mode="standard", force=False, export=(), profile=False, **pipeline_options):
+    """Run the research agent with the provided sources.
 
-    print("📝 Generating research paper...")
-    try:
-        joined_text = " ".join([doc.page_content for doc in docs])
-        paper = generate_research_paper(joined_text, sources['topic'])
-        save_to_markdown(paper)
-        print("✅ Research paper saved as research_paper.md")
-        print("📄 Paper preview (first 500 characters):")
+    Extra keyword arguments (bounded, max_rss_mb, batch_size, ...) are passed to Pipeline.
+    """
+    tracer = Tracer(profiler=RunProfiler() if profile else None)
+    with tracer.activate():
+        pipeline = Pipeline(mode=mode, force=force, **pipeline_options)
+        result = pipeline.run(sources)
+        if result.paper:
+            export_formats(result.paper, pipeline.output_file, export)
+    tracer.print_breakdown()
+    tracer.write_jsonl()
+    write_profile(tracer.profiler, pipeline.output_file)
+
+    if result.paper:
+        paper = result.paper
+        preview_chars = 800 if mode == "enhanced" else 500
+        print(f"📄 Paper preview (first {preview_chars} characters):")
         print("-" * 50)
-        print(paper[:500] + "..." if len(paper) > 500 else paper)
+        print(paper[:preview_chars] + "..." if len(paper) > preview_chars else paper)
         print("-" * 50)
-    except Exception as e:
-        print(f"❌ Error generating research paper: {e}")
+        print(f"📊 Paper length: {len(paper)} characters ({len(paper.split())} words)")
+    return result
+
+def run_agent_with_topics(sources, topics, mode="standard", force=False, max_workers=4, export=(), profile=False,
+                          **pipeline_options):
+    """Write one paper per topic from the provided sources, ingesting and indexing them only once."""
+    tracer = Tracer(profiler=RunProfiler() if profile else None)
+    with tracer.activate():
+        pipeline = Pipeline(mode=mode, force=force, **pipeline_options)
+        results = pipeline.run_topics(sources, topics, max_workers)
+        for topic, result in results.items():
+            if result.paper:
+                export_formats(result.paper, topic_output_file(pipeline.output_file, topic), export)
+    tracer.print_breakdown()
+    tracer.write_jsonl()
+    write_profile(tracer.profiler, pipeline.output_file)
 
-def run_agent(pdf_path=None, website_url=None, topic="Impact of Climate Change on Agriculture"):
+    for topic, result in results.items():
+        if result.paper:
+            print(f"📊 {topic}: {len(result.paper)} characters ({len(result.paper.split())} words)")
+        else:
+            print(f"❌ {topic}: no paper generated")
+    return results
+
+def run_agent(pdf_path=None, website_url=None, topic="Impact of Climate Change on Agriculture", mode="standard"):
     """Legacy function for backward compatibility."""
     sources = {
         "pdfs": [pdf_path] if pdf_path else [],
         "urls": [website_url] if website_url else [],
         "topic": topic
     }
-    run_agent_with_sources(sources)
+    return run_agent_with_sources(sources, mode=mode)
+
+def parse_args(argv=None, default_mode="standard"):
+    parser = argparse.ArgumentParser(description="Generate a research paper from PDFs and websites.")
+    parser.add_argument("--mode", choices=list(MODES), default=default_mode,
+                        help="standard: vector retrieval; simple: no embeddings; enhanced: longer, more rigorous paper")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        help="Recompute the given stages (all stages if none are named) instead of reusing cached outputs")
+    parser.add_argument("--bounded", action="store_true",
+                        help="Spill text and chunks to disk and stream them in batches to keep memory flat on large corpora")
+    parser.add_argument("--max-rss-mb", type=float, help="With --bounded, abort if resident memory exceeds this many MB")
+    parser.add_argument("--batch-size", type=int, default=256, help="With --bounded, chunks embedded per batch")
+    parser.add_argument("--pdf-backend", choices=BACKEND_CHOICES, default="auto",
+                        help="PDF text extractor; auto picks a fast backend per document when it matches pdfplumber")
+    parser.add_argument("--summarize", action="store_true",
+                        help="Condense the whole corpus into a digest with map-reduce LLM calls instead of retrieving chunks")
+    parser.add_argument("--summary-workers", type=int, default=8, help="With --summarize, summaries requested in parallel")
+    parser.add_argument("--no-semantic-cache", action="store_true",
+                        help="Do not reuse retrieval results or papers written for similar topics")
+    parser.add_argument("--export", nargs="+", choices=[fmt for fmt in FORMATS if fmt != "md"], default=[],
+                        help="Also save the paper in these formats next to research_paper.md")
+    parser.add_argument("--topics", nargs="+", metavar="TOPIC",
+                        help="Write one paper per topic from the configured sources, sharing one index")
+    parser.add_argument("--topic-workers", type=int, default=4, help="With --topics, papers generated concurrently")
+    parser.add_argument("--search-source", nargs="+", metavar="PATTERN", default=[],
+                        help="Retrieve only from sources matching these glob patterns, e.g. 'documents/*.pdf'")
+    parser.add_argument("--mmr-lambda", type=float, default=DEFAULT_LAMBDA, metavar="LAMBDA",
+                        help="Relevance weight (0-1) when picking retrieved chunks; lower values favour chunks "
+                             "that add evidence the others do not, 1 keeps the plain similarity ranking")
+    parser.add_argument("--per-source-cap", type=int, metavar="N",
+                        help="Retrieve at most N chunks from any one source")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="Finish within this many seconds, skipping or truncating slow sources and cutting "
+                             "retrieval or generation down as needed; what was dropped is reported")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile each stage (CPU and Python allocations) and write .pstats and collapsed-stack "
+                             "files to research_paper_profile/ next to the paper; slows the run")
+    return parser.parse_args(argv)
+
+def main(argv=None, default_mode="standard"):
+    args = parse_args(argv, default_mode)
+    mode = args.mode
+    force = True if args.force == [] else (args.force or ())
+    pipeline_options = {"bounded": args.bounded, "max_rss_mb": args.max_rss_mb, "batch_size": args.batch_size,
+                        "pdf_backend": args.pdf_backend, "summarize": args.summarize,
+                        "summary_workers": args.summary_workers, "semantic_cache": not args.no_semantic_cache,
+                        "search_sources": args.search_source, "deadline": args.deadline,
+                        "mmr_lambda": args.mmr_lambda, "per_source": args.per_source_cap}
+    # Run options are passed through to run_agent_with_sources/run_agent_with_topics; export is not a Pipeline option
+    run_options = dict(pipeline_options, export=args.export, profile=args.profile)
 
-if __name__ == "__main__":
     print("=" * 60)
-    print("🔬 Research Assistant AI")
+    print(f"🔬 Research Assistant AI{mode_label(mode)}")
     print("=" * 60)
     
     # Check if sources.json exists, if not start interactive mode
     if not os.path.exists("sources.json"):
         print("📝 No sources configured. Starting interactive mode...")
-        add_source_interactive()
+        add_source_interactive(mode, force, **run_options)
     else:
         print("📋 Loading existing sources...")
         sources = load_sources_from_config()
-        if sources["pdfs"] or sources["urls"]:
+        if sources["pdfs"] or sources["urls"] or sources.get("crawl") or sources.get("feeds"):
             print("✅ Sources found. Starting research paper generation...")
-            run_agent_with_sources(sources)
+            if args.topics:
+                run_agent_with_topics(sources, args.topics, mode=mode, force=force,
+                                      max_workers=args.topic_workers, **run_options)
+            else:
+                run_agent_with_sources(sources, mode=mode, force=force, **run_options)
         else:
             print("❌ No sources found in configuration. Starting interactive mode...")
-            add_source_interactive()
+            add_source_interactive(mode, force, **run_options)
     
     print("=" * 60)
     print("🏁 Process completed!")
     print("=" * 60)
+
+if __name__ == "__main__":
+    main()
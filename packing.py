@@ -0,0 +1,77 @@
+"""
+Diversity-aware context packing for Research Assistant AI
+The chunks nearest to a topic often come from the same paragraph of one
+source, so the prompt would carry the same evidence several times. Retrieval
+therefore fetches CANDIDATES_PER_CHUNK candidates for every chunk it keeps and
+picks the k to send by Maximal Marginal Relevance (MMR). Each pick maximizes
+
+    lambda * similarity(topic, chunk) - (1 - lambda) * max similarity(chunk, chunks already picked)
+
+among the candidates whose source has not reached its cap. lambda=1 keeps the
+plain similarity ranking; lower values trade relevance for distinct evidence.
+
+The selection runs in NumPy over the candidates' vectors: the similarities to
+the topic are one matrix-vector product, and each pick adds one more to
+update every candidate's redundancy.
+
+    picked = mmr_select(topic_vector, vectors, k=10, lambda_mult=0.7, groups=sources, per_group=3)
+"""
+
+# Weight of relevance against redundancy in each pick
+DEFAULT_LAMBDA = 0.7
+
+# Candidates fetched per chunk kept, for MMR to choose from
+CANDIDATES_PER_CHUNK = 4
+
+def _unit_rows(vectors):
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def mmr_select(query, vectors, k, lambda_mult=DEFAULT_LAMBDA, groups=None, per_group=None):
+    """Return the indices of up to k rows of vectors picked by MMR, in the order they were picked.
+
+    groups gives each row's group, e.g. its source; with per_group set, at most
+    that many rows are picked from any one group.
+    """
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if k <= 0 or not len(vectors):
+        return []
+    unit = _unit_rows(vectors)
+    relevance = unit @ _unit_rows(np.asarray(query, dtype=np.float32))
+    available = np.ones(len(unit), dtype=bool)
+    if groups is not None and per_group:
+        _, group_ids = np.unique(np.asarray(groups), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int64)
+
+    picked = []
+    # The first pick has nothing to be redundant with, so it is the most relevant candidate
+    scores = relevance.copy()
+    redundancy = None
+    while len(picked) < k:
+        if redundancy is not None:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not available[best]:
+            break
+        picked.append(best)
+        available[best] = False
+        similarity = unit @ unit[best]
+        redundancy = similarity if redundancy is None else np.maximum(redundancy, similarity)
+        if groups is not None and per_group:
+            group = group_ids[best]
+            group_counts[group] += 1
+            if group_counts[group] >= per_group:
+                available[group_ids == group] = False
+    return picked
+
+def pack_context(query, candidates, k, lambda_mult=DEFAULT_LAMBDA, per_source=None):
+    """Return the texts of up to k candidates (distance, text, source, vector) picked by MMR."""
+    if not candidates:
+        return []
+    picked = mmr_select(query, [candidate[3] for candidate in candidates], k, lambda_mult,
+                        [candidate[2] for candidate in candidates], per_source)
+    return [candidates[position][1] for position in picked]
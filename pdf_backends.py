@@ -0,0 +1,197 @@
+"""
+PDF text extraction backends for Research Assistant AI
+pdfplumber computes character-level layout, which is accurate but slow.
+pypdfium2 and PyMuPDF read the text layer directly and are many times faster,
+and for plain-text PDFs they return the same text.
+
+Backends:
+    pdfplumber  accurate layout-aware extraction (always available)
+    pypdfium2   fast, via PDFium
+    pymupdf     fast, via MuPDF (optional: pip install pymupdf)
+    auto        per document: a quick sampling pass compares the fast backend with
+                pdfplumber on a few pages and uses the fast one if they agree
+"""
+
+import importlib.util
+from collections import Counter
+
+from deadline import current_deadline
+from instrumentation import span
+
+# Pages compared by the sampling pass in auto mode
+SAMPLE_PAGES = 2
+
+# Word-level agreement with pdfplumber a fast backend needs on the sample to be chosen
+AUTO_MIN_SIMILARITY = 0.97
+
+def normalize_page_text(text):
+    """Normalise line endings and trailing spaces so backends produce comparable text."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+def text_similarity(reference, candidate):
+    """F1 overlap of the word multisets of two texts: 1.0 means the same words, in any order."""
+    reference_words = Counter(reference.split())
+    candidate_words = Counter(candidate.split())
+    if not reference_words and not candidate_words:
+        return 1.0
+    common = sum((reference_words & candidate_words).values())
+    if not common:
+        return 0.0
+    precision = common / sum(candidate_words.values())
+    recall = common / sum(reference_words.values())
+    return 2 * precision * recall / (precision + recall)
+
+class PdfBackend:
+    """Extracts the text of a PDF page by page."""
+
+    name = None
+    module = None
+
+    def available(self):
+        return importlib.util.find_spec(self.module) is not None
+
+    def page_count(self, path):
+        raise NotImplementedError
+
+    def iter_pages(self, path, pages=None):
+        """Yield the normalised text of each page, or of the given page indices only."""
+        raise NotImplementedError
+
+class PdfplumberBackend(PdfBackend):
+    name = "pdfplumber"
+    module = "pdfplumber"
+
+    def page_count(self, path):
+        import pdfplumber
+        with pdfplumber.open(path) as pdf:
+            return len(pdf.pages)
+
+    def iter_pages(self, path, pages=None):
+        import pdfplumber
+        with pdfplumber.open(path) as pdf:
+            for index in range(len(pdf.pages)) if pages is None else pages:
+                page = pdf.pages[index]
+                text = page.extract_text() or ""
+                # Drop the page's parsed layout objects before moving on
+                page.close()
+                yield normalize_page_text(text)
+
+class PdfiumBackend(PdfBackend):
+    name = "pypdfium2"
+    module = "pypdfium2"
+
+    def page_count(self, path):
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    def iter_pages(self, path, pages=None):
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            for index in range(len(pdf)) if pages is None else pages:
+                page = pdf[index]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                yield normalize_page_text(text)
+        finally:
+            pdf.close()
+
+class PyMuPDFBackend(PdfBackend):
+    name = "pymupdf"
+    module = "fitz"
+
+    def page_count(self, path):
+        import fitz
+        with fitz.open(path) as doc:
+            return doc.page_count
+
+    def iter_pages(self, path, pages=None):
+        import fitz
+        with fitz.open(path) as doc:
+            for index in range(doc.page_count) if pages is None else pages:
+                yield normalize_page_text(doc[index].get_text())
+
+BACKENDS = {backend.name: backend for backend in (PdfplumberBackend(), PdfiumBackend(), PyMuPDFBackend())}
+
+# Fast backends in order of preference for auto mode
+FAST_BACKENDS = ("pymupdf", "pypdfium2")
+
+BACKEND_CHOICES = ("auto",) + tuple(BACKENDS)
+
+def get_backend(name):
+    """Return the backend called name, raising if it is unknown or not installed."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}'. Choose one of: {', '.join(BACKEND_CHOICES)}")
+    backend = BACKENDS[name]
+    if not backend.available():
+        raise ImportError(f"PDF backend '{name}' is not installed (missing module '{backend.module}')")
+    return backend
+
+def fast_backend():
+    """Return the preferred installed fast backend, or None."""
+    for name in FAST_BACKENDS:
+        if BACKENDS[name].available():
+            return BACKENDS[name]
+    return None
+
+def sample_pages(page_count, samples=SAMPLE_PAGES):
+    """Pick page indices spread through the document for the sampling pass."""
+    if page_count <= samples:
+        return list(range(page_count))
+    return sorted({round(i * (page_count - 1) / (samples - 1)) for i in range(samples)}) if samples > 1 else [0]
+
+def choose_backend(path, samples=SAMPLE_PAGES):
+    """Pick a backend for one PDF. Returns (backend, similarity of the sample or None).
+
+    A fast backend is used if it extracts the same words as pdfplumber on the
+    sampled pages. Documents no longer than the sample are read with pdfplumber,
+    since sampling them would cost as much as extracting them, and so are all
+    documents once the run's ingestion budget is spent (see deadline.py).
+    """
+    deadline = current_deadline()
+    if deadline is not None and deadline.ingest_expired():
+        return BACKENDS["pdfplumber"], None
+    with span("pdf_backend_select", source=path) as s:
+        backend, similarity = _compare_sample(path, samples)
+        s.set(backend=backend.name, similarity=similarity)
+    return backend, similarity
+
+def _compare_sample(path, samples):
+    fast = fast_backend()
+    reference = BACKENDS["pdfplumber"]
+    if fast is None:
+        return reference, None
+    try:
+        page_count = fast.page_count(path)
+    except Exception:
+        return reference, None
+    if page_count <= samples:
+        return reference, None
+    indices = sample_pages(page_count, samples)
+    try:
+        fast_text = "\n".join(fast.iter_pages(path, indices))
+    except Exception:
+        return reference, None
+    try:
+        reference_text = "\n".join(reference.iter_pages(path, indices))
+    except Exception:
+        # Extraction reports the error for this document; choosing a backend must not abort the run
+        return reference, None
+    if not reference_text.strip():
+        # No text layer (e.g. scanned pages): the fast backend cannot do worse
+        return fast, None
+    similarity = text_similarity(reference_text, fast_text)
+    return (fast if similarity >= AUTO_MIN_SIMILARITY else reference), similarity
+
+def resolve_backend(path, name="auto"):
+    """Return the backend to extract path with, choosing per document when name is "auto"."""
+    if name == "auto":
+        return choose_backend(path)[0]
+    return get_backend(name)
@@ -0,0 +1,1095 @@
+"""
+Incremental research pipeline for Research Assistant AI
+One engine for every generation mode. Stages are declared with their inputs and
+each output is stored under a content hash of those inputs, so a rerun only
+recomputes the stages whose inputs changed (make-style).
+
+Stages: fetch -> extract -> split -> embed -> index for each source, then
+dedupe -> retrieve -> generate over the whole corpus. Each source's index is a
+shard of its own, and retrieval searches the shards in parallel and merges
+their results (see shards.py), so adding or removing a source only indexes or
+drops that source. The chunks sent to the generator are picked from a larger
+set of candidates by Maximal Marginal Relevance, so near-duplicate chunks do not
+crowd out other evidence (see packing.py).
+Only fetch always runs, because it is how changed sources are detected. The
+source catalog (catalog.py) makes it cheap: PDFs whose size and modification
+time are unchanged are not rehashed, and web pages are requested conditionally
+with their last ETag/Last-Modified.
+Sources are the "pdfs" and "urls" lists plus any "crawl" entries, whose pages
+are fed into extract and split as the crawler fetches them, and "feeds"
+(sitemaps, RSS and Atom), whose pages are only fetched again when their
+lastmod date is newer than the feed's last successful ingest.
+
+With summarize=True, retrieval is replaced by a map-reduce digest of the whole
+corpus (see summarize.py), so generation sees every source rather than the
+few chunks that fit the prompt.
+
+When sources change, the paper is updated section by section where possible:
+each section's evidence is recorded (see sections.py), and only the sections
+whose evidence changed are rewritten and spliced into the previous paper.
+
+Topics that are rephrasings of earlier ones reuse their retrieved context or
+paper through a semantic cache (see semantic_cache.py).
+
+With deadline=seconds, the run is fitted to a time budget: slow sources are
+skipped or truncated, indexing and retrieval depth are cut down, or the run
+switches to the simple generator, and what was dropped is reported in
+result.degraded (see deadline.py).
+
+With bounded=True, extracted text and chunks are spilled to files in the cache
+and streamed through the later stages in batches (see spill.py), so corpora
+larger than memory can be processed under an RSS ceiling. Chunks are then byte
+ranges of the extracted text files, which are only read and decoded where a
+chunk's text is needed (see textstore.py).
+"""
+
+import contextvars
+import gc
+import hashlib
+import importlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import sections
+import spill
+import summarize
+from packing import CANDIDATES_PER_CHUNK, DEFAULT_LAMBDA, pack_context
+from semantic_cache import SemanticCache, cache_path as semantic_cache_path, lexical_embedding
+from shards import ShardRouter, select_sources
+from textstore import TextStore
+from catalog import SourceCatalog, catalog_path
+from deadline import MIN_K, Deadline
+from crawler import crawl_options, iter_crawl
+from feeds import expand_feed, feed_options, filter_entries, iter_fetched, parse_date
+from instrumentation import record_cache, span
+from pdf_backends import get_backend, resolve_backend
+from utils import extract_text_from_html, extract_text_from_pdf, fetch_url, fetch_url_if_modified, prepare_documents
+
+CACHE_DIR = ".research_cache"
+OUTPUT_FILE = "research_paper.md"
+
+MODES = {
+    "standard": {"module": "generator", "label": "", "retrieval": True},
+    "simple": {"module": "generator_simple", "label": "Simple Mode", "retrieval": False},
+    "enhanced": {"module": "generator_enhanced", "label": "Enhanced Mode", "retrieval": False},
+}
+
+STAGES = ("fetch", "extract", "split", "dedupe", "embed", "index", "retrieve", "summarize", "generate")
+
+# Bump a stage's version whenever its logic changes so stale cached outputs are ignored
+STAGE_VERSIONS = {
+    "extract": 2,
+    "split": 2,
+    "dedupe": 1,
+    "embed": 1,
+    "index": 1,
+    "retrieve": 1,
+    "generate": 1,
+}
+
+# Stages without finer-grained spans of their own in utils or the generators
+_SPANNED_STAGES = {"dedupe", "embed", "index", "retrieve"}
+
+# Characters of leading chunks handed to the generators in modes without retrieval.
+# Larger than any generator's prompt window, so prompts match a full concatenation.
+CONTEXT_CHARS = 12000
+
+def content_hash(*parts):
+    """Hash strings, bytes or JSON-serialisable values into one stable hex digest."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def file_hash(path, block_size=1 << 20):
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_generator(mode):
+    """Import the generator module that implements a mode."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'. Choose one of: {', '.join(MODES)}")
+    return importlib.import_module(MODES[mode]["module"])
+
+def embedding_id(embedding):
+    """Identify an embedding model so cached vectors are never mixed across models."""
+    return getattr(embedding, "model_name", None) or type(embedding).__name__
+
+def llm_id(llm):
+    """Identify a chat model so cached summaries are never mixed across models."""
+    return getattr(llm, "model_id", None) or getattr(llm, "model_name", None) or type(llm).__name__
+
+def dedupe_chunks(chunks):
+    """Drop chunks whose text repeats an earlier chunk, ignoring whitespace differences."""
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        fingerprint = hashlib.sha1(" ".join(chunk["text"].split()).encode("utf-8")).digest()
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            unique.append(chunk)
+    return unique
+
+class ArtifactStore:
+    """Content-addressed storage for stage outputs under the cache directory."""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+
+    def path(self, stage, key, suffix=".json"):
+        return os.path.join(self.root, stage, key[:2], key + suffix)
+
+    def has(self, stage, key, suffix=".json"):
+        return os.path.exists(self.path(stage, key, suffix))
+
+    def load(self, stage, key):
+        path = self.path(stage, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def save(self, stage, key, value):
+        path = self.path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer, since ingestion workers on other processes or hosts may store the same key at once
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+class Node:
+    """A declared stage invocation: its key covers the stage, its inputs and its dependencies' keys."""
+
+    def __init__(self, pipeline, name, inputs, compute, deps=(), codec="json", output_suffix=None, lazy=False):
+        self.pipeline = pipeline
+        self.name = name
+        self.deps = list(deps)
+        self.compute = compute
+        self.codec = codec
+        # Nodes with an output_suffix write a file next to their cached value and get its path as first argument
+        self.output_suffix = output_suffix
+        # Lazy nodes get their dependency nodes instead of their values, and evaluate them only if needed
+        self.lazy = lazy
+        # What a context node's output depends on besides the topic, set by the nodes that scope semantic cache entries
+        self.scope = None
+        self.key = content_hash(name, STAGE_VERSIONS.get(name, 1), inputs, [dep.key for dep in self.deps])
+        self._evaluated = False
+        self._value = None
+        # Set when the output, or an input's, was cut short by the run's deadline
+        self.partial = False
+
+    def is_cached(self):
+        if self.name in self.pipeline.force:
+            return False
+        if self.codec == "faiss":
+            return os.path.isdir(self.pipeline.index_dir(self.key))
+        if self.output_suffix and not os.path.exists(self.output_path()):
+            return False
+        return self.pipeline.store.has(self.name, self.key)
+
+    def output_path(self):
+        return self.pipeline.store.path(self.name, self.key, self.output_suffix)
+
+    def value(self):
+        if not self._evaluated:
+            self._value = self.pipeline.evaluate(self) if self.compute else None
+            self._evaluated = True
+        return self._value
+
+    def peek(self):
+        """Return the output if it was already computed or is cached, without computing it."""
+        if self._evaluated or self.is_cached():
+            return self.value()
+        return None
+
+    def release(self):
+        """Drop the output and the compute closure (which may hold raw source content); the key stays valid."""
+        self.compute = None
+        self._value = None
+        self._evaluated = False
+
+class PipelineResult:
+    """Outcome of a pipeline run."""
+
+    def __init__(self, mode, topic):
+        self.mode = mode
+        self.topic = topic
+        self.paper = None
+        self.context = None
+        self.sources_ok = []
+        self.sources_failed = []
+        self.executed = []
+        self.skipped = []
+        # What a run with a time budget skipped, truncated or degraded: [{"action", "item", "reason", "at"}]
+        self.degraded = []
+
+def _print_log(level, message):
+    print(message)
+
+class Pipeline:
+    """Runs the research pipeline for one mode, reusing cached stage outputs whenever inputs are unchanged."""
+
+    def __init__(self, mode="standard", cache_dir=CACHE_DIR, force=(), k=10, output_file=OUTPUT_FILE,
+                 log=None, progress=None, bounded=False, max_rss_mb=None, batch_size=256, pdf_backend="auto",
+                 summarize=False, summary_workers=8, semantic_cache=True, search_sources=(), deadline=None,
+                 mmr_lambda=DEFAULT_LAMBDA, per_source=None, journal_mode=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Choose one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.settings = MODES[mode]
+        self.store = ArtifactStore(cache_dir)
+        self.force = set(STAGES) if force is True else set(force or ())
+        self.k = k
+        self.output_file = output_file
+        self.log = log or _print_log
+        self.progress = progress
+        self.bounded = bounded
+        self.guard = spill.MemoryGuard(max_rss_mb, batch_size) if bounded else None
+        # Chunk views point into the extract stage's text files
+        self.texts = TextStore(os.path.join(cache_dir, "extract")) if bounded else None
+        if pdf_backend != "auto":
+            get_backend(pdf_backend)
+        self.pdf_backend = pdf_backend
+        self.summarize = summarize
+        self.summary_workers = summary_workers
+        # Glob patterns restricting retrieval to some sources' shards
+        self.search_sources = list(search_sources or ())
+        # Relevance weight of the MMR context packing, and the most chunks retrieved from any one source
+        self.mmr_lambda = mmr_lambda
+        self.per_source = per_source
+        # Seconds each run may take; the Deadline tracking it lives in _deadline while a run is active
+        self.deadline = deadline
+        self._deadline = None
+        # SQLite journal of the catalog and semantic cache; "delete" on a cache shared across hosts (see catalog.py)
+        self.semantic = SemanticCache(semantic_cache_path(cache_dir), journal_mode=journal_mode) if semantic_cache else None
+        self._topic_vectors = {}
+        self.catalog = SourceCatalog(catalog_path(cache_dir), journal_mode=journal_mode)
+        self._extraction = {}
+        self._generator = None
+        self._result = None
+
+    @property
+    def generator(self):
+        if self._generator is None:
+            self._generator = load_generator(self.mode)
+        return self._generator
+
+    def index_dir(self, key):
+        return os.path.join(self.store.root, "index", key[:2], key)
+
+    def evaluate(self, node):
+        """Return a node's output from the cache, or compute it from its dependencies and store it."""
+        if node.is_cached():
+            value = self._load(node)
+            if value is not None:
+                record_cache(f"pipeline.{node.name}", True)
+                self._result.skipped.append(node.name)
+                return value
+        record_cache(f"pipeline.{node.name}", False)
+
+        truncations = self._deadline.truncations if self._deadline is not None else 0
+        inputs = list(node.deps) if node.lazy else [dep.value() for dep in node.deps]
+        if not node.lazy and any(value is None for value in inputs):
+            return None
+        if node.output_suffix:
+            inputs.insert(0, node.output_path())
+        if node.name in _SPANNED_STAGES:
+            with span(node.name) as s:
+                value = node.compute(*inputs)
+                if isinstance(value, list):
+                    s.set(chunks=len(value))
+                elif isinstance(value, dict) and "chunks" in value:
+                    s.set(chunks=value["chunks"])
+        else:
+            value = node.compute(*inputs)
+
+        node.partial = any(dep.partial for dep in node.deps) or (
+            self._deadline is not None and self._deadline.truncations != truncations)
+        # A None output marks a failure and is never cached, so the stage is retried next run.
+        # Output cut short by the deadline is used for this run only.
+        if value is not None:
+            if not node.partial:
+                self._save(node, value)
+            self._result.executed.append(node.name)
+        return value
+
+    def _load(self, node):
+        if node.codec == "faiss":
+            from langchain_community.vectorstores import FAISS
+            try:
+                return FAISS.load_local(self.index_dir(node.key), self.generator.embedding,
+                                        allow_dangerous_deserialization=True)
+            except Exception as e:
+                self.log("warning", f"⚠️ Rebuilding unreadable index cache: {e}")
+                return None
+        return self.store.load(node.name, node.key)
+
+    def _save(self, node, value):
+        if node.codec == "faiss":
+            value.save_local(self.index_dir(node.key))
+        else:
+            self.store.save(node.name, node.key, value)
+
+    def _source_nodes(self, kind, location, html=None, content=None):
+        """Fetch a source and declare its extract and split nodes. Returns the split node or None.
+
+        Pass html for a web page that has already been downloaded, e.g. by the crawler.
+        Pass content, the content hash of a page from an earlier run, to reuse its cached
+        chunks without downloading it; None is returned if they are no longer cached.
+        """
+        # Forcing the fetch stage ignores what the catalog knows about the source
+        known = self.catalog.get(location) if "fetch" not in self.force and html is None and content is None else None
+        details = {}
+        if kind == "pdf":
+            self.log("info", f"📄 Processing PDF: {location}")
+            if not os.path.exists(location):
+                self.log("error", f"❌ PDF file not found: {location}")
+                self.catalog.record_failure(location, kind, "file not found")
+                return None
+            stat = os.stat(location)
+            details = {"size_bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if known and known["content_hash"] and (known["size_bytes"], known["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                # Same size and modification time as the last ingest, so skip rereading the file to hash it
+                content = known["content_hash"]
+            else:
+                with span("fetch", source=location, bytes=stat.st_size):
+                    content = file_hash(location)
+
+            def extract_pdf(path=None):
+                backend = resolve_backend(location, self.pdf_backend).name
+                if path:
+                    return _spilled(path, chars=spill.extract_pdf_to_file(location, path, self.guard, backend)), backend
+                return extract_text_from_pdf(location, backend) or None, backend
+
+            if self.bounded:
+                extract = Node(self, "extract",
+                               {"kind": kind, "content": content, "backend": self.pdf_backend, "format": "spill"},
+                               lambda path: self._timed_extract(location, lambda: extract_pdf(path)),
+                               output_suffix=".txt")
+            else:
+                extract = Node(self, "extract", {"kind": kind, "content": content, "backend": self.pdf_backend},
+                               lambda: self._timed_extract(location, extract_pdf))
+        else:
+            if content is None:
+                self.log("info", f"🌐 Processing website: {location}")
+            if html is None and content is None and self._deadline is not None and self._deadline.ingest_expired():
+                # No time left to ask the site whether the page changed, so fall back to the copy from the last ingest
+                split = self._source_nodes(kind, location, content=known["content_hash"]) \
+                    if known and known["content_hash"] else None
+                if split is not None:
+                    self._deadline.degrade(location, "not checked for changes, reused the cached copy")
+                    return split
+                self._deadline.skip(location, "ingestion time budget spent before it was fetched")
+                return None
+            if html is None and content is None:
+                try:
+                    if known and known["content_hash"] and (known["etag"] or known["last_modified"]):
+                        html, etag, modified = fetch_url_if_modified(location, known["etag"], known["last_modified"])
+                        if html is None:
+                            # 304 Not Modified: reuse the cached chunks, or download the page if they are gone
+                            split = self._source_nodes(kind, location, content=known["content_hash"])
+                            if split is not None:
+                                return split
+                            html, etag, modified = fetch_url_if_modified(location)
+                    else:
+                        html, etag, modified = fetch_url_if_modified(location)
+                except Exception as e:
+                    self.log("error", f"❌ Error processing website {location}: {e}")
+                    self.catalog.record_failure(location, kind, e)
+                    if self._deadline is not None and "Timeout" in type(e).__name__:
+                        self._deadline.skip(location, "fetch timed out within the time budget")
+                    return None
+                details = {"etag": etag, "last_modified": modified}
+            if html is not None:
+                details["size_bytes"] = len(html.encode("utf-8"))
+            content = content or content_hash(html)
+            if self.bounded:
+                extract = Node(self, "extract", {"kind": kind, "content": content, "format": "spill"},
+                               lambda path: self._timed_extract(location, lambda: (
+                                   _spilled(path, chars=spill.write_text_file(_html_text_or_none(html, location), path)),
+                                   "html.parser")),
+                               output_suffix=".txt")
+            else:
+                extract = Node(self, "extract", {"kind": kind, "content": content},
+                               lambda: self._timed_extract(location, lambda: (_html_text_or_none(html, location), "html.parser")))
+
+        if self.bounded:
+            split = Node(self, "split", {"source": location, "format": "view"},
+                         lambda path, text: _spilled(path, chunks=spill.split_file_to_jsonl(
+                             text["path"], path, location, extract.key, guard=self.guard)),
+                         deps=[extract], output_suffix=".jsonl")
+        else:
+            split = Node(self, "split", {"source": location},
+                         lambda text: _split_source(text, location), deps=[extract])
+        # Index shards are routed by the source they were split from
+        split.source = location
+        label = "PDF" if kind == "pdf" else "Website"
+        if html is None and kind == "url" and not split.is_cached():
+            return None
+        if split.is_cached():
+            self.log("info", f"⏭️ {label} unchanged, reusing cached text: {location}")
+            self.catalog.record(location, kind, content, **details)
+        elif self._deadline is not None and self._over_budget(location, known):
+            extract.release()
+            return None
+        elif split.value():
+            chars = extract.value()["chars"] if self.bounded else len(extract.value())
+            chunks = split.value()["chunks"] if self.bounded else len(split.value())
+            self.log("success", f"✅ {label} processed successfully. Extracted {chars} characters.")
+            extraction = self._extraction.pop(location, {})
+            # Text cut short by the deadline says nothing about the source's size or extraction time
+            if not split.partial:
+                self.catalog.record(location, kind, content, chars=chars, chunks=chunks, **details, **extraction)
+        else:
+            self.log("error", f"❌ No text extracted from {'PDF' if kind == 'pdf' else 'URL'}: {location}")
+            self.catalog.record_failure(location, kind, "no text extracted")
+            return None
+        # Nothing downstream needs the raw or extracted text once the split is stored
+        extract.release()
+        if self.bounded:
+            # Parsed HTML and PDF layouts are full of reference cycles; free them before the next source
+            gc.collect()
+            self.guard.check("fetch")
+        return split
+
+    def _over_budget(self, location, known):
+        """Skip a source that still has to be extracted if the ingestion budget is spent, or if its last extraction took longer than what is left."""
+        left = self._deadline.ingest_remaining()
+        if left <= 0:
+            self._deadline.skip(location, "ingestion time budget spent before it was extracted")
+            return True
+        last = known["extract_seconds"] if known else None
+        if last and last > left:
+            self._deadline.skip(location, f"its last extraction took {last:.1f}s, only {left:.1f}s left")
+            return True
+        return False
+
+    def _timed_extract(self, location, extract):
+        """Run extract(), which returns (value, backend name), and keep the backend and timing for the catalog."""
+        start = time.perf_counter()
+        value, backend = extract()
+        self._extraction[location] = {"backend": backend, "extract_seconds": round(time.perf_counter() - start, 4)}
+        return value
+
+    def _crawl_nodes(self, spec):
+        """Crawl a site and declare extract and split nodes for each page as it arrives. Returns the split nodes."""
+        options = crawl_options(spec)
+        start_url = options["start_url"]
+        self.log("info", f"🕸️ Crawling {start_url} (depth {options['max_depth']}, up to {options['max_pages']} pages)")
+        split_nodes = []
+        pages = iter_crawl(**options)
+        try:
+            while True:
+                page = next(pages)
+                if self._deadline is not None and self._deadline.ingest_expired():
+                    self._deadline.truncate(start_url, f"crawl stopped after {len(split_nodes)} pages")
+                    break
+                node = self._source_nodes("url", page.url, html=page.html)
+                if node is not None:
+                    split_nodes.append(node)
+                if self.progress:
+                    self.progress(min(1.0, len(split_nodes) / options["max_pages"]),
+                                  f"Crawled {len(split_nodes)} pages from {start_url}")
+        except StopIteration as stop:
+            stats = stop.value or {}
+            self.log("success" if split_nodes else "error",
+                     f"{'✅' if split_nodes else '❌'} Crawl of {start_url} finished: {len(split_nodes)} pages with text, "
+                     f"{stats.get('failed', 0)} failed, {stats.get('blocked', 0)} blocked by robots.txt")
+        except Exception as e:
+            self.log("error", f"❌ Error crawling {start_url}: {e}")
+        finally:
+            pages.close()
+        return split_nodes
+
+    def _feed_nodes(self, spec):
+        """Expand a sitemap or feed and declare nodes for its pages. Returns the split nodes.
+
+        Pages not modified since the feed's last successful ingest reuse their cached
+        chunks without being downloaded; the others are fetched concurrently.
+        """
+        options = feed_options(spec)
+        feed_url = options["url"]
+        state_key = content_hash(feed_url)
+        state = self.store.load("feeds", state_key) or {}
+        last_ingest = parse_date(state.get("ingested_at"))
+        known = state.get("pages", {})
+        started = datetime.now(timezone.utc)
+
+        self.log("info", f"📰 Expanding feed: {feed_url}")
+        try:
+            since = parse_date(options["since"])
+            entries = filter_entries(expand_feed(feed_url, since), options["include"], options["exclude"],
+                                     since, options["max_entries"])
+        except Exception as e:
+            self.log("error", f"❌ Error reading feed {feed_url}: {e}")
+            return []
+
+        split_nodes = []
+        pages = {}
+        to_fetch = []
+        for entry in entries:
+            content = known.get(entry.url)
+            unchanged = content and last_ingest and entry.lastmod and entry.lastmod <= last_ingest
+            node = self._source_nodes("url", entry.url, content=content) if unchanged else None
+            if node is not None:
+                split_nodes.append(node)
+                pages[entry.url] = content
+            else:
+                to_fetch.append(entry.url)
+        reused = len(split_nodes)
+
+        if to_fetch:
+            self.log("info", f"🌐 Fetching {len(to_fetch)} new or updated pages from {feed_url}")
+        for position, (url, html, error) in enumerate(iter_fetched(to_fetch, fetch_url, options["concurrency"]), start=1):
+            if self._deadline is not None and self._deadline.ingest_expired():
+                self._deadline.truncate(feed_url, f"{len(to_fetch) - position + 1} pages not ingested in time")
+                break
+            if error:
+                self.log("error", f"❌ Error processing website {url}: {error}")
+                continue
+            node = self._source_nodes("url", url, html=html)
+            if node is not None:
+                split_nodes.append(node)
+                pages[url] = content_hash(html)
+            if self.progress:
+                self.progress(position / len(to_fetch), f"Fetched {position}/{len(to_fetch)} pages from {feed_url}")
+
+        self.store.save("feeds", state_key, {"ingested_at": started.isoformat(), "pages": pages})
+        self.log("success" if split_nodes else "error",
+                 f"{'✅' if split_nodes else '❌'} Feed {feed_url}: {len(entries)} entries, "
+                 f"{reused} unchanged since the last ingest, {len(split_nodes) - reused} fetched")
+        return split_nodes
+
+    def ingest(self, kind, location):
+        """Extract and split one source into the cache ahead of a run. Returns True if it produced text.
+
+        kind is "pdf" or "url", or "crawl" or "feed" with the crawl or feed spec as location.
+        """
+        self._result = PipelineResult(self.mode, None)
+        if kind == "crawl":
+            return bool(self._crawl_nodes(location))
+        if kind == "feed":
+            return bool(self._feed_nodes(location))
+        return self._source_nodes(kind, location) is not None
+
+    def _ingest_sources(self, sources, result):
+        """Declare and evaluate the per-source nodes of every source. Returns the split nodes that have text."""
+        source_list = [("pdf", path) for path in sources.get("pdfs", [])]
+        source_list += [("url", url) for url in sources.get("urls", [])]
+        split_nodes = []
+        for position, (kind, location) in enumerate(source_list, start=1):
+            node = self._source_nodes(kind, location)
+            if node is not None:
+                split_nodes.append(node)
+                result.sources_ok.append(location)
+            elif self._deadline is None or location not in self._deadline.skipped:
+                result.sources_failed.append(location)
+            if self.progress:
+                self.progress(position / len(source_list), f"Processed {position}/{len(source_list)} sources")
+
+        for spec in sources.get("crawl", []):
+            nodes = self._crawl_nodes(spec)
+            split_nodes.extend(nodes)
+            (result.sources_ok if nodes else result.sources_failed).append(crawl_options(spec)["start_url"])
+        for spec in sources.get("feeds", []):
+            nodes = self._feed_nodes(spec)
+            split_nodes.extend(nodes)
+            (result.sources_ok if nodes else result.sources_failed).append(feed_options(spec)["url"])
+        return split_nodes
+
+    @contextmanager
+    def _time_budget(self):
+        """Track the run's deadline, if it has one, and restore the settings it degraded afterwards."""
+        if not self.deadline:
+            yield None
+            return
+        saved = self.mode, self.settings, self._generator, self.k
+        self._deadline = Deadline(self.deadline)
+        try:
+            with self._deadline.activate():
+                yield self._deadline
+        finally:
+            self.mode, self.settings, self._generator, self.k = saved
+            self._topic_vectors = {}
+            self._deadline = None
+
+    def _report_deadline(self, results):
+        """Log what the deadline dropped and record it, with the mode actually used, on every result."""
+        deadline = self._deadline
+        for result in results:
+            result.mode = self.mode
+            result.degraded = list(deadline.dropped)
+        for entry in deadline.dropped:
+            self.log("warning", f"⏱️ {entry['action'].capitalize()} {entry['item']}: {entry['reason']}")
+        summary = f"⏱️ Finished in {deadline.elapsed():.1f}s of the {deadline.seconds:g}s time budget"
+        if deadline.dropped:
+            summary += f", {len(deadline.dropped)} {'cut' if len(deadline.dropped) == 1 else 'cuts'} made to fit"
+        self.log("info", summary)
+
+    def run(self, sources, generate=True):
+        """Run every stage needed to produce the paper for sources and save it to the output file.
+
+        With generate=False the run stops after retrieval, leaving the context in result.context.
+        """
+        with self._time_budget() as deadline:
+            result = self._run(sources, generate)
+            if deadline is not None:
+                self._report_deadline([result])
+        return result
+
+    def _run(self, sources, generate):
+        topic = sources["topic"]
+        label = self.settings["label"]
+        self._result = result = PipelineResult(self.mode, topic)
+
+        self.log("info", f"🚀 Starting Research Assistant AI{f' ({label})' if label else ''}...")
+        self.log("info", f"📝 Topic: {topic}")
+
+        split_nodes = self._ingest_sources(sources, result)
+        if not split_nodes:
+            self.log("error", "❌ No text extracted from sources. Please check your inputs.")
+            return result
+
+        dedupe, shards = self._corpus_nodes(split_nodes)
+        if self._deadline is not None:
+            dedupe, shards = self._fit_deadline(dedupe, shards, split_nodes)
+        retrieve = self._context_node(dedupe, shards, topic)
+
+        if not generate:
+            result.context = retrieve.value()
+            return result
+
+        generation = self._generation_node(retrieve, topic)
+        if generation.is_cached():
+            self.log("info", "⏭️ Sources, topic and mode unchanged, reusing the cached research paper.")
+        else:
+            self._log_corpus_work(dedupe, shards)
+            self.log("info", "📝 Generating research paper...")
+
+        paper = generation.value()
+        if not paper:
+            self.log("error", "❌ Research paper generation failed.")
+            return result
+
+        result.paper = paper
+        # A paper reused for a similar topic never needed this topic's context, so it is not computed for the result
+        result.context = retrieve.peek()
+        self.generator.save_to_markdown(paper, self.output_file)
+        self.log("success", f"✅ Research paper saved as {self.output_file}")
+        return result
+
+    def run_topics(self, sources, topics, max_workers=4):
+        """Write one paper per topic from a single ingestion and index build. Returns {topic: PipelineResult}.
+
+        Sources are extracted, embedded and indexed once. Retrieval then runs per
+        topic against the shared index, and the papers are generated concurrently,
+        each saved to its own file (see topic_output_file). A deadline covers all
+        the topics together.
+        """
+        with self._time_budget() as deadline:
+            results = self._run_topics(sources, topics, max_workers)
+            if deadline is not None:
+                self._report_deadline(results.values())
+        return results
+
+    def _run_topics(self, sources, topics, max_workers):
+        label = self.settings["label"]
+        self._result = shared = PipelineResult(self.mode, None)
+        self.log("info", f"🚀 Starting Research Assistant AI{f' ({label})' if label else ''}...")
+        self.log("info", f"📝 {len(topics)} topics: {'; '.join(topics)}")
+
+        results = {}
+        for topic in topics:
+            results[topic] = PipelineResult(self.mode, topic)
+            results[topic].sources_ok = shared.sources_ok
+            results[topic].sources_failed = shared.sources_failed
+            results[topic].executed = shared.executed
+            results[topic].skipped = shared.skipped
+
+        split_nodes = self._ingest_sources(sources, shared)
+        if not split_nodes:
+            self.log("error", "❌ No text extracted from sources. Please check your inputs.")
+            return results
+
+        dedupe, shards = self._corpus_nodes(split_nodes)
+        if self._deadline is not None:
+            dedupe, shards = self._fit_deadline(dedupe, shards, split_nodes)
+        self._log_corpus_work(dedupe, shards)
+        # Build the shared stages before fanning out, so concurrent topics never race to compute them
+        for _, index, _ in shards or [(None, dedupe, None)]:
+            index.value()
+
+        contexts = {topic: self._context_node(dedupe, shards, topic) for topic in topics}
+        generations = {topic: self._generation_node(contexts[topic], topic) for topic in topics}
+
+        self.log("info", f"📝 Generating {len(topics)} research papers...")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(topics)))) as executor:
+            # Each worker runs in a copy of this context so its spans reach the active tracer
+            futures = {topic: executor.submit(contextvars.copy_context().run, node.value)
+                       for topic, node in generations.items()}
+            for topic, future in futures.items():
+                paper = future.result()
+                if not paper:
+                    self.log("error", f"❌ Research paper generation failed for topic: {topic}")
+                    continue
+                output_file = topic_output_file(self.output_file, topic)
+                results[topic].paper = paper
+                results[topic].context = contexts[topic].peek()
+                self.generator.save_to_markdown(paper, output_file)
+                self.log("success", f"✅ Research paper on '{topic}' saved as {output_file}")
+        return results
+
+    def _corpus_nodes(self, split_nodes):
+        """Declare the topic-independent nodes. Returns (dedupe, shards).
+
+        shards lists (source, index node, split node) for every source, or is
+        None in modes without retrieval. Chunks repeated across sources are
+        dropped when the shards' results are merged rather than before indexing.
+        """
+        if self.bounded:
+            return self._bounded_corpus_nodes(split_nodes)
+        dedupe = Node(self, "dedupe", None,
+                      lambda *chunk_lists: dedupe_chunks([chunk for chunks in chunk_lists for chunk in chunks]),
+                      deps=split_nodes)
+        if not self.settings["retrieval"] or self.summarize:
+            return dedupe, None
+
+        embedding = self.generator.embedding
+        shards = []
+        for split in split_nodes:
+            embed = Node(self, "embed", {"model": embedding_id(embedding)},
+                         lambda chunks: embedding.embed_documents([chunk["text"] for chunk in chunks]),
+                         deps=[split])
+            index = Node(self, "index", None, _build_index(embedding), deps=[split, embed], codec="faiss")
+            shards.append((split.source, index, split))
+        return dedupe, shards
+
+    def _bounded_corpus_nodes(self, split_nodes):
+        """Declare the streaming counterparts of _corpus_nodes, which pass file paths instead of values."""
+        guard = self.guard
+        dedupe = Node(self, "dedupe", {"format": "spill"},
+                      lambda path, *splits: _spilled(path, chunks=spill.dedupe_jsonl([split["path"] for split in splits], path, self.texts, guard)),
+                      deps=split_nodes, output_suffix=".jsonl")
+        if not self.settings["retrieval"] or self.summarize:
+            return dedupe, None
+
+        embedding = self.generator.embedding
+
+        def embed_chunks(path, chunks):
+            count, dims = spill.embed_jsonl(chunks["path"], path, embedding, guard, self.texts)
+            return _spilled(path, chunks=count, dims=dims)
+
+        def build_index(path, vectors):
+            spill.build_index_from_vectors(vectors["path"], vectors["chunks"], vectors["dims"], path, guard)
+            return _spilled(path, chunks=vectors["chunks"])
+
+        shards = []
+        for split in split_nodes:
+            embed = Node(self, "embed", {"model": embedding_id(embedding), "format": "spill"}, embed_chunks,
+                         deps=[split], output_suffix=".f32")
+            index = Node(self, "index", {"format": "spill"}, build_index, deps=[embed], output_suffix=".faiss")
+            shards.append((split.source, index, split))
+        return dedupe, shards
+
+    def _fit_deadline(self, dedupe, shards, split_nodes):
+        """Cut indexing, retrieval depth and the generator down to what fits in the rest of the time budget. Returns (dedupe, shards)."""
+        deadline = self._deadline
+        if shards is None:
+            if self.mode == "enhanced" and deadline.short():
+                deadline.degrade("generator", "switched from the enhanced to the simple generator")
+                return self._switch_to_simple(split_nodes)
+            return dedupe, shards
+
+        pending = sum(not index.is_cached() for _, index, _ in shards)
+        if pending and deadline.ingest_expired():
+            deadline.degrade("retrieval", f"no time to index {pending} sources, switched to the simple generator")
+            return self._switch_to_simple(split_nodes)
+        # Index within the ingestion budget; sources it cannot cover are left out of retrieval
+        self._log_corpus_work(dedupe, shards)
+        kept = []
+        for shard in shards:
+            source, index, _ = shard
+            if not index.is_cached():
+                if deadline.ingest_expired():
+                    deadline.degrade(source, "not indexed in time, left out of retrieval")
+                    continue
+                index.value()
+            kept.append(shard)
+        if not kept:
+            deadline.degrade("retrieval", "no source indexed in time, switched to the simple generator")
+            return self._switch_to_simple(split_nodes)
+
+        if deadline.short() and self.k > MIN_K:
+            k = max(MIN_K, self.k // 2)
+            deadline.degrade("retrieval depth", f"lowered from {self.k} to {k} chunks")
+            self.k = k
+        return dedupe, kept
+
+    def _switch_to_simple(self, split_nodes):
+        """Continue the run with the simple generator, which needs no embeddings. Returns its (dedupe, shards)."""
+        self.mode = "simple"
+        self.settings = MODES["simple"]
+        self._generator = None
+        # Topic vectors came from the previous mode's embedder
+        self._topic_vectors = {}
+        return self._corpus_nodes(split_nodes)
+
+    def _log_corpus_work(self, dedupe, shards):
+        if shards is None:
+            if not dedupe.is_cached():
+                self.log("info", "🔧 Preparing documents...")
+            return
+        new = sum(not index.is_cached() for _, index, _ in shards)
+        if new:
+            self.log("info", f"🗄️ Indexing {new} new or changed of {len(shards)} sources...")
+
+    def _context_node(self, dedupe, shards, topic):
+        """Declare the node that produces the generation context for one topic: a digest or retrieved chunks."""
+        if self.summarize:
+            return self._summarize_node(dedupe, topic)
+        return self._retrieve_node(dedupe, shards, topic)
+
+    def _summarize_node(self, dedupe, topic):
+        """Declare the node that condenses the whole deduplicated corpus into a digest for one topic."""
+        llm = self.generator.llm
+        inputs = {"topic": topic, "model": llm_id(llm), "prompts": summarize.PROMPT_VERSION,
+                  "map_chars": summarize.MAP_CHARS, "digest_chars": summarize.DIGEST_CHARS}
+
+        def digest(chunks):
+            self.log("info", "🧾 Summarizing the corpus...")
+            summarizer = summarize.Summarizer(llm, self.store, llm_id(llm), self.summary_workers,
+                                              refresh="summarize" in self.force)
+            text = summarizer.digest(spill.iter_chunks(chunks["path"], self.texts) if self.bounded else chunks, topic)
+            self.log("info", f"🧾 Digest built from {summarizer.calls} new and {summarizer.cached} cached summaries")
+            return [text] if text else None
+
+        node = Node(self, "summarize", inputs, digest, deps=[dedupe])
+        node.scope = content_hash("summarize", dedupe.key, {name: value for name, value in inputs.items() if name != "topic"})
+        return node
+
+    def _retrieve_node(self, dedupe, shards, topic):
+        """Declare the node that selects the context for one topic, searching only the shards of search_sources."""
+        if shards is None:
+            if self.bounded:
+                node = Node(self, "retrieve", {"context_chars": CONTEXT_CHARS, "format": "spill"},
+                            lambda chunks: spill.read_leading_chunks(chunks["path"], CONTEXT_CHARS, self.texts), deps=[dedupe])
+            else:
+                node = Node(self, "retrieve", {"context_chars": CONTEXT_CHARS},
+                            lambda chunks: _leading_chunks(chunks, CONTEXT_CHARS), deps=[dedupe])
+            # The leading chunks do not depend on the topic, so the node's key is its scope
+            node.scope = node.key
+            return node
+        # One shard per source, even if the source was listed twice
+        by_source = {source: (index, split) for source, index, split in shards}
+        selected = select_sources(by_source, self.search_sources)
+        if not selected:
+            self.log("error", f"❌ No source matches --search-source {' '.join(self.search_sources)}")
+        indexes = [by_source[source][0] for source in selected]
+        scope = content_hash([index.key for index in indexes], self.k, self.mmr_lambda, self.per_source)
+        packing = {"k": self.k, "mmr_lambda": self.mmr_lambda, "per_source": self.per_source}
+
+        if self.bounded:
+            def search(*values):
+                dbs, splits = values[:len(selected)], values[len(selected):]
+                return ShardRouter({
+                    source: lambda vector, k, db=db, chunks=chunks: spill.search_index(
+                        db["path"], chunks["path"], vector, k, self.texts)
+                    for source, db, chunks in zip(selected, dbs, splits)})
+
+            deps = indexes + [by_source[source][1] for source in selected]
+            inputs = {"topic": topic, **packing, "format": "spill"}
+        else:
+            def search(*dbs):
+                return ShardRouter({
+                    source: lambda vector, k, db=db: _faiss_hits(db, vector, k)
+                    for source, db in zip(selected, dbs)})
+
+            deps = indexes
+            inputs = {"topic": topic, **packing}
+
+        def pack(router, vector):
+            candidates = router.candidates(vector, self.k * CANDIDATES_PER_CHUNK)
+            return pack_context(vector, candidates, self.k, self.mmr_lambda, self.per_source) or None
+
+        node = Node(self, "retrieve", inputs,
+                    lambda *values: self._semantic("retrieval", scope, topic,
+                                                   lambda vector: pack(search(*values), vector), "retrieve"),
+                    deps=deps)
+        node.scope = scope
+        return node
+
+    def _topic_vector(self, topic):
+        """Embed a topic with the mode's embedding model, or lexically in modes without one. Returns (embedder, vector)."""
+        if topic not in self._topic_vectors:
+            if self.settings["retrieval"]:
+                embedding = self.generator.embedding
+                self._topic_vectors[topic] = embedding_id(embedding), embedding.embed_query(topic)
+            else:
+                self._topic_vectors[topic] = "lexical", lexical_embedding(topic)
+        return self._topic_vectors[topic]
+
+    def _semantic(self, kind, scope, topic, compute, stage):
+        """Return a cached value stored for a similar topic in the same scope, or compute(topic vector) and store it."""
+        embedder, vector = self._topic_vector(topic)
+        if self.semantic is None or stage in self.force:
+            return compute(vector)
+        hit = self.semantic.lookup(kind, scope, embedder, vector)
+        if hit is not None:
+            value, similarity, matched = hit
+            self.log("info", f"♻️ Reusing the {kind} for the similar topic '{matched}' (similarity {similarity:.2f})")
+            return value
+        value = compute(vector)
+        # A run that dropped something for its deadline answered a narrower question than its scope describes
+        if value and not (self._deadline is not None and self._deadline.dropped):
+            self.semantic.store(kind, scope, embedder, topic, vector, value)
+        return value
+
+    def _generation_node(self, context_node, topic):
+        """Declare the node that writes the paper, checking for a similar topic's paper before building the context.
+
+        The paper is shared by similar topics whose context comes from the same
+        place: the same searched indexes and retrieval settings, or the same digest
+        settings over the same corpus, in the same mode.
+        """
+        scope = content_hash(self.mode, context_node.scope)
+
+        def generate(vector):
+            context = context_node.value()
+            return self._generate_paper(context, topic) if context is not None else None
+
+        return Node(self, "generate", {"topic": topic, "mode": self.mode},
+                    lambda context_node: self._semantic("paper", scope, topic, generate, "generate"),
+                    deps=[context_node], lazy=True)
+
+    def _generate_paper(self, context, topic):
+        """Write the paper for a context, updating only the changed sections of the previous paper when possible."""
+        manifest_key = content_hash(self.mode, topic)
+        previous = self.store.load("sections", manifest_key)
+        paper = None
+        if previous and previous.get("version") == sections.MANIFEST_VERSION and not self.summarize \
+                and "generate" not in self.force:
+            paper = self._update_sections(previous, context, topic)
+        if paper is None:
+            paper = self._generate(" ".join(context), topic)
+        if paper:
+            self.store.save("sections", manifest_key, sections.build_manifest(topic, self.mode, paper, context))
+        return paper
+
+    def _update_sections(self, manifest, context, topic):
+        """Rewrite the sections of the previous paper whose evidence changed. Returns None to fall back to a full generation."""
+        parts, changed, evidence, unmatched = sections.changed_sections(manifest, context)
+        if len(parts) < 2 or [part["heading"] for part in parts] != [entry["heading"] for entry in manifest["sections"]]:
+            return None
+        if unmatched:
+            self.log("info", f"📝 {unmatched} new chunks match no section, regenerating the whole paper...")
+            return None
+        if not changed:
+            self.log("info", "⏭️ No section's evidence changed, keeping the previous paper.")
+            return manifest["paper"]
+        if len(changed) > sections.MAX_CHANGED_FRACTION * len(parts):
+            self.log("info", f"📝 {len(changed)} of {len(parts)} sections changed, regenerating the whole paper...")
+            return None
+
+        self.log("info", f"♻️ Rewriting {len(changed)} of {len(parts)} sections whose evidence changed...")
+        outline = "\n".join(f"- {part['heading'] or '(title and opening)'}" for part in parts)
+        llm = self.generator.llm
+
+        def rewrite(position):
+            prompt = sections.section_prompt(topic, outline, parts[position], evidence[position])
+            with span("llm_call", bytes=len(prompt), section=parts[position]["heading"]) as s:
+                content = llm.invoke(prompt).content
+                s.set(response_chars=len(content))
+            return sections.normalize_section(content, parts[position])
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(changed)) as executor:
+                # Each rewrite runs in a copy of this context so its spans reach the active tracer
+                futures = [executor.submit(contextvars.copy_context().run, rewrite, position) for position in changed]
+                rewritten = [future.result() for future in futures]
+        except Exception as e:
+            self.log("warning", f"⚠️ Section update failed ({e}), regenerating the whole paper.")
+            return None
+        for position, text in zip(changed, rewritten):
+            parts[position] = {"heading": parts[position]["heading"], "text": text}
+        return sections.join_sections(parts)
+
+    def _generate(self, context_text, topic):
+        try:
+            return self.generator.generate_research_paper(context_text, topic)
+        except Exception as e:
+            self.log("error", f"❌ Error generating research paper: {e}")
+            return None
+
+def topic_output_file(output_file, topic):
+    """Derive a per-topic output file name, e.g. research_paper_future-of-solar-power.md."""
+    stem, extension = os.path.splitext(output_file)
+    slug = re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")[:60] or content_hash(topic)[:12]
+    return f"{stem}_{slug}{extension or '.md'}"
+
+def _spilled(path, **counts):
+    """Describe a file written by a bounded stage, or return None if the stage produced nothing."""
+    if not counts.get("chars") and not counts.get("chunks"):
+        return None
+    return {"path": path, **counts}
+
+def _html_text_or_none(html, url):
+    try:
+        return extract_text_from_html(html, source=url)
+    except Exception as e:
+        print(f"Error extracting text from URL {url}: {str(e)}")
+        return None
+
+def _split_source(text, location):
+    docs = prepare_documents(text, {"source": location})
+    return [{"text": doc.page_content, "source": location} for doc in docs] or None
+
+def _build_index(embedding):
+    def build(chunks, vectors):
+        from langchain_community.vectorstores import FAISS
+        texts = [chunk["text"] for chunk in chunks]
+        metadatas = [{"source": chunk["source"]} for chunk in chunks]
+        return FAISS.from_embeddings(list(zip(texts, vectors)), embedding, metadatas=metadatas)
+    return build
+
+def _faiss_hits(db, vector, k):
+    """Search a LangChain FAISS store. Returns [(distance, text, vector)], nearest first."""
+    import numpy as np
+    distances, ids = db.index.search(np.asarray([vector], dtype="float32"), k)
+    return [(float(distance), db.docstore.search(db.index_to_docstore_id[i]).page_content, db.index.reconstruct(int(i)))
+            for distance, i in zip(distances[0], ids[0]) if i >= 0]
+
+def _leading_chunks(chunks, max_chars):
+    selected = []
+    total = 0
+    for chunk in chunks:
+        if total >= max_chars:
+            break
+        selected.append(chunk["text"])
+        total += len(chunk["text"]) + 1
+    return selected
@@ -0,0 +1,234 @@
+"""
+Run profiling for Research Assistant AI
+With --profile (or the profiling toggle in the web interface) the run's tracer
+carries a RunProfiler, and every instrumented span becomes a profiling stage:
+
+    cProfile    one profile per stage (fetch, pdf_parse, split, embed, ...), plus
+                "run" for the code outside any span, switched as spans open and
+                close in each thread
+    sampling    the stacks of the threads inside a stage are sampled every
+                SAMPLE_INTERVAL seconds and written as collapsed stacks, with
+                the stage as the root frame (flamegraph.pl, speedscope, ...)
+    tracemalloc Python allocations are traced, and the top allocation sites are
+                reported at the highest traced memory seen at the end of a stage
+
+Everything is written to a directory next to the paper, e.g.
+research_paper_profile/ for research_paper.md:
+
+    all.pstats          every stage merged    python -m pstats research_paper_profile/all.pstats
+    <stage>.pstats      one stage
+    stacks.collapsed    sampled stacks, one "stage;frame;frame count" line each
+    allocations.txt     top allocation sites at the memory peak
+
+Profiling slows the run (tracemalloc most of all), so use it to find hot spots,
+not to time runs. On Python 3.12 and later only one cProfile can be active at a
+time, so stages running in other threads at the same moment are only sampled.
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Allocation sites listed in allocations.txt
+TOP_ALLOCATIONS = 25
+
+# A new allocation snapshot is taken when traced memory grows this much past the last one
+SNAPSHOT_GROWTH = 1.1
+
+ROOT_STAGE = "run"
+
+def profile_dir(output_file):
+    """Return the profile directory for a paper file, e.g. research_paper_profile for research_paper.md."""
+    return os.path.splitext(output_file)[0] + "_profile"
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class RunProfiler:
+    """Per-stage CPU profiles, sampled stacks and allocation peaks for one run."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, top=TOP_ALLOCATIONS):
+        self.interval = interval
+        self.top = top
+        self.stacks = Counter()
+        self.samples = 0
+        self.unprofiled = set()
+        self._profiles = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._snapshot = None
+        self._snapshot_stage = None
+        self._snapshot_size = 0
+        self._peak = 0
+        self._started_tracemalloc = False
+
+    def start(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        self.enter(ROOT_STAGE)
+
+    def stop(self):
+        import tracemalloc
+        self.exit()
+        self._stop.set()
+        self._sampler.join()
+        self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def _profile(self, stage):
+        import cProfile
+        key = (stage, threading.get_ident())
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = cProfile.Profile()
+        return profile
+
+    def _enable(self, stage):
+        try:
+            self._profile(stage).enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+ allows one at a time); this stage is only sampled
+            self.unprofiled.add(stage)
+
+    def enter(self, stage):
+        """Switch this thread's CPU profile to stage until the matching exit()."""
+        thread = threading.get_ident()
+        with self._lock:
+            stack = self._stages.setdefault(thread, [])
+        if stack:
+            self._profile(stack[-1]).disable()
+        stack.append(stage)
+        self._enable(stage)
+
+    def exit(self):
+        """Leave this thread's current stage and resume the enclosing one."""
+        thread = threading.get_ident()
+        stack = self._stages.get(thread)
+        if not stack:
+            return
+        stage = stack.pop()
+        self._profile(stage).disable()
+        self._check_memory(stage)
+        if stack:
+            self._enable(stack[-1])
+        else:
+            with self._lock:
+                self._stages.pop(thread, None)
+
+    def _check_memory(self, stage):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self._peak = max(self._peak, peak)
+        if current > self._snapshot_size * SNAPSHOT_GROWTH:
+            snapshot = tracemalloc.take_snapshot()
+            with self._lock:
+                if current > self._snapshot_size:
+                    self._snapshot, self._snapshot_stage, self._snapshot_size = snapshot, stage, current
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                stages = {thread: stack[-1] for thread, stack in self._stages.items() if stack and thread != own}
+            for thread, stage in stages.items():
+                frame = frames.get(thread)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join([stage] + labels[::-1])] += 1
+                self.samples += 1
+
+    def stage_stats(self):
+        """Return {stage: pstats.Stats} with each stage's profiles from every thread merged."""
+        import pstats
+        stats = {}
+        for (stage, _), profile in sorted(self._profiles.items(), key=lambda item: item[0][0]):
+            try:
+                if stage in stats:
+                    stats[stage].add(profile)
+                else:
+                    stats[stage] = pstats.Stats(profile)
+            except TypeError:
+                # A profile that never ran has no stats
+                continue
+        return stats
+
+    def summary(self, limit=5):
+        """Rows of the functions with the most own time in each stage, busiest stage first, for printing or st.dataframe."""
+        rows = []
+        stage_stats = sorted(self.stage_stats().items(), key=lambda item: item[1].total_tt, reverse=True)
+        for stage, stats in stage_stats:
+            # The profiler's own switching shows up in the stage it switches away from
+            functions = [item for item in stats.stats.items() if item[1][2] > 0 and item[0][0] != __file__]
+            functions = sorted(functions, key=lambda item: item[1][2], reverse=True)[:limit]
+            for (filename, line, name), (_, calls, own, cumulative, _) in functions:
+                rows.append({"stage": stage, "function": f"{name} ({os.path.basename(filename)}:{line})",
+                             "calls": calls, "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+        return rows
+
+    def write(self, directory):
+        """Write the .pstats files, collapsed stacks and allocation report to directory. Returns their paths."""
+        import pstats
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        stage_stats = self.stage_stats()
+        combined = None
+        for stage, stats in stage_stats.items():
+            path = os.path.join(directory, f"{stage}.pstats")
+            stats.dump_stats(path)
+            paths.append(path)
+            if combined is None:
+                combined = pstats.Stats(path)
+            else:
+                combined.add(path)
+        if combined is not None:
+            path = os.path.join(directory, "all.pstats")
+            combined.dump_stats(path)
+            paths.insert(0, path)
+
+        path = os.path.join(directory, "stacks.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        paths.append(path)
+
+        path = os.path.join(directory, "allocations.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Peak traced Python memory: {self._peak / 1e6:.1f} MB\n")
+            if self._snapshot is not None:
+                f.write(f"Top {self.top} allocation sites at {self._snapshot_size / 1e6:.1f} MB traced, "
+                        f"after stage '{self._snapshot_stage}':\n")
+                for stat in self._snapshot.statistics("lineno")[:self.top]:
+                    f.write(f"  {stat.size / 1e6:9.2f} MB {stat.count:9d} blocks  {stat.traceback[0]}\n")
+        paths.append(path)
+        return paths
+
+    def print_summary(self, limit=3):
+        rows = self.summary(limit)
+        if not rows:
+            return
+        print("🔬 Hottest functions per stage (own time):")
+        for row in rows:
+            print(f"  {row['stage']:<20}{row['own_seconds']:>9.3f}s  {row['function']}")
+        if self.unprofiled:
+            print(f"  ⚠️ Only sampled (another profiler was active): {', '.join(sorted(self.unprofiled))}")
+
+    def __repr__(self):
+        return f"RunProfiler(stages={len(self._profiles)}, samples={self.samples})"
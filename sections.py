@@ -0,0 +1,142 @@
+"""
+Section-level paper updates for Research Assistant AI
+A generated paper is split at its "## " headings, and every chunk of the
+context it was written from is attributed to the section whose text it is
+most similar to. The sections, their evidence (chunk fingerprints) and the
+paper are kept as a manifest in the pipeline cache.
+
+When the context changes, e.g. because a PDF was added, each chunk is
+attributed again against the existing sections. Only the sections whose
+evidence set changed are rewritten, one LLM call each, and spliced back into
+the paper in place. If too many sections changed, a full generation is
+cheaper and more coherent, and the caller falls back to it. The same happens
+when new chunks match no section at all, since that material needs a place in
+the paper's structure.
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter
+
+SECTION_HEADING = re.compile(r"^##\s+(.+?)\s*$", re.MULTILINE)
+WORD = re.compile(r"[a-z0-9]{4,}")
+
+# A chunk whose best section scores below this is treated as evidence for no section
+MIN_SIMILARITY = 0.05
+
+# Above this share of changed sections the whole paper is regenerated instead
+MAX_CHANGED_FRACTION = 0.5
+
+MANIFEST_VERSION = 1
+
+def split_sections(paper):
+    """Split a markdown paper into [{"heading", "text"}] at its level-2 headings.
+
+    Text before the first heading (title, abstract) is a section with an empty
+    heading. Joining the texts gives back the paper unchanged.
+    """
+    starts = [match.start() for match in SECTION_HEADING.finditer(paper)]
+    bounds = [0] + starts if not starts or starts[0] else starts
+    sections = []
+    for position, start in enumerate(bounds):
+        end = bounds[position + 1] if position + 1 < len(bounds) else len(paper)
+        text = paper[start:end]
+        match = SECTION_HEADING.match(text)
+        sections.append({"heading": match.group(1) if match else "", "text": text})
+    return sections
+
+def join_sections(sections):
+    return "".join(section["text"] for section in sections)
+
+def chunk_id(text):
+    """Fingerprint a context chunk, ignoring whitespace differences."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+def _term_vector(text):
+    return Counter(WORD.findall(text.lower()))
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[word] for word, count in a.items() if word in b)
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+def attribute_evidence(sections, chunks):
+    """Assign every chunk to its most similar section.
+
+    Returns (one sorted list of chunk ids per section, sorted ids of chunks that match no section).
+    """
+    vectors = [_term_vector(section["text"]) for section in sections]
+    evidence = [set() for _ in sections]
+    unmatched = set()
+    for chunk in chunks:
+        vector = _term_vector(chunk)
+        scores = [_cosine(vector, section_vector) for section_vector in vectors]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        if scores[best] >= MIN_SIMILARITY:
+            evidence[best].add(chunk_id(chunk))
+        else:
+            unmatched.add(chunk_id(chunk))
+    return [sorted(ids) for ids in evidence], sorted(unmatched)
+
+def build_manifest(topic, mode, paper, chunks):
+    """Record the sections of a paper and the evidence of each one."""
+    sections = split_sections(paper)
+    evidence, unmatched = attribute_evidence(sections, chunks)
+    return {
+        "version": MANIFEST_VERSION,
+        "topic": topic,
+        "mode": mode,
+        "paper": paper,
+        "sections": [{"heading": section["heading"], "evidence": ids} for section, ids in zip(sections, evidence)],
+        "unmatched": unmatched,
+    }
+
+def changed_sections(manifest, chunks):
+    """Attribute new chunks to the recorded paper's sections.
+
+    Returns (sections, changed section indices, evidence texts per section,
+    number of chunks that match no section and did not before).
+    """
+    sections = split_sections(manifest["paper"])
+    evidence, unmatched = attribute_evidence(sections, chunks)
+    by_id = {chunk_id(chunk): chunk for chunk in chunks}
+    texts = [[by_id[id_] for id_ in ids] for ids in evidence]
+    changed = [position for position, (recorded, current) in enumerate(zip(manifest["sections"], evidence))
+               if recorded["evidence"] != current]
+    return sections, changed, texts, len(set(unmatched) - set(manifest["unmatched"]))
+
+def section_prompt(topic, outline, section, evidence, max_chars=8000):
+    """Prompt for rewriting one section of an existing paper from its updated evidence."""
+    heading = section["heading"] or "(title and opening)"
+    return f"""
+You are an expert research assistant updating one section of an existing research paper.
+
+Research Topic: {topic}
+
+Paper outline:
+{outline}
+
+Section heading: {heading}
+
+Current section:
+{section["text"]}
+
+Instructions:
+- Rewrite this section so it reflects the source materials below, including any new findings
+- Keep the heading, the academic style and roughly the same length
+- Keep citations that are still supported and cite new material in the same format
+- Return only the rewritten section in markdown, starting with its heading line
+
+Source Materials:\n{" ".join(evidence)[:max_chars]}
+"""
+
+def normalize_section(text, section):
+    """Make a rewritten section start with its original heading line and keep the original trailing whitespace."""
+    text = text.strip()
+    heading_line = section["text"].split("\n", 1)[0]
+    if section["heading"] and not SECTION_HEADING.match(text):
+        text = f"{heading_line}\n\n{text}"
+    original = section["text"]
+    return text + (original[len(original.rstrip()):] or "\n\n")
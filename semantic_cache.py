@@ -0,0 +1,188 @@
+"""
+Semantic cache for Research Assistant AI
+The stage cache only helps when a topic is repeated word for word. Users often
+rephrase a topic slightly ("Climate change and African agriculture" vs.
+"Impact of Climate Change on African Agriculture"), which would otherwise
+mean a new retrieval and a new paper.
+
+This cache embeds each topic and stores retrieved contexts and papers with the
+topic's vector, scoped to a fingerprint of where the context comes from: the
+searched indexes and retrieval settings, or the digest settings and corpus
+(and, for papers, the mode). A later
+topic with the same scope reuses the closest stored entry if its cosine
+similarity is above the threshold for that kind of entry:
+
+    paper      RESEARCH_SEMANTIC_PAPER_THRESHOLD       (default 0.95)
+    retrieval  RESEARCH_SEMANTIC_RETRIEVAL_THRESHOLD   (default 0.90)
+
+At most RESEARCH_SEMANTIC_MAX_ENTRIES entries (default 1000) are kept; the
+least recently used are evicted first. Lookups and hits are counted per kind
+in the table and on the active tracer ("semantic.paper", "semantic.retrieval").
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from catalog import default_journal_mode
+from instrumentation import record_cache
+
+CACHE_NAME = "semantic.sqlite"
+
+# Words that change how a topic is phrased but not what it is about
+TOPIC_STOPWORDS = {
+    "a", "an", "and", "as", "at", "by", "for", "from", "in", "into", "of", "on", "or", "the", "to", "with",
+    "about", "between", "its", "their", "how", "what", "why", "does", "do", "is", "are",
+    "impact", "impacts", "effect", "effects", "influence", "role", "study", "analysis", "overview", "review",
+}
+
+LEXICAL_DIMS = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    kind TEXT,
+    scope TEXT,
+    embedder TEXT,
+    topic TEXT,
+    vector BLOB,
+    value TEXT,
+    created REAL,
+    last_used REAL,
+    hits INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_scope ON entries (kind, scope, embedder);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    kind TEXT PRIMARY KEY,
+    lookups INTEGER,
+    hits INTEGER
+);
+"""
+
+def _env_number(name, default, cast=float):
+    value = os.getenv(name)
+    try:
+        return cast(value) if value else default
+    except ValueError:
+        print(f"⚠️ Ignoring invalid {name}={value!r}")
+        return default
+
+def default_thresholds():
+    return {
+        "paper": _env_number("RESEARCH_SEMANTIC_PAPER_THRESHOLD", 0.95),
+        "retrieval": _env_number("RESEARCH_SEMANTIC_RETRIEVAL_THRESHOLD", 0.90),
+    }
+
+def cache_path(cache_dir):
+    return os.path.join(cache_dir, CACHE_NAME)
+
+def _stem(word):
+    for suffix in ("ational", "ations", "ation", "ings", "ing", "ies", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def topic_terms(topic):
+    """Lowercase, stemmed content words of a topic."""
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", topic.lower()) if word not in TOPIC_STOPWORDS]
+
+def lexical_embedding(topic, dims=LEXICAL_DIMS):
+    """Embed a topic as a hashed bag of its content words.
+
+    Used when the mode has no real embedding model; it matches rephrasings that
+    reorder words or add filler, not synonyms.
+    """
+    import numpy as np
+    vector = np.zeros(dims, dtype=np.float32)
+    for term in topic_terms(topic):
+        vector[int.from_bytes(hashlib.md5(term.encode("utf-8")).digest()[:4], "big") % dims] += 1.0
+    return vector
+
+def _normalize(vector):
+    import numpy as np
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+class SemanticCache:
+    """Topic-similarity cache of retrieved contexts and papers, stored in SQLite."""
+
+    def __init__(self, path, thresholds=None, max_entries=None, journal_mode=None):
+        self.path = path
+        self.journal_mode = journal_mode or default_journal_mode()
+        self.thresholds = dict(default_thresholds(), **(thresholds or {}))
+        self.max_entries = max_entries or _env_number("RESEARCH_SEMANTIC_MAX_ENTRIES", 1000, int)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def lookup(self, kind, scope, embedder, vector):
+        """Return (value, similarity, topic) of the closest entry above the kind's threshold, or None."""
+        import numpy as np
+        vector = _normalize(vector)
+        conn = self._connect()
+        try:
+            with conn:
+                rows = conn.execute("SELECT id, topic, vector FROM entries WHERE kind = ? AND scope = ? AND embedder = ?",
+                                    (kind, scope, embedder)).fetchall()
+                match = None
+                if rows:
+                    # Entries are scoped by embedder, so every stored vector has the query's dimensions
+                    similarities = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.thresholds[kind]:
+                        match = rows[best], float(similarities[best])
+                conn.execute("INSERT INTO stats (kind, lookups, hits) VALUES (?, 1, ?) "
+                             "ON CONFLICT(kind) DO UPDATE SET lookups = lookups + 1, hits = hits + excluded.hits",
+                             (kind, int(match is not None)))
+                record_cache(f"semantic.{kind}", match is not None)
+                if match is None:
+                    return None
+                (entry_id, topic, _), similarity = match
+                conn.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), entry_id))
+                value = conn.execute("SELECT value FROM entries WHERE id = ?", (entry_id,)).fetchone()[0]
+            return json.loads(value), similarity, topic
+        finally:
+            conn.close()
+
+    def store(self, kind, scope, embedder, topic, vector, value):
+        """Store a value for a topic, then evict the least recently used entries beyond max_entries."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE kind = ? AND scope = ? AND embedder = ? AND topic = ?",
+                             (kind, scope, embedder, topic))
+                conn.execute(
+                    "INSERT INTO entries (kind, scope, embedder, topic, vector, value, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, scope, embedder, topic, _normalize(vector).tobytes(), json.dumps(value, ensure_ascii=False),
+                     now, now),
+                )
+                conn.execute("DELETE FROM entries WHERE id NOT IN "
+                             "(SELECT id FROM entries ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Return {kind: {"entries", "lookups", "hits", "hit_rate"}}."""
+        if not os.path.exists(self.path):
+            return {}
+        conn = self._connect()
+        try:
+            entries = dict(conn.execute("SELECT kind, COUNT(*) FROM entries GROUP BY kind").fetchall())
+            result = {}
+            for kind, lookups, hits in conn.execute("SELECT kind, lookups, hits FROM stats"):
+                result[kind] = {"entries": entries.get(kind, 0), "lookups": lookups, "hits": hits,
+                                "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+            return result
+        finally:
+            conn.close()
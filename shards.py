@@ -0,0 +1,80 @@
+"""
+Sharded vector search for Research Assistant AI
+Every source gets its own FAISS index (a shard), cached under the content
+hash of its chunks. Adding a source embeds and indexes only that source, and
+removing one simply leaves its shard out; the others are reused as they are.
+
+A query is routed to the selected shards, which are searched in parallel
+(FAISS releases the GIL while searching). Their hits are merged by distance,
+chunks repeated across sources are dropped, and the k nearest are kept. Hits
+carry their vectors, so the pipeline can pick a diverse context from a larger
+set of candidates (see packing.py).
+"""
+
+import contextvars
+import fnmatch
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import span
+
+# Shards searched at once
+SEARCH_WORKERS = 8
+
+# Hits fetched from each shard per result wanted, so duplicates dropped in the merge still leave k results
+OVERFETCH = 2
+
+def select_sources(sources, patterns):
+    """Return the sources matching any of the glob patterns (all of them if there are no patterns)."""
+    if not patterns:
+        return list(sources)
+    return [source for source in sources if any(fnmatch.fnmatch(source, pattern) for pattern in patterns)]
+
+class ShardRouter:
+    """Searches per-source shards in parallel and merges their top-k.
+
+    shards maps each source to a search(vector, k) function returning
+    [(distance, text, vector)], nearest first.
+    """
+
+    def __init__(self, shards, max_workers=SEARCH_WORKERS):
+        self.shards = shards
+        self.max_workers = max_workers
+
+    def candidates(self, vector, k, patterns=None):
+        """Return the k chunks nearest to vector across the shards whose source matches patterns.
+
+        Each is (distance, text, source, vector), nearest first.
+        """
+        selected = select_sources(self.shards, patterns)
+        if not selected:
+            return []
+        fetch = k * OVERFETCH
+        with span("shard_search", shards=len(selected), k=k) as s:
+            if len(selected) == 1:
+                hit_lists = [self.shards[selected[0]](vector, fetch)]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(selected))) as executor:
+                    # Each search runs in a copy of this context so its spans reach the active tracer
+                    futures = [executor.submit(contextvars.copy_context().run, self.shards[source], vector, fetch)
+                               for source in selected]
+                    hit_lists = [future.result() for future in futures]
+            hit_lists = [[(distance, text, source, hit_vector) for distance, text, hit_vector in hits]
+                         for source, hits in zip(selected, hit_lists)]
+            hits = []
+            seen = set()
+            for hit in heapq.merge(*hit_lists, key=lambda hit: hit[0]):
+                fingerprint = hashlib.sha1(" ".join(hit[1].split()).encode("utf-8")).digest()
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                hits.append(hit)
+                if len(hits) == k:
+                    break
+            s.set(chunks=len(hits))
+        return hits
+
+    def search(self, vector, k, patterns=None):
+        """Return the texts of the k chunks nearest to vector across the shards whose source matches patterns."""
+        return [hit[1] for hit in self.candidates(vector, k, patterns)]
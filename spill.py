@@ -0,0 +1,288 @@
+"""
+Bounded-memory corpus processing for Research Assistant AI
+Spills extracted text and chunks to disk and streams them through splitting,
+deduplication, embedding and indexing in fixed-size batches, so peak memory
+depends on the batch and window sizes rather than on the size of the corpus.
+
+Files written here live inside the pipeline cache:
+    <key>.txt      extracted text of one source, read by textstore.py
+    <key>.jsonl    chunks, one view {"text_id", "offset", "length", "source"} per line
+    <key>.offsets  int64 byte offset of every line in a chunks file
+    <key>.f32      float32 embedding vectors, row-major
+    <key>.faiss    FAISS index over those vectors
+"""
+
+import codecs
+import gc
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+from array import array
+
+from deadline import current_deadline
+from instrumentation import current_rss_bytes, span
+from pdf_backends import resolve_backend
+from textstore import byte_views, make_view
+from utils import make_text_splitter
+
+# Bytes of text read at once while splitting a source
+WINDOW_CHARS = 1_000_000
+
+class MemoryGuard:
+    """Enforces an RSS ceiling by shrinking batches and, failing that, aborting the run."""
+
+    def __init__(self, max_rss_mb=None, batch_size=256, min_batch_size=8):
+        self.limit = int(max_rss_mb * 1024 * 1024) if max_rss_mb else None
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+
+    def check(self, stage):
+        if not self.limit:
+            return
+        rss = current_rss_bytes()
+        if rss is None or rss <= self.limit:
+            return
+        gc.collect()
+        rss = current_rss_bytes()
+        if rss <= self.limit:
+            return
+        if self.batch_size > self.min_batch_size:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            print(f"⚠️ RSS {rss / 1e6:.0f} MB is above the ceiling during {stage}; batch size reduced to {self.batch_size}")
+            return
+        raise MemoryError(
+            f"RSS {rss / 1e6:.0f} MB exceeds the {self.limit / 1e6:.0f} MB ceiling during {stage}"
+        )
+
+def _atomic_path(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Unique per writer, since ingestion workers on other processes or hosts may write the same file at once
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+def extract_pdf_to_file(file_path, out_path, guard=None, backend="auto"):
+    """Write a PDF's text to out_path one page at a time. Returns the character count, or None."""
+    tmp_path = _atomic_path(out_path)
+    chars = 0
+    try:
+        with span("pdf_parse", source=file_path, bytes=os.path.getsize(file_path)) as s, \
+                open(tmp_path, "w", encoding="utf-8") as out:
+            pdf_backend = resolve_backend(file_path, backend)
+            pages = 0
+            deadline = current_deadline()
+            for text in pdf_backend.iter_pages(file_path):
+                pages += 1
+                if text:
+                    if chars:
+                        out.write("\n")
+                    out.write(text)
+                    chars += len(text) + (1 if chars else 0)
+                if guard:
+                    guard.check("extract")
+                if deadline is not None and deadline.ingest_expired():
+                    deadline.truncate(file_path, f"extraction stopped after {pages} pages")
+                    break
+            s.set(pages=pages, chars=chars, backend=pdf_backend.name)
+    except Exception as e:
+        print(f"Error extracting text from PDF {file_path}: {str(e)}")
+        chars = 0
+    if not chars:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, out_path)
+    return chars
+
+def write_text_file(text, out_path):
+    """Spill already extracted text to out_path. Returns the character count, or None."""
+    if not text:
+        return None
+    tmp_path = _atomic_path(out_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, out_path)
+    return len(text)
+
+def split_file_to_jsonl(text_path, out_path, source, text_id, window_chars=WINDOW_CHARS, guard=None):
+    """Split a text file into a chunks file of views into it, holding at most one window of text in memory.
+
+    Each window is split with the standard splitter. The final, possibly
+    incomplete chunk is carried into the next window, so chunk boundaries only
+    differ from an in-memory split where a chunk straddles a window edge.
+    Chunks are written as byte ranges of text_id's file (see textstore.py),
+    not as copies of their text, and each line's byte offset is indexed so
+    the source's shard can read its search hits. Returns the number of chunks written.
+    """
+    splitter = make_text_splitter()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tmp_path = _atomic_path(out_path)
+    count = 0
+    carry = ""
+    # Byte offset of carry[0] in the file
+    base = 0
+    lines = array("q")
+    with span("split", source=source, bytes=os.path.getsize(text_path)) as s, \
+            open(text_path, "rb") as f, open(tmp_path, "wb") as out:
+        while True:
+            block = f.read(window_chars)
+            text = carry + decoder.decode(block, final=not block)
+            offsets = splitter.split_offsets(text) if text.strip() else []
+            if block and len(offsets) > 1:
+                keep = offsets[-1][0]
+                offsets = offsets[:-1]
+            elif block:
+                carry = text
+                continue
+            else:
+                keep = len(text)
+            # The extra empty range gives the byte offset of the carried text
+            views = byte_views(text, offsets + [(keep, keep)], base)
+            for offset, length in views[:-1]:
+                lines.append(out.tell())
+                out.write((json.dumps(make_view(text_id, offset, length, source), ensure_ascii=False) + "\n").encode("utf-8"))
+            carry, base = text[keep:], views[-1][0]
+            count += len(offsets)
+            if guard:
+                guard.check("split")
+            if not block:
+                break
+        s.set(chunks=count)
+    if not count:
+        os.remove(tmp_path)
+        return 0
+    offsets_tmp_path = _atomic_path(f"{out_path}.offsets")
+    with open(offsets_tmp_path, "wb") as offsets_file:
+        lines.tofile(offsets_file)
+    os.replace(offsets_tmp_path, f"{out_path}.offsets")
+    os.replace(tmp_path, out_path)
+    return count
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def iter_chunks(path, texts):
+    """Yield the chunks of a chunks file as {"text", "source"}, reading each text from the TextStore texts."""
+    for chunk in iter_jsonl(path):
+        yield texts.materialize(chunk)
+
+def iter_batches(path, batch_size, texts):
+    """Yield lists of at most batch_size materialized chunks from a chunks file. batch_size may be a callable."""
+    batch = []
+    for chunk in iter_chunks(path, texts):
+        batch.append(chunk)
+        if len(batch) >= (batch_size() if callable(batch_size) else batch_size):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def dedupe_jsonl(paths, out_path, texts, guard=None):
+    """Merge chunk files into one, dropping repeated chunks, and index each line's byte offset.
+
+    Fingerprints are kept in an on-disk SQLite table instead of a Python set,
+    so memory stays flat however many chunks the corpus has. Each chunk's text
+    is read from texts only to fingerprint it; the view itself is copied.
+    Returns the number of unique chunks.
+    """
+    tmp_path = _atomic_path(out_path)
+    offsets_tmp_path = _atomic_path(f"{out_path}.offsets")
+    seen_path = f"{out_path}.seen.sqlite"
+    if os.path.exists(seen_path):
+        os.remove(seen_path)
+    offsets = array("q")
+    count = 0
+    conn = sqlite3.connect(seen_path)
+    try:
+        conn.execute("CREATE TABLE seen (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID")
+        with open(tmp_path, "wb") as out, open(offsets_tmp_path, "wb") as offsets_file:
+            for path in paths:
+                for chunk in iter_jsonl(path):
+                    fingerprint = hashlib.sha1(" ".join(texts.text(chunk).split()).encode("utf-8")).digest()
+                    if conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (fingerprint,)).rowcount == 0:
+                        continue
+                    offsets.append(out.tell())
+                    out.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+                    count += 1
+                    if len(offsets) >= 65536:
+                        offsets.tofile(offsets_file)
+                        del offsets[:]
+                if guard:
+                    guard.check("dedupe")
+            offsets.tofile(offsets_file)
+        conn.commit()
+    finally:
+        conn.close()
+        os.remove(seen_path)
+    os.replace(tmp_path, out_path)
+    os.replace(offsets_tmp_path, f"{out_path}.offsets")
+    return count
+
+def read_chunks_at(chunks_path, ids):
+    """Read the chunk views with the given line numbers from a chunks file via its offsets index."""
+    chunks = []
+    with open(f"{chunks_path}.offsets", "rb") as offsets_file, open(chunks_path, "rb") as f:
+        for chunk_id in ids:
+            offsets_file.seek(chunk_id * 8)
+            offset = array("q")
+            offset.frombytes(offsets_file.read(8))
+            f.seek(offset[0])
+            chunks.append(json.loads(f.readline().decode("utf-8")))
+    return chunks
+
+def read_leading_chunks(chunks_path, max_chars, texts):
+    """Return the texts of the first chunks in a file, up to max_chars characters."""
+    selected = []
+    total = 0
+    for chunk in iter_chunks(chunks_path, texts):
+        if total >= max_chars:
+            break
+        selected.append(chunk["text"])
+        total += len(chunk["text"]) + 1
+    return selected
+
+def embed_jsonl(chunks_path, out_path, embedding, guard, texts):
+    """Embed a chunks file in batches, appending float32 rows to out_path. Returns (count, dims)."""
+    tmp_path = _atomic_path(out_path)
+    count = 0
+    dims = None
+    with open(tmp_path, "wb") as out:
+        for batch in iter_batches(chunks_path, lambda: guard.batch_size, texts):
+            vectors = embedding.embed_documents([chunk["text"] for chunk in batch])
+            for vector in vectors:
+                dims = dims or len(vector)
+                array("f", vector).tofile(out)
+            count += len(vectors)
+            guard.check("embed")
+    os.replace(tmp_path, out_path)
+    return count, dims
+
+def build_index_from_vectors(vectors_path, count, dims, out_path, guard):
+    """Build a FAISS index by streaming vectors from disk in batches and write it to out_path."""
+    import faiss
+    import numpy as np
+    index = faiss.IndexFlatL2(dims)
+    row_bytes = dims * 4
+    with open(vectors_path, "rb") as f:
+        while True:
+            data = f.read(row_bytes * guard.batch_size)
+            if not data:
+                break
+            index.add(np.frombuffer(data, dtype="float32").reshape(-1, dims))
+            guard.check("index")
+    tmp_path = _atomic_path(out_path)
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def search_index(index_path, chunks_path, query_vector, k, texts):
+    """Return (distance, text, vector) of the k chunks nearest to query_vector, nearest first."""
+    import faiss
+    import numpy as np
+    index = faiss.read_index(index_path)
+    distances, ids = index.search(np.asarray([query_vector], dtype="float32"), k)
+    hits = [(float(distance), int(i)) for distance, i in zip(distances[0], ids[0]) if i >= 0]
+    chunks = read_chunks_at(chunks_path, [i for _, i in hits])
+    return [(distance, texts.text(chunk), index.reconstruct(i)) for (distance, i), chunk in zip(hits, chunks)]
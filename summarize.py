@@ -0,0 +1,157 @@
+"""
+Map-reduce summarization for Research Assistant AI
+The generation prompt only reads the first 8-10k characters of its context, so
+on a large corpus most of the text never reaches the model. This module
+condenses the whole corpus into a digest that fits the prompt:
+
+    map     chunks are packed into batches of about MAP_CHARS characters, one
+            batch never mixing sources, and each batch is summarized by its
+            own LLM call; the calls run in parallel
+    reduce  summaries are merged REDUCE_FAN_IN at a time, focused on the
+            topic, until the digest is at most DIGEST_CHARS characters
+
+A corpus of C characters costs about C / MAP_CHARS map calls plus a fraction
+of that in reduce calls. Every summary is cached under a hash of its input
+text, so a rerun only summarizes batches whose text changed. Map summaries do
+not depend on the topic and are shared by every topic written from the corpus.
+"""
+
+import contextvars
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import record_cache, span
+
+# Source text sent to one map call
+MAP_CHARS = 12000
+
+# Summaries merged by one reduce call
+REDUCE_FAN_IN = 6
+
+# Size the final digest must fit in, matching what the generation prompts read
+DIGEST_CHARS = 8000
+
+# Bump whenever the prompts change so stale cached summaries are ignored
+PROMPT_VERSION = 1
+
+CACHE_STAGE = "summary"
+
+def map_prompt(text, source):
+    return f"""
+Summarize the following excerpt from {source} for a researcher.
+
+Instructions:
+- Keep every concrete finding, figure, date, name and definition
+- Keep the claims attributable: say what the source states, not what you think
+- Leave out navigation text, boilerplate and repetition
+- Write at most 250 words of plain prose
+
+Excerpt:
+{text}
+"""
+
+def reduce_prompt(summaries, topic):
+    joined = "\n\n".join(f"[{position}] {summary}" for position, summary in enumerate(summaries, start=1))
+    return f"""
+Merge the following summaries of research sources into one summary for a paper on: {topic}
+
+Instructions:
+- Keep the findings, figures and sources most relevant to the topic
+- Merge repeated points and note where sources disagree
+- Drop material unrelated to the topic
+- Write at most 400 words of plain prose
+
+Summaries:
+{joined}
+"""
+
+def pack_batches(chunks, max_chars=MAP_CHARS):
+    """Pack consecutive chunks of the same source into batches of at most max_chars. Yields (source, text).
+
+    Batches never span sources, so a changed source only changes its own
+    batches and every other cached summary stays valid.
+    """
+    source, parts, size = None, [], 0
+    for chunk in chunks:
+        text = chunk["text"]
+        if parts and (chunk["source"] != source or size + len(text) > max_chars):
+            yield source, "\n".join(parts)
+            parts, size = [], 0
+        source = chunk["source"]
+        parts.append(text)
+        size += len(text) + 1
+    if parts:
+        yield source, "\n".join(parts)
+
+def _summary_key(model, *parts):
+    return hashlib.sha256(json.dumps([PROMPT_VERSION, model, *parts], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class Summarizer:
+    """Runs the map and reduce calls against an LLM, caching each summary in an ArtifactStore."""
+
+    def __init__(self, llm, store, model="llm", concurrency=8, refresh=False):
+        self.llm = llm
+        self.store = store
+        self.model = model
+        self.concurrency = concurrency
+        self.refresh = refresh
+        self.calls = 0
+        self.cached = 0
+
+    def _summarize(self, key, prompt, phase):
+        if not self.refresh:
+            cached = self.store.load(CACHE_STAGE, key)
+            if cached is not None:
+                record_cache("summarize.summary", True)
+                self.cached += 1
+                return cached["summary"]
+        record_cache("summarize.summary", False)
+        with span("llm_call", bytes=len(prompt), phase=phase) as s:
+            summary = self.llm.invoke(prompt).content.strip()
+            s.set(response_chars=len(summary))
+        self.calls += 1
+        self.store.save(CACHE_STAGE, key, {"summary": summary})
+        return summary
+
+    def _map_one(self, source, text):
+        return self._summarize(_summary_key(self.model, "map", source, text), map_prompt(text, source), "map")
+
+    def _reduce_one(self, summaries, topic):
+        return self._summarize(_summary_key(self.model, "reduce", topic, summaries),
+                               reduce_prompt(summaries, topic), "reduce")
+
+    def _parallel(self, function, argument_lists):
+        """Call function(*arguments) for every argument list on a thread pool, in order. Failures come back as None."""
+        def attempt(arguments):
+            try:
+                return function(*arguments)
+            except Exception as e:
+                print(f"⚠️ Summary failed: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Each call runs in a copy of this context so its spans reach the active tracer
+            futures = [executor.submit(contextvars.copy_context().run, attempt, arguments) for arguments in argument_lists]
+            return [future.result() for future in futures]
+
+    def digest(self, chunks, topic, max_chars=DIGEST_CHARS, fan_in=REDUCE_FAN_IN):
+        """Summarize chunks into a topic digest of at most about max_chars. Returns None if every map call failed."""
+        with span("summarize_map") as s:
+            batches = list(pack_batches(chunks))
+            summaries = [summary for summary in self._parallel(self._map_one, batches) if summary]
+            s.set(chunks=len(batches))
+        if not summaries:
+            return None
+
+        level = 0
+        while len("\n\n".join(summaries)) > max_chars and len(summaries) > 1:
+            level += 1
+            groups = [tuple(summaries[start:start + fan_in]) for start in range(0, len(summaries), fan_in)]
+            with span("summarize_reduce", level=level) as s:
+                reduced = self._parallel(self._reduce_one, [(list(group), topic) for group in groups])
+                s.set(chunks=len(groups))
+            # A failed reduce falls back to its inputs cut to their share of the budget
+            summaries = [summary or "\n\n".join(group)[:max_chars // len(groups)]
+                         for summary, group in zip(reduced, groups)]
+        return "\n\n".join(summaries)[:max_chars]
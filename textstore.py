@@ -0,0 +1,70 @@
+"""
+Text store for Research Assistant AI
+In bounded mode the text of every source is written once, as UTF-8, to the
+extract stage's file (<cache>/extract/<id[:2]>/<id>.txt). Chunks do not copy
+that text: a chunk is a view {"text_id", "offset", "length", "source"} of
+byte offsets into its source's file, and its text is only decoded when it is
+embedded, fingerprinted or placed in a prompt.
+
+Each read opens the file just long enough to read the chunk's bytes. Nothing
+stays mapped, so peak memory does not grow with the corpus, and the operating
+system's page cache still holds one copy of it however many worker processes
+read it.
+
+    texts = TextStore(os.path.join(cache_dir, "extract"))
+    text = texts.text(chunk)
+"""
+
+import os
+
+TEXT_SUFFIX = ".txt"
+
+def make_view(text_id, offset, length, source):
+    """Describe the chunk stored at byte offset..offset+length of a source's text file."""
+    return {"text_id": text_id, "offset": offset, "length": length, "source": source}
+
+def byte_views(text, offsets, base=0):
+    """Convert (start, end) character offsets into text to (byte offset, byte length) pairs.
+
+    base is the byte offset of text[0] in the file. Offsets are converted with a
+    moving cursor, so a whole window costs about one encode of its text.
+    """
+    views = []
+    char_position, byte_position = 0, base
+    for start, end in offsets:
+        if start >= char_position:
+            byte_position += len(text[char_position:start].encode("utf-8"))
+        else:
+            byte_position -= len(text[start:char_position].encode("utf-8"))
+        char_position = start
+        views.append((byte_position, len(text[start:end].encode("utf-8"))))
+    return views
+
+class TextStore:
+    """Read-only access to the per-source text files under root."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, text_id):
+        return os.path.join(self.root, text_id[:2], text_id + TEXT_SUFFIX)
+
+    def read(self, text_id, offset, length):
+        """Decode length bytes at offset of a source's text."""
+        with open(self.path(text_id), "rb", buffering=0) as f:
+            if hasattr(os, "pread"):
+                data = os.pread(f.fileno(), length, offset)
+            else:
+                f.seek(offset)
+                data = f.read(length)
+        return data.decode("utf-8")
+
+    def text(self, chunk):
+        """Materialize a chunk's text. Chunks that carry their text (the in-memory format) are returned as is."""
+        if "text" in chunk:
+            return chunk["text"]
+        return self.read(chunk["text_id"], chunk["offset"], chunk["length"])
+
+    def materialize(self, chunk):
+        """Return the chunk as {"text", "source"}."""
+        return {"text": self.text(chunk), "source": chunk["source"]}
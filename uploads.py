@@ -0,0 +1,113 @@
+"""
+Upload storage for Research Assistant AI
+Uploaded PDFs are streamed to disk in blocks and stored under the SHA-256 of
+their content, so two different files with the same name never overwrite each
+other, and uploading identical content again writes nothing. An index maps
+each content hash to the names it was uploaded under: the first one is its
+display name, and uploading the same bytes under another name adds that name
+rather than renaming the file.
+
+Layout:
+    documents/uploads/<sha256>.pdf
+    documents/uploads/index.json   {"<sha256>": {"name": ..., "names": [...], "size": ..., "uploaded_at": ...}}
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+UPLOAD_DIR = os.path.join("documents", "uploads")
+INDEX_FILE = "index.json"
+BLOCK_SIZE = 1 << 20
+
+_index_lock = threading.Lock()
+
+def _index_path(root):
+    return os.path.join(root, INDEX_FILE)
+
+def load_index(root=UPLOAD_DIR):
+    """Return the upload index, mapping content hash to display name, every uploaded name, size and upload time."""
+    path = _index_path(root)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable upload index {path}: {e}")
+        return {}
+
+def _add_to_index(root, digest, name, size):
+    with _index_lock:
+        index = load_index(root)
+        entry = index.get(digest)
+        if entry is None:
+            index[digest] = {"name": name, "names": [name], "size": size,
+                             "uploaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        else:
+            # Entries written before names were recorded only have the display name
+            names = entry.setdefault("names", [entry["name"]])
+            if name in names:
+                return
+            names.append(name)
+        tmp_path = f"{_index_path(root)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, _index_path(root))
+
+def _hash_file(fileobj, block_size):
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(block_size), b""):
+        digest.update(block)
+        size += len(block)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+def save_upload(fileobj, name, root=UPLOAD_DIR, block_size=BLOCK_SIZE):
+    """Stream a file object to root under its content hash. Returns (path, is_new).
+
+    If a file with the same content is already stored, nothing is written and
+    is_new is False. Seekable file objects (such as Streamlit uploads) are
+    hashed before anything is written, so identical content is never copied.
+    """
+    os.makedirs(root, exist_ok=True)
+    extension = os.path.splitext(name)[1].lower() or ".pdf"
+    if hasattr(fileobj, "seek"):
+        hexdigest, size = _hash_file(fileobj, block_size)
+        path = os.path.join(root, hexdigest + extension)
+        if os.path.exists(path):
+            _add_to_index(root, hexdigest, name, size)
+            return path, False
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in iter(lambda: fileobj.read(block_size), b""):
+                digest.update(block)
+                out.write(block)
+                size += len(block)
+        path = os.path.join(root, digest.hexdigest() + extension)
+        is_new = not os.path.exists(path)
+        if is_new:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _add_to_index(root, digest.hexdigest(), name, size)
+    return path, is_new
+
+def display_name(path, root=UPLOAD_DIR):
+    """Return the name a stored upload was first uploaded as, with any others, or the path itself for other files."""
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(root):
+        return path
+    entry = load_index(root).get(os.path.splitext(os.path.basename(path))[0])
+    if not entry:
+        return path
+    others = [name for name in entry.get("names", []) if name != entry["name"]]
+    return f"{entry['name']} (also uploaded as {', '.join(others)})" if others else entry["name"]
@@ -1,23 +1,29 @@
-import requests
-from bs4 import BeautifulSoup
-import pdfplumber
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
+from deadline import current_deadline, fetch_timeout
+from instrumentation import span
+from pdf_backends import resolve_backend
 
-def extract_text_from_pdf(file_path):
-    """Extract text from a PDF file with error handling."""
+def extract_text_from_pdf(file_path, backend="auto"):
+    """Extract text from a PDF file with error handling. See pdf_backends for the backend choices."""
     try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"PDF file not found: {file_path}")
         
-        with pdfplumber.open(file_path) as pdf:
+        with span("pdf_parse", source=file_path, bytes=os.path.getsize(file_path)) as s:
+            pdf_backend = resolve_backend(file_path, backend)
             text_parts = []
-            for page in pdf.pages:
-                if page.extract_text():
-                    text_parts.append(page.extract_text())
+            pages = 0
+            deadline = current_deadline()
+            for page_text in pdf_backend.iter_pages(file_path):
+                pages += 1
+                if page_text:
+                    text_parts.append(page_text)
+                if deadline is not None and deadline.ingest_expired():
+                    deadline.truncate(file_path, f"extraction stopped after {pages} pages")
+                    break
             
             extracted_text = "\n".join(text_parts)
+            s.set(pages=pages, chars=len(extracted_text), backend=pdf_backend.name)
             if not extracted_text.strip():
                 raise ValueError(f"No text could be extracted from PDF: {file_path}")
             
@@ -26,52 +32,257 @@ def extract_text_from_pdf(file_path):
         print(f"Error extracting text from PDF {file_path}: {str(e)}")
         return ""
 
-def extract_text_from_url(url):
-    """Extract text from a website URL with error handling."""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30)
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def fetch_url(url):
+    """Download a web page and return its HTML. Raises on network or HTTP errors."""
+    import requests
+    with span("fetch", source=url) as s:
+        response = requests.get(url, headers=BROWSER_HEADERS, timeout=fetch_timeout(30))
+        s.set(bytes=len(response.content), status_code=response.status_code)
         response.raise_for_status()  # Raise an exception for bad status codes
-        
-        soup = BeautifulSoup(response.text, "html.parser")
+    return response.text
+
+def fetch_url_if_modified(url, etag=None, last_modified=None):
+    """Download a web page unless the server says it has not changed since etag/last_modified.
+
+    Returns (html, etag, last_modified); html is None when the server answers 304 Not Modified.
+    """
+    import requests
+    headers = dict(BROWSER_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    with span("fetch", source=url) as s:
+        response = requests.get(url, headers=headers, timeout=fetch_timeout(30))
+        s.set(bytes=len(response.content), status_code=response.status_code)
+        if response.status_code == 304:
+            return None, etag, last_modified
+        response.raise_for_status()
+    return response.text, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+def extract_text_from_html(html, source=None):
+    """Extract readable text from an HTML document. Raises if no text is found."""
+    from bs4 import BeautifulSoup
+    with span("html_parse", source=source, bytes=len(html)) as s:
+        soup = BeautifulSoup(html, "html.parser")
         
         # Remove script and style elements
         for script in soup(["script", "style"]):
             script.decompose()
         
         text = soup.get_text()
+        # Break the tree's reference cycles so it is freed now rather than at the next GC pass
+        soup.decompose()
         
         # Clean up whitespace
         lines = (line.strip() for line in text.splitlines())
         chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
         text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        if not text.strip():
-            raise ValueError(f"No text could be extracted from URL: {url}")
-        
-        return text
+        s.set(chars=len(text))
+    
+    if not text.strip():
+        raise ValueError(f"No text could be extracted from URL: {source}")
+    
+    return text
+
+def extract_text_from_url(url):
+    """Extract text from a website URL with error handling."""
+    try:
+        return extract_text_from_html(fetch_url(url), source=url)
     except Exception as e:
         print(f"Error extracting text from URL {url}: {str(e)}")
         return ""
 
-def prepare_documents(text):
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+SEPARATORS = ("\n\n", "\n", " ", "")
+
+class OffsetTextSplitter:
+    """Splits text like RecursiveCharacterTextSplitter, but works on (start, end) offsets into the text.
+
+    Chunk boundaries are the same as LangChain's with keep_separator=True and
+    strip_whitespace=True: the text is cut at the first separator that occurs
+    in it (each separator stays at the start of the piece after it), pieces of
+    chunk_size or more are cut again with the next separator, and adjacent
+    pieces are packed into chunks of at most chunk_size characters, each
+    starting with up to chunk_overlap characters of the previous one. Instead
+    of splitting and re-joining strings at every level, pieces are offset
+    pairs and a chunk is only copied out of the text when it is returned.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+
+    def split_offsets(self, text):
+        """Return the (start, end) offsets of every chunk of text, in order."""
+        offsets = []
+        self._split(text, 0, len(text), self.separators, offsets)
+        return offsets
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def _split(self, text, start, end, separators, out):
+        separator = separators[-1]
+        remaining = ()
+        for position, candidate in enumerate(separators):
+            if candidate == "":
+                separator = ""
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                remaining = separators[position + 1:]
+                break
+
+        if len(separator) <= 1:
+            self._split_jumping(text, start, end, separator, remaining, out)
+            return
+
+        good = []
+        for piece_start, piece_end in self._pieces(text, start, end, separator):
+            if piece_end - piece_start < self.chunk_size:
+                good.append((piece_start, piece_end))
+                continue
+            if good:
+                self._merge(text, good, out)
+                good = []
+            if remaining:
+                self._split(text, piece_start, piece_end, remaining, out)
+            else:
+                out.append((piece_start, piece_end))
+        if good:
+            self._merge(text, good, out)
+
+    def _bad_piece(self, text, start, end, remaining, out):
+        if remaining:
+            self._split(text, start, end, remaining, out)
+        else:
+            out.append((start, end))
+
+    def _split_jumping(self, text, start, end, separator, remaining, out):
+        """Split and merge in one pass for a one-character (or empty) separator, without listing the pieces.
+
+        Every occurrence of the separator starts a piece, so chunk ends and
+        overlap starts are found with find/rfind, jumping straight to the last
+        piece boundary that fits instead of adding up the pieces one by one.
+        """
+        size = self.chunk_size
+
+        def next_boundary(position):
+            if not separator:
+                return position + 1
+            found = text.find(separator, position + 1, end)
+            return end if found == -1 else found
+
+        def last_boundary(first, limit):
+            return limit if not separator else text.rfind(separator, first + 1, limit + 1)
+
+        def first_boundary(threshold, limit):
+            if not separator:
+                return threshold
+            found = text.find(separator, threshold, limit)
+            return limit if found == -1 else found
+
+        position = start
+        while position < end:
+            following = next_boundary(position)
+            if following - position >= size:
+                self._bad_piece(text, position, following, remaining, out)
+                position = following
+                continue
+            # A run of pieces shorter than chunk_size starts here
+            first = position
+            while True:
+                if end - first <= size:
+                    self._emit(text, first, end, out)
+                    position = end
+                    break
+                # The first piece is shorter than chunk_size, so a boundary exists within the window
+                chunk_end = last_boundary(first, first + size)
+                following = next_boundary(chunk_end)
+                self._emit(text, first, chunk_end, out)
+                if following - chunk_end >= size:
+                    # The next piece is too long to merge, so the run ends here
+                    position = chunk_end
+                    break
+                # Keep the trailing pieces that fit in chunk_overlap and leave room for the next piece
+                threshold = max(chunk_end - self.chunk_overlap, following - size)
+                first = max(first, first_boundary(threshold, chunk_end))
+
+    @staticmethod
+    def _pieces(text, start, end, separator):
+        """Yield the non-empty spans between occurrences of separator, each occurrence opening the next span."""
+        if not separator:
+            yield from ((position, position + 1) for position in range(start, end))
+            return
+        piece_start = start
+        position = text.find(separator, start, end)
+        while position != -1:
+            if position > piece_start:
+                yield piece_start, position
+            piece_start = position
+            position = text.find(separator, position + len(separator), end)
+        if end > piece_start:
+            yield piece_start, end
+
+    def _merge(self, text, pieces, out):
+        """Pack adjacent pieces into chunks, carrying trailing pieces over as overlap (TextSplitter._merge_splits)."""
+        first = 0
+        total = 0
+        for position, (piece_start, piece_end) in enumerate(pieces):
+            length = piece_end - piece_start
+            if total + length > self.chunk_size and position > first:
+                self._emit(text, pieces[first][0], pieces[position - 1][1], out)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= pieces[first][1] - pieces[first][0]
+                    first += 1
+            total += length
+        if first < len(pieces):
+            self._emit(text, pieces[first][0], pieces[-1][1], out)
+
+    @staticmethod
+    def _emit(text, start, end, out):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append((start, end))
+
+def make_text_splitter():
+    """Return the text splitter used for every source."""
+    return OffsetTextSplitter()
+
+def make_langchain_text_splitter():
+    """Return the LangChain splitter that OffsetTextSplitter reproduces, for equivalence checks."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=list(SEPARATORS)
+    )
+
+def prepare_documents(text, metadata=None):
     """Prepare documents for processing with error handling."""
+    from langchain_core.documents import Document
     try:
         if not text or not text.strip():
             raise ValueError("No text provided to prepare documents")
         
-        docs = [Document(page_content=text)]
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, 
-            chunk_overlap=150,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        
-        split_docs = splitter.split_documents(docs)
+        with span("split", bytes=len(text)) as s:
+            offsets = make_text_splitter().split_offsets(text)
+            split_docs = [Document(page_content=text[start:end], metadata=dict(metadata or {}))
+                          for start, end in offsets]
+            s.set(chunks=len(split_docs))
         
         if not split_docs:
             raise ValueError("No documents created after splitting")
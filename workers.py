@@ -0,0 +1,340 @@
+"""
+Distributed ingestion workers for Research Assistant AI
+One process extracts and splits sources one after another. For libraries of
+thousands of sources, queue them once and start as many workers as needed, on
+this machine or on other hosts that share the working directory:
+
+    python workers.py enqueue                 # every source in sources.json
+    python workers.py work --processes 4      # on each host; Ctrl+C to stop
+    python workers.py status
+    python main.py                            # reuses everything the workers cached
+
+The queue is a SQLite table in the cache (.research_cache/queue.sqlite). A
+worker leases one job at a time and renews the lease while it works; if the
+worker is killed, the lease runs out and another worker takes the job over.
+Failed jobs are retried with backoff up to max_attempts times, then marked
+failed (python workers.py retry queues them again).
+
+Workers write extracted text and chunks to the shared content-addressed cache
+through a uniquely named temporary file and an atomic rename, so two workers
+ingesting the same source write identical files and either may finish first.
+A job is only marked done by the worker that still holds its lease, so a
+worker that lost its lease cannot overwrite the outcome of the one that took over.
+
+The queue uses SQLite's rollback journal rather than WAL, which needs shared
+memory that network filesystems do not provide, and workers open the source
+catalog the same way. Other processes that use the cache while workers run on
+other hosts (main.py, the web interface) must not switch the catalog back to
+WAL: set RESEARCH_CACHE_JOURNAL=delete for them, or only run them once the
+workers are done. Hosts must share the volume with working POSIX locks (e.g.
+NFSv4). Paths of PDFs are as written in sources.json, so start workers from
+the same directory on every host.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from llm_client import backoff_delay
+
+QUEUE_NAME = "queue.sqlite"
+
+# Seconds a lease lasts without renewal; a killed worker's job is taken over after this
+LEASE_SECONDS = 300
+
+# Attempts per job, including the first
+MAX_ATTEMPTS = 3
+
+# Backoff before a failed job is retried
+RETRY_BASE_SECONDS = 30
+RETRY_CAP_SECONDS = 600
+
+# Seconds an idle worker waits before checking the queue again
+POLL_SECONDS = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT,
+    location TEXT,
+    spec TEXT,
+    status TEXT,
+    attempts INTEGER DEFAULT 0,
+    not_before REAL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    enqueued REAL,
+    finished REAL,
+    UNIQUE (kind, location)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+"""
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+def queue_path(cache_dir):
+    return os.path.join(cache_dir, QUEUE_NAME)
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def source_jobs(sources):
+    """Turn a sources dict (as in sources.json) into (kind, location, spec) jobs."""
+    from crawler import crawl_options
+    from feeds import feed_options
+    jobs = [("pdf", path, None) for path in sources.get("pdfs", [])]
+    jobs += [("url", url, None) for url in sources.get("urls", [])]
+    jobs += [("crawl", crawl_options(spec)["start_url"], spec) for spec in sources.get("crawl", [])]
+    jobs += [("feed", feed_options(spec)["url"], spec) for spec in sources.get("feeds", [])]
+    return jobs
+
+class IngestQueue:
+    """Leased ingestion jobs stored in SQLite, shared by every worker that can open the file."""
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Autocommit, so lease() can take the write lock with BEGIN IMMEDIATE before it reads
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def enqueue(self, jobs):
+        """Queue (kind, location, spec) jobs. Jobs already queued are reset to pending unless a worker holds them."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for kind, location, spec in jobs:
+                conn.execute(
+                    "INSERT INTO jobs (kind, location, spec, status, enqueued) VALUES (?, ?, ?, 'pending', ?) "
+                    "ON CONFLICT (kind, location) DO UPDATE SET spec = excluded.spec, status = 'pending', "
+                    "attempts = 0, not_before = 0, error = NULL, enqueued = excluded.enqueued "
+                    "WHERE status != 'leased'",
+                    (kind, location, json.dumps(spec), now),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return len(jobs)
+
+    def lease(self, owner):
+        """Lease the oldest job that is due, or one whose lease ran out. Returns the job as a dict, or None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # A job whose last attempt's lease ran out has used up its attempts
+            conn.execute("UPDATE jobs SET status = 'failed', finished = ?, "
+                         "error = 'lease expired on the last attempt (worker killed or stuck)' "
+                         "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, now, self.max_attempts))
+            row = conn.execute("SELECT * FROM jobs WHERE (status = 'pending' AND not_before <= ?) "
+                               "OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                               (now, now)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                             "attempts = attempts + 1 WHERE id = ?", (owner, now + self.lease_seconds, row["id"]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["reclaimed_from"] = job["lease_owner"] if job["status"] == "leased" else None
+        job["attempts"] += 1
+        job["spec"] = json.loads(job["spec"]) if job["spec"] else None
+        return job
+
+    def _update_leased(self, job_id, owner, assignments, params):
+        """Update a job only while owner still holds its lease. Returns True if it did."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                                  (*params, job_id, owner))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def renew(self, job_id, owner):
+        return self._update_leased(job_id, owner, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, job_id, owner, result):
+        return self._update_leased(job_id, owner, "status = 'done', result = ?, error = NULL, finished = ?",
+                                   (json.dumps(result), time.time()))
+
+    def fail(self, job_id, owner, attempts, error):
+        """Schedule a retry with backoff, or mark the job failed once its attempts are used up."""
+        if attempts >= self.max_attempts:
+            return self._update_leased(job_id, owner, "status = 'failed', error = ?, finished = ?",
+                                       (str(error), time.time()))
+        delay = backoff_delay(attempts, RETRY_BASE_SECONDS, RETRY_CAP_SECONDS)
+        return self._update_leased(job_id, owner, "status = 'pending', error = ?, not_before = ?",
+                                   (str(error), time.time() + delay))
+
+    def release(self, job_id, owner):
+        """Hand a job back without counting the attempt, e.g. when the worker is stopped."""
+        return self._update_leased(job_id, owner, "status = 'pending', attempts = attempts - 1", ())
+
+    def retry_failed(self):
+        """Queue every failed job again. Returns how many there were."""
+        conn = self._connect()
+        try:
+            return conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0 "
+                                "WHERE status = 'failed'").rowcount
+        finally:
+            conn.close()
+
+    def counts(self):
+        """Return {status: number of jobs}."""
+        conn = self._connect()
+        try:
+            counts = dict.fromkeys(STATUSES, 0)
+            counts.update(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            return counts
+        finally:
+            conn.close()
+
+    def failures(self, limit=20):
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT kind, location, attempts, error FROM jobs WHERE status = 'failed' ORDER BY finished DESC LIMIT ?",
+                (limit,))]
+        finally:
+            conn.close()
+
+def _keep_lease(queue, job, owner, stop):
+    """Renew a job's lease until stop is set, at a third of the lease time."""
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(job["id"], owner):
+            print(f"⚠️ Lost the lease on {job['location']}; another worker has taken it over")
+            return
+
+def run_job(pipeline, job):
+    """Extract and split one job's source into the cache. Returns its result, or raises if it produced no text."""
+    start = time.perf_counter()
+    source = job["spec"] if job["kind"] in ("crawl", "feed") else job["location"]
+    if not pipeline.ingest(job["kind"], source):
+        raise RuntimeError("no text extracted")
+    return {"seconds": round(time.perf_counter() - start, 3)}
+
+def work(queue, pipeline, owner=None, exit_when_idle=False, poll=POLL_SECONDS, stop=None):
+    """Lease and run jobs until stop is set or, with exit_when_idle, until no job is pending or leased.
+
+    Returns the number of jobs this worker completed.
+    """
+    owner = owner or worker_id()
+    stop = stop or threading.Event()
+    done = 0
+    while not stop.is_set():
+        job = queue.lease(owner)
+        if job is None:
+            counts = queue.counts()
+            if exit_when_idle and not counts["pending"] and not counts["leased"]:
+                break
+            stop.wait(poll)
+            continue
+        if job["reclaimed_from"]:
+            print(f"♻️ Taking over {job['location']} from {job['reclaimed_from']}, whose lease ran out")
+        print(f"🔧 [{owner}] {job['kind']} {job['location']} (attempt {job['attempts']}/{queue.max_attempts})")
+        renewing = threading.Event()
+        threading.Thread(target=_keep_lease, args=(queue, job, owner, renewing), daemon=True).start()
+        try:
+            result = run_job(pipeline, job)
+        except KeyboardInterrupt:
+            queue.release(job["id"], owner)
+            raise
+        except Exception as e:
+            if queue.fail(job["id"], owner, job["attempts"], e):
+                retry = job["attempts"] < queue.max_attempts
+                print(f"❌ {job['location']}: {e}{' (will retry)' if retry else ''}")
+            continue
+        finally:
+            renewing.set()
+        if queue.complete(job["id"], owner, result):
+            done += 1
+            print(f"✅ {job['location']} ingested in {result['seconds']}s")
+        else:
+            print(f"⏭️ {job['location']}: the lease was taken over by another worker, which will record the outcome")
+    return done
+
+def _work_process(cache_dir, pipeline_options, queue_options, exit_when_idle):
+    from pipeline import Pipeline
+    queue = IngestQueue(queue_path(cache_dir), **queue_options)
+    pipeline = Pipeline(cache_dir=cache_dir, log=lambda level, message: None, journal_mode="delete", **pipeline_options)
+    try:
+        done = work(queue, pipeline, exit_when_idle=exit_when_idle)
+        print(f"👋 Worker {worker_id()} finished {done} jobs")
+    except KeyboardInterrupt:
+        print(f"👋 Worker {worker_id()} stopped")
+
+def print_status(queue):
+    counts = queue.counts()
+    print("📋 " + ", ".join(f"{counts[status]} {status}" for status in STATUSES))
+    for failure in queue.failures():
+        print(f"❌ {failure['kind']} {failure['location']} after {failure['attempts']} attempts: {failure['error']}")
+
+def main():
+    import argparse
+    from pdf_backends import BACKEND_CHOICES
+    from pipeline import CACHE_DIR
+    parser = argparse.ArgumentParser(description="Ingest sources with workers sharing a queue in the cache.")
+    parser.add_argument("command", choices=["enqueue", "work", "status", "retry"])
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Shared cache directory holding the queue")
+    parser.add_argument("--sources", default="sources.json", help="With enqueue, the sources file to queue")
+    parser.add_argument("--processes", type=int, default=1, help="With work, worker processes to start on this host")
+    parser.add_argument("--exit-when-idle", action="store_true", help="With work, exit once no job is pending or leased")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help="Seconds before a silent worker's job is taken over")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Attempts per job before it is marked failed")
+    parser.add_argument("--bounded", action="store_true", help="Spill text and chunks to disk, as main.py --bounded")
+    parser.add_argument("--pdf-backend", choices=BACKEND_CHOICES, default="auto", help="PDF text extractor")
+    args = parser.parse_args()
+    queue_options = {"lease_seconds": args.lease_seconds, "max_attempts": args.max_attempts}
+    queue = IngestQueue(queue_path(args.cache_dir), **queue_options)
+
+    if args.command == "enqueue":
+        from main import load_sources_from_config
+        count = queue.enqueue(source_jobs(load_sources_from_config(args.sources)))
+        print(f"✅ Queued {count} sources in {queue.path}")
+        print_status(queue)
+        return
+    if args.command == "status":
+        print_status(queue)
+        return
+    if args.command == "retry":
+        print(f"♻️ Queued {queue.retry_failed()} failed jobs again")
+        return
+
+    pipeline_options = {"bounded": args.bounded, "pdf_backend": args.pdf_backend}
+    if args.processes <= 1:
+        _work_process(args.cache_dir, pipeline_options, queue_options, args.exit_when_idle)
+        return
+    import multiprocessing
+    processes = [multiprocessing.Process(target=_work_process,
+                                         args=(args.cache_dir, pipeline_options, queue_options, args.exit_when_idle))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Each worker gets the interrupt too, and hands its job back before it exits
+        for process in processes:
+            process.join()
+    print_status(queue)
+
+if __name__ == "__main__":
+    main()